@@ -72,6 +72,10 @@ with col2:
         ["none", "vegetarian", "vegan", "keto", "paleo", "gluten-free", "dairy-free"]
     )
 
+# Search mode - best overall match, or recipes you can make from the ingredients above
+search_mode = st.radio("Search Mode", ["Best match", "Cook with what I have"], horizontal=True)
+pantry_search = search_mode == "Cook with what I have"
+
 # Hardcoded API endpoint
 api_endpoint = "https://59z9wfy750.execute-api.us-west-2.amazonaws.com/dev/recommender"
 
@@ -114,6 +118,10 @@ def prepare_request_data():
         }
     }
     
+    # Only sent for pantry searches, so best-match requests are unchanged
+    if pantry_search:
+        request_data["request"]["search_mode"] = "pantry"
+    
     return request_data
 
 # Display the current request JSON
@@ -138,6 +146,129 @@ def parse_list_string(list_string):
         st.error(f"Error parsing list: {str(e)}")
         return []
 
+# Parse the Lambda response body, which API Gateway may pass through as a JSON string
+def parse_response_body(response):
+    response_data = response.json()['body']
+    # Check if response_data is a string and parse it
+    if isinstance(response_data, str):
+        response_data = json.loads(response_data)
+    return response_data
+
+# API Gateway passes the Lambda's whole response through with HTTP 200, so an
+# error (an expired cursor, say) only shows in the statusCode it carries
+def lambda_status(response):
+    if response.status_code != 200:
+        return response.status_code
+    payload = response.json()
+    return payload.get('statusCode', 200) if isinstance(payload, dict) else 200
+
+# Handle different possible response formats
+def extract_recipes(response_data):
+    if isinstance(response_data, dict) and "recipes" in response_data:
+        return response_data["recipes"]
+    elif isinstance(response_data, list):
+        return response_data
+    else:
+        return [response_data]
+
+# Render one recipe card
+def display_recipe(i, recipe):
+    with st.container():
+        # Get recipe metadata
+        metadata = recipe.get('metadata', {})
+        recipe_name = metadata.get('recipe_name', f"Recipe {recipe.get('id', i+1)}")
+
+        st.markdown(f"### {i+1}. {recipe_name}")
+
+        # Create columns for recipe details
+        col1, col2, col3 = st.columns([2, 1, 1])
+
+        with col1:
+            # Description
+            if "description" in metadata:
+                st.markdown(f"*{metadata['description']}*")
+
+            # Instructions
+            if "instructions" in metadata:
+                st.subheader("Instructions")
+                try:
+                    # Try to parse the string as a Python list
+                    instructions = ast.literal_eval(metadata["instructions"]) if isinstance(metadata["instructions"], str) else metadata["instructions"]
+
+                    if isinstance(instructions, list):
+                        for j, step in enumerate(instructions):
+                            st.markdown(f"{j+1}. {step}")
+                    else:
+                        st.write(instructions)
+                except (ValueError, SyntaxError) as e:
+                    st.error(f"Could not parse instructions: {str(e)}")
+                    st.write(metadata["instructions"])
+
+        with col2:
+            # Ingredients
+            st.subheader("Ingredients")
+
+            try:
+                # Get ingredients and amounts
+                ingredients_list = parse_list_string(metadata.get("ingredients", "[]"))
+                amounts_list = parse_list_string(metadata.get("amounts", "[]"))
+
+                # Display ingredients with amounts if available
+                if amounts_list:
+                    for j, amount in enumerate(amounts_list):
+                        # If we have a matching ingredient quantity, display it
+                        if j < len(ingredients_list):
+                            st.write(f"• {amount}: {ingredients_list[j] if ingredients_list else ''}")
+                        else:
+                            st.write(f"• {amount}")
+                elif ingredients_list:
+                    # If we only have ingredients without amounts
+                    for ingredient in ingredients_list:
+                        st.write(f"• {ingredient}")
+                else:
+                    st.write("No ingredients information available")
+
+            except Exception as e:
+                st.error(f"Error displaying ingredients: {str(e)}")
+
+        with col3:
+            # Recipe metrics
+            total_time = 0
+            try:
+                # Add prep time if available
+                if "prep_time" in metadata:
+                    prep_time = float(metadata["prep_time"])
+                    st.metric("Prep Time", f"{prep_time} hr" if prep_time >= 1 else f"{int(prep_time * 60)} min")
+                    total_time += prep_time
+
+                # Add cook time if available
+                if "cook_time" in metadata:
+                    if metadata["cook_time"] != "nan":
+                        cook_time = float(metadata["cook_time"])
+                        st.metric("Cook Time", f"{cook_time} hr" if cook_time >= 1 else f"{int(cook_time * 60)} min")
+                        total_time += cook_time
+
+                # Show total time
+                if total_time > 0:
+                    st.metric("Total Time", f"{total_time} hr" if total_time >= 1 else f"{int(total_time * 60)} min")
+
+                # Show units/servings
+                if "units" in metadata:
+                    st.metric("Servings", metadata["units"])
+
+                # Show match score
+                if "score" in recipe:
+                    st.metric("Ingredient Coverage" if "missing_ingredients" in recipe else "Match Score", f"{recipe['score']:.2f}")
+
+                # Pantry results say how many ingredients you still need
+                if "missing_ingredients" in recipe:
+                    st.metric("Missing Ingredients", recipe["missing_ingredients"])
+
+            except ValueError as e:
+                st.error(f"Error calculating times: {str(e)}")
+
+        st.divider()
+
 # API submission and response display
 if st.button("Find Recipes"):
     with st.spinner("Searching for recipes..."):
@@ -148,9 +279,13 @@ if st.button("Find Recipes"):
             # Check required fields
             if not username:
                 st.error("Please enter a username")
-            elif not ingredients_available:
-                st.error("Please enter at least one available ingredient")
             else:
+                if pantry_search and not ingredients_available:
+                    st.error("Please list the ingredients you have to cook with")
+                    st.stop()
+                if not ingredients_available:
+                    # Profile-only requests are served from the nightly precomputed lists
+                    st.info(f"No ingredients given: showing {meal_type.lower()} picks for your profile")
                 # For testing, you can use a sample response instead of making an actual API call
                 # Uncomment the real API call when ready
                 response = requests.get(
@@ -163,136 +298,57 @@ if st.button("Find Recipes"):
                 with st.expander("API Response Details", expanded=True):
                     st.write(f"Status Code: {response.status_code}")
                     
-                    if response.status_code == 200:
+                    try:
+                        status_code = lambda_status(response)
+                    except json.JSONDecodeError:
+                        status_code = None
+                    if status_code == 200:
                         try:
-                            response_data = response.json()['body']
-                            # Check if response_data is a string and parse it
-                            if isinstance(response_data, str):
-                                # Attempt to parse the string as JSON
-                                try:
-                                    response_data = json.loads(response_data)
-                                except json.JSONDecodeError:
-                                    st.error("Could not parse the API response as JSON")
-                                    st.text(response_data)
-                                    
-                            
+                            response_data = parse_response_body(response)
                             st.success("Recipes found successfully!")
                             
-                            # Display the recipes
-                            st.subheader("Recommended Recipes")
-                            
-                            # Handle different possible response formats
-                            if isinstance(response_data, dict) and "recipes" in response_data:
-                                recipes = response_data["recipes"]
-                            elif isinstance(response_data, list):
-                                recipes = response_data
-                            else:
-                                recipes = [response_data]
-
-                            
-                            # Display each recipe
-                            for i, recipe in enumerate(recipes):
-                                with st.container():
-                                    # Get recipe metadata
-                                    metadata = recipe.get('metadata', {})
-                                    recipe_name = metadata.get('recipe_name', f"Recipe {recipe.get('id', i+1)}")
-                                    
-                                    st.markdown(f"### {i+1}. {recipe_name}")
-                                    
-                                    # Create columns for recipe details
-                                    col1, col2, col3 = st.columns([2, 1, 1])
-                                    
-                                    with col1:
-                                        # Description
-                                        if "description" in metadata:
-                                            st.markdown(f"*{metadata['description']}*")
-                                        
-                                        # Instructions
-                                        if "instructions" in metadata:
-                                            st.subheader("Instructions")
-                                            try:
-                                                # Try to parse the string as a Python list
-                                                instructions = ast.literal_eval(metadata["instructions"]) if isinstance(metadata["instructions"], str) else metadata["instructions"]
-                                                
-                                                if isinstance(instructions, list):
-                                                    for j, step in enumerate(instructions):
-                                                        st.markdown(f"{j+1}. {step}")
-                                                else:
-                                                    st.write(instructions)
-                                            except (ValueError, SyntaxError) as e:
-                                                st.error(f"Could not parse instructions: {str(e)}")
-                                                st.write(metadata["instructions"])
-                                    
-                                    with col2:
-                                        # Ingredients
-                                        st.subheader("Ingredients")
-                                        
-                                        try:
-                                            # Get ingredients and amounts
-                                            ingredients_list = parse_list_string(metadata.get("ingredients", "[]"))
-                                            amounts_list = parse_list_string(metadata.get("amounts", "[]"))
-                                            
-                                            # Display ingredients with amounts if available
-                                            if amounts_list:
-                                                for j, amount in enumerate(amounts_list):
-                                                    # If we have a matching ingredient quantity, display it
-                                                    if j < len(ingredients_list):
-                                                        st.write(f"• {amount}: {ingredients_list[j] if ingredients_list else ''}")
-                                                    else:
-                                                        st.write(f"• {amount}")
-                                            elif ingredients_list:
-                                                # If we only have ingredients without amounts
-                                                for ingredient in ingredients_list:
-                                                    st.write(f"• {ingredient}")
-                                            else:
-                                                st.write("No ingredients information available")
-                                                
-                                        except Exception as e:
-                                            st.error(f"Error displaying ingredients: {str(e)}")
-                                    
-                                    with col3:
-                                        # Recipe metrics
-                                        total_time = 0
-                                        try:
-                                            # Add prep time if available
-                                            if "prep_time" in metadata:
-                                                prep_time = float(metadata["prep_time"])
-                                                st.metric("Prep Time", f"{prep_time} hr" if prep_time >= 1 else f"{int(prep_time * 60)} min")
-                                                total_time += prep_time
-                                            
-                                            # Add cook time if available
-                                            if "cook_time" in metadata:
-                                                if metadata["cook_time"] != "nan":
-                                                    cook_time = float(metadata["cook_time"])
-                                                    st.metric("Cook Time", f"{cook_time} hr" if cook_time >= 1 else f"{int(cook_time * 60)} min")
-                                                    total_time += cook_time
-                                            
-                                            # Show total time
-                                            if total_time > 0:
-                                                st.metric("Total Time", f"{total_time} hr" if total_time >= 1 else f"{int(total_time * 60)} min")
-                                            
-                                            # Show units/servings
-                                            if "units" in metadata:
-                                                st.metric("Servings", metadata["units"])
-                                                
-                                            # Show match score
-                                            if "score" in recipe:
-                                                st.metric("Match Score", f"{recipe['score']:.2f}")
-                                                
-                                        except ValueError as e:
-                                            st.error(f"Error calculating times: {str(e)}")
-                                    
-                                    st.divider()
+                            # Kept in the session so "Load more" can append to it across reruns
+                            st.session_state.recipes = extract_recipes(response_data)
+                            st.session_state.cursor = response_data.get("cursor") if isinstance(response_data, dict) else None
                             
                         except json.JSONDecodeError:
                             st.error("Could not parse the API response as JSON")
                             st.text(response.text)
                     else:
-                        st.error(f"Error: Received status code {response.status_code}")
+                        st.error(f"Error: Received status code {status_code or response.status_code}")
                         st.text(response.text)
         except requests.RequestException as e:
             st.error(f"Request failed: {str(e)}")
 
+if st.session_state.get("recipes"):
+    # Display the recipes
+    st.subheader("Recommended Recipes")
+    for i, recipe in enumerate(st.session_state.recipes):
+        display_recipe(i, recipe)
+    
+    # Further pages come from the list the first request cached, so they are quick
+    if st.session_state.get("cursor") and st.button("Load more"):
+        try:
+            response = requests.get(
+                api_endpoint,
+                json={"cursor": st.session_state.cursor},
+                headers={"Content-Type": "application/json"}
+            )
+            status_code = lambda_status(response)
+            response_data = parse_response_body(response) if response.status_code == 200 else None
+            if status_code == 410:
+                st.session_state.cursor = None
+                st.warning("These results have expired. Click \"Find Recipes\" to search again.")
+            elif status_code == 200 and not (isinstance(response_data, dict) and "error" in response_data):
+                st.session_state.recipes = st.session_state.recipes + extract_recipes(response_data)
+                st.session_state.cursor = response_data.get("cursor") if isinstance(response_data, dict) else None
+                st.rerun()
+            else:
+                st.error(f"Error: Received status code {status_code}")
+                st.text(response.text)
+        except (requests.RequestException, json.JSONDecodeError) as e:
+            st.error(f"Request failed: {str(e)}")
+
 # Add a footer with additional information
 st.markdown("---")
 st.markdown("Made with Streamlit ❤️")
\ No newline at end of file
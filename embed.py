@@ -3,7 +3,6 @@
 !pip install -q sentence-transformers pinecone
 
 # Import necessary libraries
-from sentence_transformers import SentenceTransformer  # For generating embeddings
 import numpy as np
 from pinecone import Pinecone, ServerlessSpec         # For vector database indexing
 import pandas as pd
@@ -11,49 +10,48 @@ import sagemaker
 from sagemaker.huggingface import HuggingFaceModel    # For deploying HuggingFace models on SageMaker
 import boto3                                           # AWS SDK for Python to access S3
 import io                                              # For handling byte streams
+import time
+import json
+from datetime import datetime, timezone
+from pipeline_steps.neighbour_table import BuildNeighbourTable, PublishNeighbourTable  # "More like this" table
+from pipeline_steps.constraint_columns import EncodeConstraintColumns, PublishConstraintColumns  # Typed time/meal/macro columns
+from constraints import metadata_fields  # get_recipes' module, on the path once constraint_columns is imported
+from pipeline_steps.embed_shards import EmbedShards, LoadManifest, LoadShardFrame, MergeShardEmbeddings, ShardsForRows  # Sharded, resumable embedding
 
 def embed_and_upsert(model_name):
-    # Initialize S3 client and define the S3 bucket and file path
-    s3 = boto3.client('s3')
-    bucket = 'cs401r-mlops-final'
-    key = 'preprocessed-data/preprocessed_data.csv'
+    # Preprocessing's row-range shards, listed in its manifest; shards that parallel
+    # workers (pipeline_steps/embed_shards.py) already embedded are reused, the rest are embedded here
+    manifest = LoadManifest(SHARD_MANIFEST_URI)
+    print(f"Shard manifest: {len(manifest['shards'])} shards, {manifest['rows']} rows")
+    EmbedShards(SHARD_MANIFEST_URI, ShardsForRows(manifest, ROW_LIMIT), model_name)
+    all_embeddings = MergeShardEmbeddings(SHARD_MANIFEST_URI, model_name, max_rows=ROW_LIMIT)
 
-    # Load preprocessed recipe data from S3 into a Pandas DataFrame
-    obj = s3.get_object(Bucket=bucket, Key=key)
-    df = pd.read_csv(io.BytesIO(obj['Body'].read()))
+    # The rows the merged embeddings line up with
+    df = LoadShardFrame(SHARD_MANIFEST_URI, ROW_LIMIT)
     print(f"Columns available: {df.columns.tolist()}")
 
     # Ensure required columns exist in the dataset
     if 'RecipeId' not in df.columns or 'EmbeddingSentence' not in df.columns:
         raise ValueError("Required columns 'RecipeId' or 'EmbeddingSentence' not found")
 
-    # Limit data to 1,000 entries for testing/demo purposes
-    recipe_ids = df['RecipeId'].tolist()[:1000]
-    texts_to_embed = df['EmbeddingSentence'].astype(str).tolist()[:1000]
-    recipe_name = df['Name'].tolist()[:1000]
-    cook_time = df['CookTime'].tolist()[:1000]
-    prep_time = df['PrepTime'].tolist()[:1000]
-    description = df['Description'].tolist()[:1000]
-    ingredients = df['RecipeIngredientQuantities'].tolist()[:1000]
-    amounts = df["RecipeIngredientParts"].tolist()[:1000]
-    units = df['RecipeServings'].tolist()[:1000]
-    instructions = df['RecipeInstructions'].tolist()[:1000]
+    # Already limited to ROW_LIMIT rows; the slices keep the lists aligned
+    recipe_ids = df['RecipeId'].tolist()[:ROW_LIMIT]
+    texts_to_embed = df['EmbeddingSentence'].astype(str).tolist()[:ROW_LIMIT]
+    recipe_name = df['Name'].tolist()[:ROW_LIMIT]
+    cook_time = df['CookTime'].tolist()[:ROW_LIMIT]
+    prep_time = df['PrepTime'].tolist()[:ROW_LIMIT]
+    description = df['Description'].tolist()[:ROW_LIMIT]
+    ingredients = df['RecipeIngredientQuantities'].tolist()[:ROW_LIMIT]
+    amounts = df["RecipeIngredientParts"].tolist()[:ROW_LIMIT]
+    units = df['RecipeServings'].tolist()[:ROW_LIMIT]
+    instructions = df['RecipeInstructions'].tolist()[:ROW_LIMIT]
+    ratings = df['AverageRating'].tolist()[:ROW_LIMIT]
+    constraint_columns = EncodeConstraintColumns(df.iloc[:ROW_LIMIT])
 
     # Create a dictionary mapping recipe IDs to their embedding text
     recipe_dict = dict(zip(recipe_ids, texts_to_embed))
     print(f"Found {len(texts_to_embed)} recipes to embed")
 
-    # Load the sentence transformer model
-    model = SentenceTransformer(model_name)
-
-    # Generate embeddings in batches
-    batch_size = 32
-    all_embeddings = []
-    for i in range(0, len(texts_to_embed), batch_size):
-        batch_texts = texts_to_embed[i:i + batch_size]
-        batch_embeddings = model.encode(batch_texts, show_progress_bar=True)
-        all_embeddings.extend(batch_embeddings)
-
     # Convert NumPy arrays to lists for Pinecone compatibility
     embeddings_list = [embedding.tolist() for embedding in all_embeddings]
     print(f"Generated {len(embeddings_list)} embeddings of dimension {len(embeddings_list[0])}")
@@ -62,21 +60,13 @@ def embed_and_upsert(model_name):
     pc_api_key = "NOT TELLING YOU"
     pc = Pinecone(api_key=pc_api_key)
 
-    INDEX_NAME = "recipe-recommendations"
     DIMENSION = len(embeddings_list[0])  # Embedding dimensionality
 
-    # Create index if it doesn't already exist
-    existing_indexes = [index.name for index in pc.list_indexes()]
-    if INDEX_NAME not in existing_indexes:
-        pc.create_index(
-            name=INDEX_NAME,
-            dimension=DIMENSION,
-            metric="cosine",
-            spec=ServerlessSpec(cloud="aws", region="us-east-1")
-        )
-        print(f"Created new index: {INDEX_NAME}")
-    else:
-        print(f"Using existing index: {INDEX_NAME}")
+    # Each rebuild writes to a fresh namespace; live traffic keeps reading the active one
+    version = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    INDEX_NAME = index_name_for_dimension(pc, DIMENSION)
+    namespace = version
+    print(f"Building index version {version} in {INDEX_NAME}/{namespace}")
 
     # Connect to the index
     index = pc.Index(INDEX_NAME)
@@ -97,6 +87,8 @@ def embed_and_upsert(model_name):
                 "cook_time": str(cook_time[i]),
                 "prep_time": str(prep_time[i]),
                 "description": str(description[i]),
+                # Typed fields that get_recipes filters on
+                **metadata_fields(constraint_columns, i),
             }
         })
 
@@ -104,10 +96,222 @@ def embed_and_upsert(model_name):
     batch_size = 100
     for i in range(0, len(vectors_to_upsert), batch_size):
         batch = vectors_to_upsert[i:i + batch_size]
-        index.upsert(vectors=batch)
+        index.upsert(vectors=batch, namespace=namespace)
         print(f"Upserted batch {i // batch_size + 1}/{(len(vectors_to_upsert) - 1) // batch_size + 1}")
 
     print(f"Successfully uploaded {len(vectors_to_upsert)} vectors to Pinecone")
 
+    # Only a version that passes validation is ever made active
+    validate_index_version(index, namespace, vectors_to_upsert)
+
+    # Catalog vectors and neighbour table for this version, in place before it goes live
+    catalog_embeddings = np.array(all_embeddings, dtype=np.float32)
+    publish_catalog(version, vectors_to_upsert, catalog_embeddings, ratings)
+    publish_neighbour_table(version, catalog_embeddings)
+    PublishConstraintColumns(f's3://{BUCKET}/{CATALOG_PREFIX}/{version}', constraint_columns)
+    publish_ingredient_index(version, recipe_ids)
+
+    activate_index_version(version, INDEX_NAME, namespace, model_name, len(vectors_to_upsert))
+
+    # Publish the top-rated recipes as the get_recipes fallback for low time budgets
+    publish_popular_recipes(vectors_to_upsert, ratings)
+
+    # Reference window for the query-drift monitor
+    publish_reference_embeddings(catalog_embeddings)
+
+    # Drop namespaces of versions that no longer receive traffic
+    garbage_collect_index_versions(pc)
+
+def publish_popular_recipes(vectors, ratings, n=100):
+    # Same shape as a Pinecone match so get_recipes can filter and return them as-is
+    # Unrated recipes have a NaN AverageRating, which neither sorts nor serialises
+    rated = [(vector, rating) for vector, rating in zip(vectors, ratings) if pd.notna(rating)]
+    ranked = sorted(rated, key=lambda pair: pair[1], reverse=True)[:n]
+    popular = [
+        {"id": vector["id"], "score": float(rating), "metadata": vector["metadata"]}
+        for vector, rating in ranked
+    ]
+
+    s3 = boto3.client('s3')
+    s3.put_object(
+        Bucket=BUCKET,
+        Key='popular-recipes/popular_recipes.json',
+        Body=json.dumps(popular),
+        ContentType='application/json'
+    )
+    print(f"Published {len(popular)} popular recipes")
+
+def _put_array(s3, key, array):
+    buffer = io.BytesIO()
+    np.save(buffer, array)
+    s3.put_object(Bucket=BUCKET, Key=key, Body=buffer.getvalue())
+
+def publish_catalog(version, vectors, embeddings, ratings):
+    # Row i of embeddings.npy is recipes.json[i]; get_recipes serves lookups from these
+    s3 = boto3.client('s3')
+    recipes = [{"id": vector["id"], "metadata": vector["metadata"]} for vector in vectors]
+    s3.put_object(
+        Bucket=BUCKET,
+        Key=f'{CATALOG_PREFIX}/{version}/recipes.json',
+        Body=json.dumps(recipes),
+        ContentType='application/json'
+    )
+    _put_array(s3, f'{CATALOG_PREFIX}/{version}/embeddings.npy', embeddings)
+    # Rerank feature column, row-aligned like the rest
+    _put_array(s3, f'{CATALOG_PREFIX}/{version}/feature_rating.npy', np.nan_to_num(np.asarray(ratings, dtype=np.float32)))
+    print(f"Published catalog for version {version} ({len(recipes)} recipes)")
+
+def _get_array(s3, key):
+    return np.load(io.BytesIO(s3.get_object(Bucket=BUCKET, Key=key)['Body'].read()))
+
+def publish_ingredient_index(version, recipe_ids):
+    # Preprocessing built the CSR over every recipe; the catalog keeps the rows it embedded
+    s3 = boto3.client('s3')
+    indptr = _get_array(s3, f'{INGREDIENTS_PREFIX}/indptr.npy')
+    indices = _get_array(s3, f'{INGREDIENTS_PREFIX}/indices.npy')
+    csr_recipe_ids = _get_array(s3, f'{INGREDIENTS_PREFIX}/recipe_ids.npy')
+    rows = len(recipe_ids)
+    if not np.array_equal(csr_recipe_ids[:rows], np.asarray(recipe_ids, dtype=np.int64)):
+        raise ValueError("Ingredient CSR rows don't line up with the preprocessed data; rerun preprocessing")
+
+    indptr = indptr[:rows + 1]
+    _put_array(s3, f'{CATALOG_PREFIX}/{version}/ingredient_indptr.npy', indptr)
+    _put_array(s3, f'{CATALOG_PREFIX}/{version}/ingredient_indices.npy', indices[:indptr[-1]])
+    s3.copy_object(
+        Bucket=BUCKET,
+        Key=f'{CATALOG_PREFIX}/{version}/ingredient_vocabulary.json',
+        CopySource={'Bucket': BUCKET, 'Key': f'{INGREDIENTS_PREFIX}/vocabulary.json'}
+    )
+    print(f"Published ingredient index for version {version} ({int(indptr[-1])} recipe-ingredient pairs)")
+
+def publish_neighbour_table(version, embeddings, k=50):
+    neighbours, scores = BuildNeighbourTable(embeddings, k=k)
+    PublishNeighbourTable(f's3://{BUCKET}/{CATALOG_PREFIX}/{version}', neighbours, scores)
+
+def publish_reference_embeddings(embeddings, n=2000, seed=0):
+    # A uniform sample keeps the file small; the monitor only compares distributions
+    rng = np.random.default_rng(seed)
+    if len(embeddings) > n:
+        embeddings = embeddings[rng.choice(len(embeddings), size=n, replace=False)]
+
+    _put_array(boto3.client('s3'), 'monitoring/reference/catalog_embeddings.npy', embeddings)
+    print(f"Published {len(embeddings)} reference embeddings")
+
+BUCKET = 'cs401r-mlops-final'
+BASE_INDEX_NAME = "recipe-recommendations"
+ACTIVE_POINTER_KEY = 'index-metadata/active_index.json'
+VERSION_REGISTRY_KEY = 'index-metadata/versions.json'
+CATALOG_PREFIX = 'catalog'
+INGREDIENTS_PREFIX = 'preprocessed-data/ingredients'
+SHARD_MANIFEST_URI = f's3://{BUCKET}/preprocessed-data/shards/manifest.json'
+
+# Rows embedded and indexed, for testing/demo purposes
+ROW_LIMIT = 1000
+
+# get_recipes caches the pointer for INDEX_VERSION_TTL_SECONDS, so superseded
+# versions keep serving for a while after a flip
+DRAIN_SECONDS = 15 * 60
+KEEP_PREVIOUS_VERSIONS = 1
+
+def index_name_for_dimension(pc, dimension):
+    # Versions share an index when dimensions match; a new dimension needs its own index
+    existing = {index.name for index in pc.list_indexes()}
+    if BASE_INDEX_NAME in existing and pc.describe_index(BASE_INDEX_NAME).dimension == dimension:
+        print(f"Using existing index: {BASE_INDEX_NAME}")
+        return BASE_INDEX_NAME
+
+    index_name = BASE_INDEX_NAME if BASE_INDEX_NAME not in existing else f"{BASE_INDEX_NAME}-{dimension}"
+    if index_name not in existing:
+        pc.create_index(
+            name=index_name,
+            dimension=dimension,
+            metric="cosine",
+            spec=ServerlessSpec(cloud="aws", region="us-east-1")
+        )
+        print(f"Created new index: {index_name}")
+    else:
+        print(f"Using existing index: {index_name}")
+    return index_name
+
+def validate_index_version(index, namespace, vectors, canary_size=50, top_k=5, min_recall=0.95, retries=30):
+    # Serverless indexes are eventually consistent, so wait for the full count to show up
+    expected = len(vectors)
+    count = 0
+    for _ in range(retries):
+        stats = index.describe_index_stats()
+        namespaces = stats.namespaces or {}
+        count = namespaces[namespace].vector_count if namespace in namespaces else 0
+        if count >= expected:
+            break
+        time.sleep(10)
+    if count != expected:
+        raise ValueError(f"Namespace {namespace} has {count} vectors, expected {expected}")
+
+    # Canary queries: each sampled recipe must retrieve itself
+    step = max(1, expected // canary_size)
+    canaries = vectors[::step][:canary_size]
+    hits = 0
+    for vector in canaries:
+        response = index.query(vector=vector["values"], top_k=top_k, namespace=namespace)
+        hits += any(match.id == vector["id"] for match in response.matches)
+    recall = hits / len(canaries)
+    print(f"Canary recall@{top_k}: {recall:.3f} over {len(canaries)} queries")
+    if recall < min_recall:
+        raise ValueError(f"Canary recall {recall:.3f} below {min_recall}")
+
+def _read_json(s3, key, default):
+    try:
+        return json.loads(s3.get_object(Bucket=BUCKET, Key=key)['Body'].read())
+    except s3.exceptions.NoSuchKey:
+        return default
+
+def activate_index_version(version, index_name, namespace, model_name, vector_count):
+    # The single-object put is the atomic switch-over; get_recipes reads only this pointer
+    s3 = boto3.client('s3')
+    now = datetime.now(timezone.utc).isoformat()
+    pointer = {
+        "version": version,
+        "index_name": index_name,
+        "namespace": namespace,
+        "model_name": model_name,
+        "vector_count": vector_count,
+        # Vectors carry typed constraint metadata, so get_recipes may filter on it
+        "constraint_columns": True,
+        "activated_at": now
+    }
+    s3.put_object(
+        Bucket=BUCKET,
+        Key=ACTIVE_POINTER_KEY,
+        Body=json.dumps(pointer),
+        ContentType='application/json'
+    )
+    print(f"Activated index version {version}")
+
+    # Bookkeeping for garbage collection
+    registry = _read_json(s3, VERSION_REGISTRY_KEY, [])
+    for entry in registry:
+        if entry["status"] == "active":
+            entry["status"] = "draining"
+            entry["superseded_at"] = now
+    registry.append({**pointer, "status": "active"})
+    s3.put_object(Bucket=BUCKET, Key=VERSION_REGISTRY_KEY, Body=json.dumps(registry), ContentType='application/json')
+
+def garbage_collect_index_versions(pc):
+    s3 = boto3.client('s3')
+    registry = _read_json(s3, VERSION_REGISTRY_KEY, [])
+    now = datetime.now(timezone.utc)
+
+    # Keep the newest drained versions around for rollback
+    draining = sorted((e for e in registry if e["status"] == "draining"), key=lambda e: e["superseded_at"], reverse=True)
+    for entry in draining[KEEP_PREVIOUS_VERSIONS:]:
+        superseded_at = datetime.fromisoformat(entry["superseded_at"])
+        if (now - superseded_at).total_seconds() < DRAIN_SECONDS:
+            continue
+        pc.Index(entry["index_name"]).delete(delete_all=True, namespace=entry["namespace"])
+        entry["status"] = "deleted"
+        print(f"Deleted index version {entry['version']} ({entry['index_name']}/{entry['namespace']})")
+
+    s3.put_object(Bucket=BUCKET, Key=VERSION_REGISTRY_KEY, Body=json.dumps(registry), ContentType='application/json')
+
 # Run the full embedding + upsert pipeline using the specified SentenceTransformer model
 embed_and_upsert('all-MiniLM-L6-v2')
@@ -1,8 +1,11 @@
+import hashlib
 import json
 import re
+from datetime import datetime, timezone
 
 import isodate
 import boto3
+import numpy as np
 import pandas as pd
 import io
 import os
@@ -14,6 +17,10 @@ OUTPUT_PREFIX = "preprocessed-data/"
 RECIPES_FILE = "recipes.csv"
 REVIEWS_FILE = "reviews.csv"
 OUTPUT_FILE = "preprocessed_data.csv"
+INGREDIENTS_PREFIX = "preprocessed-data/ingredients/"
+SHARDS_PREFIX = "preprocessed-data/shards/"
+MANIFEST_FILE = "manifest.json"
+DEFAULT_OUTPUT_SHARDS = 8
 
 # Function to convert R vectors like c("item1", "item2") to Python lists
 def convert_r_vector(value):
@@ -50,12 +57,91 @@ def create_embedding_sentences(df):
     df['EmbeddingSentence'] = sentences
     return df
 
+# Function to normalize an ingredient name; get_recipes/ingredients.py must normalize the same way
+def normalize_ingredient(name):
+    return " ".join(str(name).lower().split())
+
+def build_ingredient_csr(parts):
+    """
+    Builds the ingredient dictionary and each recipe's ingredients as a CSR layout:
+    row i's sorted, de-duplicated ingredient ids are indices[indptr[i]:indptr[i + 1]]
+    """
+    # A single-ingredient recipe isn't an R vector, so it stays a plain string
+    parts = parts.apply(lambda value: value if isinstance(value, list) else [value] if isinstance(value, str) else [])
+    exploded = parts.explode().dropna().map(normalize_ingredient)
+    exploded = exploded[exploded != ""]
+
+    # factorize(sort=True) numbers the vocabulary alphabetically
+    codes, vocabulary = pd.factorize(exploded, sort=True)
+    rows = parts.index.get_indexer(exploded.index)
+    pairs = pd.DataFrame({'row': rows, 'id': codes}).drop_duplicates().sort_values(['row', 'id'])
+
+    indptr = np.zeros(len(parts) + 1, dtype=np.uint32)
+    np.cumsum(np.bincount(pairs['row'].to_numpy(), minlength=len(parts)), out=indptr[1:])
+    indices = pairs['id'].to_numpy().astype(np.uint32)
+    return list(vocabulary), indptr, indices
+
+def write_ingredient_csr(s3_client, vocabulary, indptr, indices, recipe_ids):
+    # Rows line up with preprocessed_data.csv; recipe_ids lets readers check that
+    for name, array in (("indptr", indptr), ("indices", indices), ("recipe_ids", np.asarray(recipe_ids, dtype=np.int64))):
+        buffer = io.BytesIO()
+        np.save(buffer, array)
+        s3_client.put_object(Bucket=S3_BUCKET_NAME, Key=f"{INGREDIENTS_PREFIX}{name}.npy", Body=buffer.getvalue())
+    s3_client.put_object(
+        Bucket=S3_BUCKET_NAME,
+        Key=f"{INGREDIENTS_PREFIX}vocabulary.json",
+        Body=json.dumps(vocabulary),
+        ContentType='application/json'
+    )
+
+def build_shards(df, num_shards):
+    """
+    Splits the processed data into num_shards contiguous row ranges, as CSV bytes
+    plus the manifest entry describing each one
+
+    There are never more shards than rows, so no shard is empty unless df is
+    """
+    num_shards = max(1, min(num_shards, len(df)))
+    bounds = np.linspace(0, len(df), num_shards + 1).astype(int)
+    shards = []
+    for shard_id, (start, stop) in enumerate(zip(bounds[:-1], bounds[1:])):
+        body = df.iloc[start:stop].to_csv(index=False).encode('utf-8')
+        sha256 = hashlib.sha256(body).hexdigest()
+        # Named by content, so a rerun never rewrites a shard a running job is reading
+        shards.append(({
+            'shard_id': shard_id,
+            'file': f"part-{shard_id:05d}-{sha256[:12]}.csv",
+            'row_start': int(start),
+            'row_count': int(stop - start),
+            'sha256': sha256,
+            'bytes': len(body)
+        }, body))
+    return shards
+
+def write_shards(s3_client, shards):
+    # Shard files are relative to the manifest, which goes last so it never lists a missing shard
+    for entry, body in shards:
+        s3_client.put_object(Bucket=S3_BUCKET_NAME, Key=f"{SHARDS_PREFIX}{entry['file']}", Body=body, ContentType='text/csv')
+    manifest = {
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'rows': sum(entry['row_count'] for entry, _ in shards),
+        'shards': [entry for entry, _ in shards]
+    }
+    s3_client.put_object(
+        Bucket=S3_BUCKET_NAME,
+        Key=f"{SHARDS_PREFIX}{MANIFEST_FILE}",
+        Body=json.dumps(manifest),
+        ContentType='application/json'
+    )
+    return manifest
+
 def lambda_handler(event, context):
     """
     AWS Lambda function that:
     1. Reads the CSV files from an S3 bucket
     2. Processes the data (e.g., converts R vectors to lists, handles durations, merges data)
-    3. Writes the processed data back to S3 in a different path
+    3. Writes the processed data back to S3 in a different path, whole and as
+       row-range shards with a manifest (OUTPUT_SHARDS, default 8) for parallel embedding
     """
     try:
         recipe_data_key = os.path.join(INPUT_PREFIX, RECIPES_FILE)
@@ -114,6 +200,11 @@ def lambda_handler(event, context):
         processed_df['AverageRating'] = processed_df['AverageRating'].fillna(0)
         processed_df['AverageRating'] = processed_df['AverageRating'].astype(float)
 
+        # Ingredient dictionary and per-recipe id arrays for coverage scoring and pantry search
+        processed_df = processed_df.reset_index(drop=True)
+        vocabulary, indptr, indices = build_ingredient_csr(processed_df['RecipeIngredientParts'])
+        print(f"Ingredient dictionary: {len(vocabulary)} ingredients, {len(indices)} recipe-ingredient pairs")
+
         # =============================================
         # END OF DATA PROCESSING LOGIC
         # =============================================
@@ -133,6 +224,13 @@ def lambda_handler(event, context):
         )
         
         print(f"Processed CSV written to s3://{S3_BUCKET_NAME}/{preprocessed_data_key}")
+
+        write_ingredient_csr(s3_client, vocabulary, indptr, indices, processed_df['RecipeId'])
+        print(f"Ingredient CSR written to s3://{S3_BUCKET_NAME}/{INGREDIENTS_PREFIX}")
+
+        num_shards = max(1, int(os.environ.get('OUTPUT_SHARDS', DEFAULT_OUTPUT_SHARDS)))
+        manifest = write_shards(s3_client, build_shards(processed_df, num_shards))
+        print(f"{len(manifest['shards'])} shards and manifest written to s3://{S3_BUCKET_NAME}/{SHARDS_PREFIX}")
         
         return {
             'statusCode': 200,
@@ -143,6 +241,10 @@ def lambda_handler(event, context):
                     'reviews': f"s3://{S3_BUCKET_NAME}/{reviews_data_key}"
                 },
                 'output_file': f"s3://{S3_BUCKET_NAME}/{preprocessed_data_key}",
+                'ingredients_prefix': f"s3://{S3_BUCKET_NAME}/{INGREDIENTS_PREFIX}",
+                'shard_manifest': f"s3://{S3_BUCKET_NAME}/{SHARDS_PREFIX}{MANIFEST_FILE}",
+                'shards': len(manifest['shards']),
+                'ingredient_vocabulary_size': len(vocabulary),
                 'rows_processed': len(recipe_df),
                 'rows_output': len(processed_df)
             })
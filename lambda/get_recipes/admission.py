@@ -0,0 +1,471 @@
+import heapq
+import itertools
+import json
+import math
+import os
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from degradation import run_with_deadline
+
+# metrics is shared with the embedding monitor: build.sh packages it next to
+# this file, and in the repo it lives in monitoring/
+try:
+    from metrics import get_metrics
+except ImportError:
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "monitoring"))
+    from metrics import get_metrics
+
+# Lower runs first: app requests go ahead of batch jobs in every queue
+PRIORITIES = {
+    "interactive": 0,
+    "batch": 1
+}
+
+# Longest a request of each priority may queue for a dependency slot
+DEFAULT_MAX_WAIT_MS = {
+    "interactive": 200,
+    "batch": 2000
+}
+
+# Starting concurrency limit per dependency; it adapts from there
+DEFAULT_INITIAL_LIMITS = {
+    "embed": 8,
+    "search": 16
+}
+
+_controller = None
+_controller_lock = threading.Lock()
+
+
+def priority_of(event):
+    """
+    Priority name of a request event; anything but 'batch' is interactive
+    """
+    return "batch" if str(event.get('priority', '')).lower() == "batch" else "interactive"
+
+
+class Overloaded(Exception):
+    """
+    Raised when a request is shed instead of queued for a dependency
+    """
+
+    def __init__(self, dependency, priority, reason, retry_after_s):
+        super().__init__(f"{dependency} is overloaded ({reason}), shed {priority} request")
+        self.dependency = dependency
+        self.priority = priority
+        self.reason = reason
+        self.retry_after_s = retry_after_s
+
+
+class AdaptiveLimit:
+    """
+    Concurrency limit that follows a dependency's observed latency
+
+    The baseline is the fastest call in a rolling window. While smoothed
+    latency stays within tolerance times the baseline and the limit is being
+    used, it grows by about one per limit's worth of calls; once latency
+    drifts past that, or a call fails, it is cut by the backoff factor.
+    """
+
+    def __init__(self, initial=8, min_limit=1, max_limit=64, tolerance=2.0, backoff=0.9, window=200, min_samples=10):
+        self.value = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.tolerance = tolerance
+        self.backoff = backoff
+        self.min_samples = min_samples
+        self.mean_s = None
+        self._samples = deque(maxlen=window)
+
+    @property
+    def slots(self):
+        return max(self.min_limit, int(self.value))
+
+    def update(self, latency_s, in_flight, failed=False):
+        """
+        Adjusts the limit after one call
+
+        Parameters:
+        - latency_s: How long the call took
+        - in_flight: Calls still running when it finished
+        - failed: Whether the call raised
+        """
+        self._samples.append(latency_s)
+        self.mean_s = latency_s if self.mean_s is None else 0.9 * self.mean_s + 0.1 * latency_s
+        if len(self._samples) < self.min_samples:
+            return
+
+        if failed or self.mean_s > self.tolerance * min(self._samples):
+            self.value = max(self.min_limit, self.value * self.backoff)
+        elif in_flight + 1 >= self.value / 2:
+            self.value = min(self.max_limit, self.value + 1.0 / self.value)
+
+
+class DependencyGate:
+    """
+    Admission for one downstream dependency: an adaptive concurrency limit and
+    a bounded priority queue in front of it
+
+    A request that can't start straight away queues, unless the queue is full
+    or the wait it can expect is longer than it is allowed to wait; then it
+    is shed right away rather than after a long wait.
+    """
+
+    def __init__(self, name, limit, max_queue=64):
+        self.name = name
+        self.limit = limit
+        self.max_queue = max_queue
+        self.in_flight = 0
+        self._queue = []
+        self._sequence = itertools.count()
+        self._cond = threading.Condition()
+
+    def expected_wait_s(self, priority):
+        # Everyone queued at the same or a higher priority goes first; slots free up at limit / latency
+        if self.limit.mean_s is None:
+            return 0.0
+        ahead = sum(1 for queued_priority, _ in self._queue if queued_priority <= priority)
+        return (ahead + 1) * self.limit.mean_s / self.limit.slots
+
+    def _shed(self, priority_name, reason, retry_after_s):
+        get_metrics().increment(
+            "AdmissionShed", dimensions={"Dependency": self.name, "Priority": priority_name, "Reason": reason}
+        )
+        return Overloaded(self.name, priority_name, reason, retry_after_s)
+
+    def acquire(self, priority_name, max_wait_s):
+        """
+        Takes a slot, queueing for at most max_wait_s
+
+        Parameters:
+        - priority_name: Key of PRIORITIES
+        - max_wait_s: Longest the caller can afford to queue
+
+        Returns:
+        - Seconds spent queueing
+
+        Raises:
+        - Overloaded: The request was shed
+        """
+        priority = PRIORITIES[priority_name]
+        start = time.monotonic()
+        with self._cond:
+            reason = self._enqueue(priority, start + max_wait_s)
+            expected_s = self.expected_wait_s(priority)
+        waited = time.monotonic() - start
+
+        if reason is not None:
+            raise self._shed(priority_name, reason, max(1.0, math.ceil(expected_s)))
+        get_metrics().observe(
+            "AdmissionQueueTime", waited * 1000, dimensions={"Dependency": self.name, "Priority": priority_name}
+        )
+        return waited
+
+    def _enqueue(self, priority, deadline):
+        # Called with the lock held; returns why the request was shed, or None once it has a slot
+        if not self._queue and self.in_flight < self.limit.slots:
+            self.in_flight += 1
+            return None
+        if len(self._queue) >= self.max_queue:
+            return "queue_full"
+        if self.expected_wait_s(priority) > deadline - time.monotonic():
+            return "expected_wait"
+
+        entry = (priority, next(self._sequence))
+        heapq.heappush(self._queue, entry)
+        while True:
+            if self._queue[0] == entry and self.in_flight < self.limit.slots:
+                heapq.heappop(self._queue)
+                self.in_flight += 1
+                # The next in line may fit as well
+                self._cond.notify_all()
+                return None
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self._queue.remove(entry)
+                heapq.heapify(self._queue)
+                self._cond.notify_all()
+                return "wait_timeout"
+            self._cond.wait(remaining)
+
+    def release(self, latency_s, failed=False):
+        """
+        Gives a slot back and feeds the call's latency to the limit
+        """
+        with self._cond:
+            self.in_flight -= 1
+            self.limit.update(latency_s, self.in_flight, failed)
+            slots = self.limit.slots
+            self._cond.notify_all()
+        get_metrics().gauge("ConcurrencyLimit", slots, unit="Count", dimensions={"Dependency": self.name})
+
+    def release_unused(self):
+        # A slot whose call never ran says nothing about latency
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+
+
+class Permit:
+    """
+    A dependency slot taken by admit(); run() spends it and abandon() returns it unused
+
+    The slot is held until the call itself returns, even if the caller has
+    stopped waiting for it, so abandoned calls still count against the limit.
+    """
+
+    def __init__(self, gate):
+        self.gate = gate
+        self._state = "held"
+        self._lock = threading.Lock()
+
+    def run(self, fn, *args):
+        with self._lock:
+            if self._state != "held":
+                raise RuntimeError("Permit already used")
+            self._state = "running"
+        start = time.perf_counter()
+        failed = True
+        try:
+            result = fn(*args)
+            failed = False
+            return result
+        finally:
+            self.gate.release(time.perf_counter() - start, failed)
+
+    def abandon(self):
+        # No-op once run() has started; run() releases the slot itself
+        with self._lock:
+            if self._state != "held":
+                return
+            self._state = "abandoned"
+        self.gate.release_unused()
+
+
+class AdmissionController:
+    """
+    One DependencyGate per downstream dependency, shared by every request in the process
+
+    Admitted calls run on the controller's own pool, with a thread for every
+    slot the gates can ever hand out, so a permit never waits again behind
+    a smaller pool where the gates can't see it.
+    """
+
+    def __init__(self, gates, max_wait_ms=None):
+        self.gates = gates
+        self.max_wait_ms = dict(DEFAULT_MAX_WAIT_MS, **(max_wait_ms or {}))
+        self.executor = ThreadPoolExecutor(
+            max_workers=sum(gate.limit.max_limit for gate in gates.values()),
+            thread_name_prefix="admitted"
+        )
+
+    def admit(self, dependency, priority_name, timeout_s):
+        """
+        Takes a slot for a call to dependency
+
+        The request may queue for its priority's maximum wait, less the time
+        the call itself is expected to take out of timeout_s.
+
+        Parameters:
+        - dependency: Key of gates
+        - priority_name: Key of PRIORITIES
+        - timeout_s: Time the request has left for this stage
+
+        Returns:
+        - Permit
+
+        Raises:
+        - Overloaded: The request was shed
+        """
+        gate = self.gates[dependency]
+        call_s = gate.limit.mean_s or 0.0
+        max_wait_s = max(0.0, min(self.max_wait_ms[priority_name] / 1000.0, timeout_s - call_s))
+        gate.acquire(priority_name, max_wait_s)
+        return Permit(gate)
+
+
+def admission_enabled():
+    return os.environ.get('ADMISSION_CONTROL', '').lower() in ('1', 'true', 'yes')
+
+
+def get_admission():
+    """
+    Returns the process-wide admission controller
+
+    A Lambda container runs one request at a time, so the limits only bite
+    where requests share a process: server.py's workers and batch callers.
+
+    Configuration (environment variables):
+    - ADMISSION_LIMITS: JSON object of starting limits per dependency (default DEFAULT_INITIAL_LIMITS)
+    - ADMISSION_MAX_LIMIT: Upper bound for every limit (default 64)
+    - ADMISSION_MAX_QUEUE: Queued requests per dependency before shedding (default 64)
+    - ADMISSION_MAX_WAIT_MS: Longest an interactive request queues (default 200)
+    - ADMISSION_BATCH_MAX_WAIT_MS: Longest a batch request queues (default 2000)
+    - ADMISSION_LATENCY_TOLERANCE: Latency over baseline that cuts the limit (default 2.0)
+    """
+    global _controller
+    with _controller_lock:
+        if _controller is None:
+            limits = dict(DEFAULT_INITIAL_LIMITS, **json.loads(os.environ.get('ADMISSION_LIMITS') or '{}'))
+            max_limit = int(os.environ.get('ADMISSION_MAX_LIMIT', '64'))
+            tolerance = float(os.environ.get('ADMISSION_LATENCY_TOLERANCE', '2.0'))
+            max_queue = int(os.environ.get('ADMISSION_MAX_QUEUE', '64'))
+            _controller = AdmissionController(
+                {
+                    name: DependencyGate(name, AdaptiveLimit(initial, max_limit=max_limit, tolerance=tolerance), max_queue)
+                    for name, initial in limits.items()
+                },
+                max_wait_ms={
+                    "interactive": float(os.environ.get('ADMISSION_MAX_WAIT_MS', DEFAULT_MAX_WAIT_MS["interactive"])),
+                    "batch": float(os.environ.get('ADMISSION_BATCH_MAX_WAIT_MS', DEFAULT_MAX_WAIT_MS["batch"]))
+                }
+            )
+    return _controller
+
+
+def run_admitted(stage, fn, *args, priority, budget, stage_max_ms, keep_ms=0):
+    """
+    run_with_deadline behind the stage's admission gate, when admission control is on
+
+    Queue time comes out of the stage's budget, so the deadline is worked
+    out once the slot is taken.
+
+    Parameters:
+    - stage: Dependency name ('embed' or 'search')
+    - fn: Blocking callable
+    - args: Positional arguments for fn
+    - priority: Key of PRIORITIES
+    - budget: RequestBudget of the request
+    - stage_max_ms: The stage's own deadline cap
+    - keep_ms: Budget left over for later stages
+
+    Returns:
+    - fn's return value
+
+    Raises:
+    - Overloaded: The request was shed before the call
+    - DeadlineExceeded: The call ran past its deadline
+    """
+    if not admission_enabled():
+        return run_with_deadline(stage, fn, *args, timeout=budget.stage_timeout(stage_max_ms, keep_ms))
+
+    controller = get_admission()
+    permit = controller.admit(stage, priority, budget.stage_timeout(stage_max_ms, keep_ms))
+    try:
+        return run_with_deadline(
+            stage, permit.run, fn, *args,
+            timeout=budget.stage_timeout(stage_max_ms, keep_ms), executor=controller.executor
+        )
+    finally:
+        # Only returns the slot if the call never started (no budget left, or cancelled while queued)
+        permit.abandon()
+
+
+def admitted(stage, fn, priority, timeout_s):
+    """
+    Wraps fn so that every call first takes a slot at the stage's gate, for
+    callers that run it on their own threads (the asyncio path)
+
+    Parameters:
+    - stage: Dependency name ('embed' or 'search')
+    - fn: Blocking callable
+    - priority: Key of PRIORITIES
+    - timeout_s: Time the request has left for this stage
+
+    Returns:
+    - Callable taking fn's arguments; fn itself when admission control is off
+    """
+    if not admission_enabled():
+        return fn
+
+    def call(*args):
+        return get_admission().admit(stage, priority, timeout_s).run(fn, *args)
+    return call
+
+
+def simulate_burst(requests=600, overload=1.5, capacity=8, service_ms=20, batch_share=0.25, admission=True, seed=0):
+    """
+    Sends an open-loop burst at a simulated dependency that slows down past capacity
+
+    Requests arrive at overload times what the dependency can serve, so
+    without admission its queue, and everyone's latency, keeps growing.
+
+    Parameters:
+    - requests: Total requests
+    - overload: Arrival rate as a multiple of the dependency's capacity
+    - capacity: Calls the dependency serves at full speed
+    - service_ms: Latency at or under capacity
+    - batch_share: Fraction of requests sent as batch
+    - admission: Whether calls go through a DependencyGate
+
+    Returns:
+    - Dictionary of latency percentiles of the requests served, per priority, and shed counts
+    """
+    import random
+
+    rng = random.Random(seed)
+    priorities = ["batch" if rng.random() < batch_share else "interactive" for _ in range(requests)]
+    interval_s = service_ms / 1000.0 / capacity / overload
+    running = [0]
+    running_lock = threading.Lock()
+
+    def dependency():
+        # Processor sharing: every call slows down once more than capacity are running
+        with running_lock:
+            running[0] += 1
+            load = running[0]
+        time.sleep(service_ms / 1000.0 * max(1.0, load / capacity))
+        with running_lock:
+            running[0] -= 1
+
+    controller = AdmissionController({"search": DependencyGate("search", AdaptiveLimit(initial=capacity * 2), max_queue=256)})
+    latencies = {"interactive": [], "batch": []}
+    shed = {"interactive": 0, "batch": 0}
+
+    def one(priority):
+        start = time.perf_counter()
+        try:
+            if admission:
+                controller.admit("search", priority, 1.0).run(dependency)
+            else:
+                dependency()
+        except Overloaded:
+            shed[priority] += 1
+            return
+        latencies[priority].append((time.perf_counter() - start) * 1000)
+
+    with ThreadPoolExecutor(max_workers=requests) as pool:
+        start = time.perf_counter()
+        for i, priority in enumerate(priorities):
+            time.sleep(max(0.0, start + i * interval_s - time.perf_counter()))
+            pool.submit(one, priority)
+
+    def percentile(values, q):
+        return float(sorted(values)[min(len(values) - 1, int(q / 100.0 * len(values)))]) if values else None
+
+    return {
+        "admission": admission,
+        "final_limit": controller.gates["search"].limit.slots if admission else None,
+        "shed": shed,
+        **{
+            f"{priority}_p{q}_ms": percentile(values, q)
+            for priority, values in latencies.items() for q in (50, 99)
+        }
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Burst against a saturating dependency, with and without admission control")
+    parser.add_argument("--requests", type=int, default=600)
+    parser.add_argument("--overload", type=float, default=1.5)
+    parser.add_argument("--capacity", type=int, default=8)
+    args = parser.parse_args()
+
+    for admission in (False, True):
+        print(json.dumps(simulate_burst(args.requests, args.overload, args.capacity, admission=admission), indent=2))
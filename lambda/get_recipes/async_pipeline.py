@@ -0,0 +1,389 @@
+import asyncio
+import hashlib
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+class DeadlineExceeded(TimeoutError):
+    """
+    Raised when a stage of the request path runs past its deadline
+    """
+
+    def __init__(self, stage, timeout):
+        super().__init__(f"{stage} exceeded its {timeout * 1000:.0f} ms deadline")
+        self.stage = stage
+        self.timeout = timeout
+
+
+class LatencyTracker:
+    """
+    Rolling window of call latencies for one dependency, used to pick the hedge delay
+    """
+
+    def __init__(self, window=500, min_samples=20):
+        self.samples = deque(maxlen=window)
+        self.min_samples = min_samples
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self.samples.append(seconds)
+
+    def percentile(self, q):
+        """
+        Returns the q-th percentile latency in seconds, or None until min_samples are seen
+        """
+        with self._lock:
+            if len(self.samples) < self.min_samples:
+                return None
+            ordered = sorted(self.samples)
+        idx = min(len(ordered) - 1, int(round(q / 100.0 * (len(ordered) - 1))))
+        return ordered[idx]
+
+
+# One tracker per remote dependency, kept for the life of the container
+TRACKERS = {
+    "embed": LatencyTracker(),
+    "search": LatencyTracker()
+}
+
+# Stage calls run here rather than on the event loop's default executor:
+# asyncio.run joins that one on exit, so a call abandoned at its deadline
+# would still hold up the handler until it returned
+_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get('ASYNC_STAGE_THREADS', '32')),
+    thread_name_prefix="async-stage"
+)
+
+
+def _timed(fn, args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+async def call_with_deadline(stage, fn, *args, timeout):
+    """
+    Runs a blocking call in a worker thread and gives up on it after timeout seconds
+
+    Parameters:
+    - stage: Name used in logs and DeadlineExceeded
+    - fn: Blocking callable
+    - args: Positional arguments for fn
+    - timeout: Deadline in seconds
+
+    Returns:
+    - fn's return value
+    """
+    loop = asyncio.get_running_loop()
+    try:
+        return await asyncio.wait_for(loop.run_in_executor(_executor, fn, *args), timeout)
+    except asyncio.TimeoutError:
+        raise DeadlineExceeded(stage, timeout)
+
+
+async def hedged_call(stage, fn, *args, timeout, tracker=None, hedge=False, hedge_quantile=95):
+    """
+    Runs a blocking call with a deadline, optionally hedging it
+
+    With hedging on, a duplicate call is sent once the primary has been running
+    longer than the tracker's hedge_quantile latency, and the first successful
+    answer wins. Hedging is skipped until the tracker has enough samples.
+
+    Parameters:
+    - stage: Name used in logs and DeadlineExceeded
+    - fn: Blocking callable
+    - args: Positional arguments for fn
+    - timeout: Deadline in seconds covering all attempts
+    - tracker: LatencyTracker that records attempt latencies and supplies the hedge delay
+    - hedge: Whether a duplicate call may be sent
+    - hedge_quantile: Percentile of observed latency after which to hedge
+
+    Returns:
+    - fn's return value from the first attempt to succeed
+    """
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    deadline = start + timeout
+    hedge_delay = tracker.percentile(hedge_quantile) if (hedge and tracker) else None
+    hedged = False
+    last_error = None
+
+    pending = {loop.run_in_executor(_executor, _timed, fn, args)}
+    try:
+        while pending:
+            now = loop.time()
+            if now >= deadline:
+                raise DeadlineExceeded(stage, timeout)
+
+            wait_for = deadline - now
+            if hedge_delay is not None and not hedged:
+                wait_for = min(wait_for, max(0.0, start + hedge_delay - now))
+
+            done, pending = await asyncio.wait(pending, timeout=wait_for, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    result, elapsed = task.result()
+                    if tracker:
+                        tracker.record(elapsed)
+                    return result
+                last_error = task.exception()
+                print(f"[WARN] {stage} attempt failed: {last_error}")
+
+            if pending and hedge_delay is not None and not hedged and loop.time() - start >= hedge_delay:
+                print(f"[INFO] Hedging {stage} after {hedge_delay * 1000:.0f} ms")
+                pending.add(loop.run_in_executor(_executor, _timed, fn, args))
+                hedged = True
+
+        raise last_error
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+class Dependencies:
+    """
+    The callables the request path depends on, so local stand-ins can be swapped in
+
+    embed and search are required. warm_index, cache_lookup and save_profile
+    are optional: they run concurrently up front and their
+    failures only cost the feature they provide. cache_lookup returns
+    (source, recipes) on a hit and None on a miss. embed_request, if given,
+    embeds from the user and request blocks instead of the built query string.
+    """
+
+    def __init__(self, embed, search, filter_fn, build_query,
+                 warm_index=None, cache_lookup=None, save_profile=None, embed_request=None):
+        self.embed = embed
+        self.embed_request = embed_request
+        self.search = search
+        self.filter_fn = filter_fn
+        self.build_query = build_query
+        self.warm_index = warm_index or (lambda: None)
+        self.cache_lookup = cache_lookup or (lambda user_data, request_data: None)
+        self.save_profile = save_profile or (lambda user_data: None)
+
+
+def default_dependencies():
+    """
+    Dependencies wired to the real SageMaker/Pinecone calls, the profile store
+    and the response cache
+    """
+    import lambda_function
+    import profile_store
+    return Dependencies(
+        embed=lambda_function.embed_query,
+        search=lambda_function.search_index,
+        filter_fn=lambda_function.filterAllergiesAndDislikes,
+        build_query=lambda_function.build_query_string,
+        warm_index=lambda_function.warm_search_index,
+        cache_lookup=lambda_function.lookup_cached_recipes,
+        save_profile=profile_store.save_profile,
+        embed_request=lambda_function.embed_request
+    )
+
+
+async def recommend_async(user_data, request_data, deps=None, hedge=None, budget=None, degradation=None,
+                          priority="interactive"):
+    """
+    Asyncio request path: concurrent setup, then deadline-bound embed and search
+
+    Stage deadlines are capped by the request budget, and the request degrades
+    the same way as the synchronous path when the budget runs low. Embed and
+    search calls, hedges included, go through the same admission gates as the
+    synchronous path.
+
+    Configuration (environment variables):
+    - EMBED_TIMEOUT_MS, SEARCH_TIMEOUT_MS: Per-call deadlines (default 2000)
+    - AUX_TIMEOUT_MS: Deadline for the optional setup calls (default 300)
+    - HEDGE_REQUESTS: Send a duplicate embed/search call after the p95 latency
+
+    Parameters:
+    - user_data: The request's user block, with the stored profile already
+      merged in (see lambda_function.merge_stored_profile)
+    - request_data: The request's request block
+    - deps: Dependencies (defaults to the real services)
+    - hedge: Overrides HEDGE_REQUESTS when not None
+    - budget: RequestBudget (defaults to a local budget)
+    - degradation: Degradation that records any steps taken
+    - priority: 'interactive' or 'batch'; a shed batch request raises Overloaded
+
+    Returns:
+    - (recipes, source): the filtered recipe matches, and 'cache' or
+      'precomputed' when they came from cache_lookup (None when fresh)
+    """
+    from admission import Overloaded, admitted
+    from constraints import constraints_for
+    from degradation import (
+        EMBED_MIN_MS,
+        SEARCH_MIN_MS,
+        SKIP_OPTIONAL_BELOW_MS,
+        Degradation,
+        RequestBudget,
+        embedding_fallback,
+        popular_fallback,
+        remember_embedding,
+        search_plan
+    )
+
+    deps = deps or default_dependencies()
+    budget = budget or RequestBudget()
+    degradation = degradation if degradation is not None else Degradation()
+    if hedge is None:
+        hedge = os.environ.get('HEDGE_REQUESTS', '').lower() in ('1', 'true', 'yes')
+
+    cached = None
+    if budget.remaining_ms() < SKIP_OPTIONAL_BELOW_MS:
+        degradation.add(f"{budget.remaining_ms():.0f} ms left, skipped optional setup stages")
+    else:
+        aux_timeout = budget.stage_timeout(float(os.environ.get('AUX_TIMEOUT_MS', '300')))
+
+        # Independent setup work runs concurrently; none of it is required
+        warmed, cached, saved = await asyncio.gather(
+            call_with_deadline("warm_index", deps.warm_index, timeout=aux_timeout),
+            call_with_deadline("cache_lookup", deps.cache_lookup, user_data, request_data, timeout=aux_timeout),
+            call_with_deadline("save_profile", deps.save_profile, user_data, timeout=aux_timeout),
+            return_exceptions=True
+        )
+        stages = (("warm_index", warmed), ("cache_lookup", cached), ("save_profile", saved))
+        for stage, outcome in stages:
+            if isinstance(outcome, BaseException):
+                print(f"[WARN] Optional stage {stage} skipped: {outcome}")
+
+    if isinstance(cached, tuple):
+        source, recipes = cached
+        print(f"[INFO] Serving {len(recipes)} recipes from {source}")
+        return recipes, source
+
+    allergies = [s.lower() for s in user_data.get("allergies", [])]
+    dislikes = [s.lower() for s in user_data.get("dislikes", [])]
+
+    query_string = deps.build_query(user_data, request_data)
+    if budget.remaining_ms() < EMBED_MIN_MS:
+        embedding = embedding_fallback(query_string, degradation, f"{budget.remaining_ms():.0f} ms left, skipped embedding")
+    else:
+        if deps.embed_request is not None:
+            embed_fn, embed_args = deps.embed_request, (user_data, request_data)
+        else:
+            embed_fn, embed_args = deps.embed, (query_string,)
+        timeout = budget.stage_timeout(float(os.environ.get('EMBED_TIMEOUT_MS', '2000')), keep_ms=SEARCH_MIN_MS)
+        try:
+            embedding = await hedged_call(
+                "embed", admitted("embed", embed_fn, priority, timeout), *embed_args,
+                timeout=timeout, tracker=TRACKERS["embed"], hedge=hedge
+            )
+            remember_embedding(query_string, embedding)
+        except Overloaded as e:
+            if priority == "batch":
+                raise
+            embedding = embedding_fallback(query_string, degradation, str(e))
+        except DeadlineExceeded as e:
+            embedding = embedding_fallback(query_string, degradation, str(e))
+
+    if embedding is None:
+        degradation.add("served popular recipes")
+        return popular_fallback(allergies, dislikes, deps.filter_fn), None
+
+    run_search, top_k = search_plan(budget, degradation)
+    recipes = None
+    if run_search:
+        timeout = budget.stage_timeout(float(os.environ.get('SEARCH_TIMEOUT_MS', '2000')))
+        try:
+            recipes = await hedged_call(
+                "search", admitted("search", deps.search, priority, timeout),
+                embedding, top_k, constraints_for(user_data, request_data),
+                timeout=timeout, tracker=TRACKERS["search"], hedge=hedge
+            )
+        except Overloaded as e:
+            if priority == "batch":
+                raise
+            degradation.add(str(e))
+        except DeadlineExceeded as e:
+            degradation.add(str(e))
+
+    if recipes is None:
+        degradation.add("served popular recipes")
+        return popular_fallback(allergies, dislikes, deps.filter_fn), None
+
+    return deps.filter_fn(recipes, allergies, dislikes), None
+
+
+class LatencyInjector:
+    """
+    Local stand-in wrapper that delays a callable with a long-tailed latency distribution
+    """
+
+    def __init__(self, fn, median_ms, spike_ms, spike_rate, seed=None):
+        self.fn = fn
+        self.median_ms = median_ms
+        self.spike_ms = spike_ms
+        self.spike_rate = spike_rate
+        self.rng = random.Random(seed)
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, *args):
+        with self._lock:
+            self.calls += 1
+            spike = self.rng.random() < self.spike_rate
+            jitter = self.rng.uniform(0.8, 1.2)
+        time.sleep((self.spike_ms if spike else self.median_ms * jitter) / 1000.0)
+        return self.fn(*args)
+
+
+def stub_embed(query_string, dim=384):
+    """
+    Deterministic pseudo-embedding so local runs need no endpoint
+    """
+    seed = int(hashlib.md5(query_string.encode("utf-8")).hexdigest()[:8], 16)
+    rng = random.Random(seed)
+    return [rng.uniform(-1, 1) for _ in range(dim)]
+
+
+def stub_search(embedding_vector, top_k=None, constraints=None):
+    """
+    Fake vector-store lookup returning top_k placeholder recipes
+    """
+    return [{"id": str(i), "score": 1.0 - i / 10, "metadata": {"ingredients": "[]"}} for i in range(top_k or 5)]
+
+
+def simulate(num_requests=300, hedge=False, seed=0):
+    """
+    Runs the async path against latency-injecting stand-ins
+
+    Returns:
+    - Dictionary with p50/p99 request latency and the number of backend calls
+    """
+    import lambda_function
+
+    embed = LatencyInjector(stub_embed, median_ms=20, spike_ms=400, spike_rate=0.03, seed=seed)
+    search = LatencyInjector(stub_search, median_ms=15, spike_ms=300, spike_rate=0.03, seed=seed + 1)
+    deps = Dependencies(embed, search, lambda_function.filterAllergiesAndDislikes, lambda_function.build_query_string)
+    for tracker in TRACKERS.values():
+        tracker.samples.clear()
+
+    async def run():
+        latencies = []
+        for i in range(num_requests):
+            start = time.perf_counter()
+            await recommend_async({"username": f"user{i}"}, {"meal_type": "Dinner"}, deps=deps, hedge=hedge)
+            latencies.append((time.perf_counter() - start) * 1000)
+        return sorted(latencies)
+
+    latencies = asyncio.run(run())
+    return {
+        "hedge": hedge,
+        "p50_ms": latencies[len(latencies) // 2],
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1],
+        "embed_calls": embed.calls,
+        "search_calls": search.calls
+    }
+
+
+if __name__ == "__main__":
+    print(simulate(hedge=False))
+    print(simulate(hedge=True))
@@ -0,0 +1,181 @@
+import os
+import queue
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+
+# metrics is shared with the embedding monitor: build.sh packages it next to
+# this file, and in the repo it lives in monitoring/
+try:
+    from metrics import get_metrics
+except ImportError:
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "monitoring"))
+    from metrics import get_metrics
+
+# Container-wide batcher, created on first use
+_batcher = None
+_batcher_lock = threading.Lock()
+
+
+class MicroBatcher:
+    """
+    Coalesces concurrent single-query embedding calls into batched endpoint calls.
+
+    Callers submit one query string and get back a Future for its vector. A
+    background thread collects queued queries until either max_batch_size is
+    reached or max_wait_ms has passed since the first query of the batch, then
+    makes one batched call and resolves each caller's future with its own vector.
+
+    Every batch publishes the queue depth left behind (EmbedQueueDepth gauge),
+    its size (EmbedBatchSize) and its oldest query's wait (EmbedQueueWait)
+    through get_metrics; metrics() returns the totals since start.
+    """
+
+    def __init__(self, batch_fn, max_batch_size=32, max_wait_ms=5.0):
+        """
+        Parameters:
+        - batch_fn: Callable mapping a list of query strings to a list of vectors
+        - max_batch_size: Largest number of queries sent in one call
+        - max_wait_ms: Longest time the first query of a batch waits for company
+        """
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+
+        self._queue = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self._batch_sizes = Counter()
+        self._requests = 0
+        self._errors = 0
+        self._queue_wait_total = 0.0
+        self._closed = False
+
+        self._worker = threading.Thread(target=self._run, name="embedding-microbatcher", daemon=True)
+        self._worker.start()
+
+    def submit(self, query_string):
+        """
+        Queues a query string for the next batch
+
+        Returns:
+        - Future resolving to the query's embedding vector
+        """
+        if self._closed:
+            raise RuntimeError("MicroBatcher is closed")
+        future = Future()
+        self._queue.put((query_string, future, time.monotonic()))
+        return future
+
+    def embed(self, query_string, timeout=None):
+        """
+        Embeds one query string, blocking until its batch has been processed
+        """
+        return self.submit(query_string).result(timeout=timeout)
+
+    def close(self):
+        """
+        Stops accepting work; queued queries are still processed
+        """
+        self._closed = True
+        self._queue.put(None)
+        self._worker.join()
+
+    def metrics(self):
+        """
+        Returns a snapshot of queue depth and batch-size distribution
+        """
+        with self._stats_lock:
+            batches = sum(self._batch_sizes.values())
+            return {
+                "queue_depth": self._queue.qsize(),
+                "requests": self._requests,
+                "batches": batches,
+                "errors": self._errors,
+                "mean_batch_size": self._requests / batches if batches else 0.0,
+                "mean_queue_wait_ms": self._queue_wait_total * 1000 / self._requests if self._requests else 0.0,
+                "batch_size_histogram": dict(sorted(self._batch_sizes.items()))
+            }
+
+    def _collect_batch(self):
+        first = self._queue.get()
+        if first is None:
+            return None
+
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                # Re-queue the sentinel so the loop exits after this batch
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            if batch is None:
+                return
+
+            now = time.monotonic()
+            queries = [query for query, _, _ in batch]
+            try:
+                vectors = self.batch_fn(queries)
+                if len(vectors) != len(batch):
+                    raise ValueError(f"Batch function returned {len(vectors)} vectors for {len(batch)} queries")
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                failed = True
+            else:
+                for (_, future, _), vector in zip(batch, vectors):
+                    future.set_result(vector)
+                failed = False
+
+            with self._stats_lock:
+                self._batch_sizes[len(batch)] += 1
+                self._requests += len(batch)
+                self._errors += int(failed)
+                self._queue_wait_total += sum(now - enqueued for _, _, enqueued in batch)
+            self._publish(batch, now, failed)
+
+    def _publish(self, batch, now, failed):
+        try:
+            metrics = get_metrics()
+            metrics.gauge("EmbedQueueDepth", self._queue.qsize(), unit="Count")
+            metrics.observe("EmbedBatchSize", len(batch), unit="Count")
+            metrics.observe("EmbedQueueWait", (now - batch[0][2]) * 1000)
+            if failed:
+                metrics.increment("EmbedBatchErrors")
+        except Exception as e:
+            # The worker thread must outlive a metrics problem
+            print(f"[WARN] Could not record batch metrics: {e}")
+
+
+def get_batcher():
+    """
+    Returns the process-wide batcher in front of the SageMaker endpoint
+
+    Configuration (environment variables):
+    - MICROBATCH_MAX_SIZE: Largest batch sent to the endpoint (default 32)
+    - MICROBATCH_MAX_WAIT_MS: Longest wait before a partial batch is sent (default 5)
+    """
+    global _batcher
+    with _batcher_lock:
+        if _batcher is None:
+            from lambda_function import call_sagemaker_endpoint_batch
+            _batcher = MicroBatcher(
+                call_sagemaker_endpoint_batch,
+                max_batch_size=int(os.environ.get("MICROBATCH_MAX_SIZE", "32")),
+                max_wait_ms=float(os.environ.get("MICROBATCH_MAX_WAIT_MS", "5"))
+            )
+    return _batcher
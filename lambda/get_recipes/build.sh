@@ -4,7 +4,9 @@
 # This script packages a Lambda function with its dependencies
 
 # Set variables
-FUNCTION_FILE="lambda_function.py"
+FUNCTION_FILES="*.py"
+# pytest modules sit next to the code but stay out of the package
+EXCLUDED_FILES="test_*.py conftest.py"
 PACKAGE_DIR="package"
 OUTPUT_ZIP="lambda-deployment.zip"
 
@@ -21,7 +23,7 @@ mkdir -p "$PACKAGE_DIR"
 
 # Install dependencies
 echo "Installing dependencies to $PACKAGE_DIR..."
-pip3 install pinecone -t "$PACKAGE_DIR/"
+pip3 install pinecone numpy onnxruntime tokenizers -t "$PACKAGE_DIR/"
 
 # Zip dependencies
 echo "Packaging dependencies..."
@@ -31,7 +33,10 @@ cd ..
 
 # Add function code to zip
 echo "Adding function code to deployment package..."
-zip -g "$OUTPUT_ZIP" "$FUNCTION_FILE"
+zip -g "$OUTPUT_ZIP" $FUNCTION_FILES -x $EXCLUDED_FILES
+
+# The metrics module is shared with the embedding monitor
+zip -gj "$OUTPUT_ZIP" ../../monitoring/metrics.py
 
 # Report size
 ZIP_SIZE=$(du -h "$OUTPUT_ZIP" | cut -f1)
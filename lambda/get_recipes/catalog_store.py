@@ -0,0 +1,254 @@
+import json
+import mmap
+import os
+import shutil
+import threading
+from urllib.parse import urlparse
+
+import boto3
+import numpy as np
+
+from constraints import COLUMN_DTYPES, constraint_mask
+from index_version import get_active_index_version
+from ingredients import IngredientIndex
+
+# embed.py publishes each index version's catalog under <prefix>/<version>/
+DEFAULT_CATALOG_S3_PREFIX = "s3://cs401r-mlops-final/catalog"
+
+# Versions kept under CATALOG_DIR: the active one and the one before it, which
+# other processes sharing the directory may still be reading
+KEEP_LOCAL_VERSIONS = 2
+
+_stores = {}
+_lock = threading.Lock()
+
+
+class RowIndex:
+    """
+    Recipe id to catalog row, by binary search over memory-mapped sorted ids
+    """
+
+    def __init__(self, sorted_ids, rows):
+        self.sorted_ids = sorted_ids
+        self.rows = rows
+
+    def get(self, recipe_id, default=None):
+        position = int(np.searchsorted(self.sorted_ids, recipe_id))
+        if position < len(self.sorted_ids) and self.sorted_ids[position] == recipe_id:
+            return int(self.rows[position])
+        return default
+
+
+class CatalogStore:
+    """
+    One index version's catalog on local disk: recipe metadata by row, plus
+    optional per-version tables (such as the neighbour table) memory-mapped on first use.
+
+    Metadata is kept as one JSON record per line with a row offset table, and
+    everything is memory-mapped read-only, so processes serving the same
+    version share one copy through the page cache.
+    """
+
+    def __init__(self, version, local_dir, s3_prefix):
+        self.version = version
+        self.local_dir = local_dir
+        self.s3_prefix = s3_prefix
+        self._arrays = {}
+        self._ingredient_index = None
+        self._norms = None
+
+        self._derive_records()
+        with open(os.path.join(self.local_dir, "records.jsonl"), "rb") as f:
+            self._records = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._offsets = np.load(os.path.join(self.local_dir, "record_offsets.npy"), mmap_mode="r")
+        self.row_of = RowIndex(
+            np.load(os.path.join(self.local_dir, "sorted_ids.npy"), mmap_mode="r"),
+            np.load(os.path.join(self.local_dir, "sorted_id_rows.npy"), mmap_mode="r")
+        )
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def _derive_records(self):
+        """
+        Re-lays recipes.json as records.jsonl plus offset and id tables, once per version on this disk
+        """
+        if os.path.exists(os.path.join(self.local_dir, "records.jsonl")):
+            return
+        with open(self._fetch("recipes.json")) as f:
+            recipes = json.load(f)
+
+        lines = [json.dumps(recipe).encode("utf-8") + b"\n" for recipe in recipes]
+        offsets = np.zeros(len(lines) + 1, dtype=np.int64)
+        np.cumsum([len(line) for line in lines], out=offsets[1:])
+        ids = np.array([recipe["id"] for recipe in recipes], dtype=str)
+        order = np.argsort(ids, kind="stable")
+
+        # Each file is written then renamed; records.jsonl goes last since its presence marks completion
+        def write(file_name, write_fn):
+            tmp_path = os.path.join(self.local_dir, f"{file_name}.{os.getpid()}.tmp")
+            with open(tmp_path, "wb") as f:
+                write_fn(f)
+            os.replace(tmp_path, os.path.join(self.local_dir, file_name))
+
+        write("record_offsets.npy", lambda f: np.save(f, offsets))
+        write("sorted_ids.npy", lambda f: np.save(f, ids[order]))
+        write("sorted_id_rows.npy", lambda f: np.save(f, order.astype(np.int64)))
+        write("records.jsonl", lambda f: f.writelines(lines))
+
+    def record(self, row):
+        return json.loads(self._records[self._offsets[row]:self._offsets[row + 1]])
+
+    def _fetch(self, file_name):
+        """
+        Local path of a catalog file, downloading it on first use
+
+        Parameters:
+        - file_name: File under this version's catalog prefix
+
+        Returns:
+        - Path on local disk
+        """
+        path = os.path.join(self.local_dir, file_name)
+        if not os.path.exists(path):
+            parsed = urlparse(self.s3_prefix)
+            os.makedirs(self.local_dir, exist_ok=True)
+            print(f"[INFO] Downloading {self.s3_prefix}/{file_name}")
+            # Download then rename so a concurrent reader (or process) never sees a partial file
+            partial_path = f"{path}.{os.getpid()}.partial"
+            boto3.client('s3').download_file(
+                parsed.netloc, f"{parsed.path.strip('/')}/{file_name}", partial_path
+            )
+            os.replace(partial_path, path)
+        return path
+
+    def array(self, name):
+        if name not in self._arrays:
+            self._arrays[name] = np.load(self._fetch(f"{name}.npy"), mmap_mode="r")
+        return self._arrays[name]
+
+    def embedding_norms(self):
+        # Per process; the embeddings themselves stay memory-mapped and shared
+        if self._norms is None:
+            self._norms = np.maximum(np.linalg.norm(self.array("embeddings"), axis=1), 1e-12).astype(np.float32)
+        return self._norms
+
+    def search(self, vector, top_k, mask=None):
+        """
+        Exact cosine search over this version's embeddings
+        
+        Parameters:
+        - vector: Query embedding
+        - top_k: Number of matches
+        - mask: Optional boolean array of allowed rows
+        
+        Returns:
+        - List of matches, best first
+        """
+        query = np.asarray(vector, dtype=np.float32)
+        scores = (self.array("embeddings") @ query) / (self.embedding_norms() * max(np.linalg.norm(query), 1e-12))
+        if mask is not None:
+            scores = np.where(mask, scores, -np.inf)
+        top_k = min(top_k, len(scores))
+        top = np.argpartition(-scores, top_k - 1)[:top_k]
+        top = top[np.argsort(-scores[top])]
+        return [self.match(row, scores[row]) for row in top if np.isfinite(scores[row])]
+
+    def constraint_columns(self):
+        # Typed per-row columns from pipeline_steps/constraint_columns.py
+        return {name: self.array(f"constraint_{name}") for name in COLUMN_DTYPES}
+
+    def constraint_mask(self, constraints):
+        """
+        Catalog rows that satisfy a request's hard constraints
+
+        Parameters:
+        - constraints: Output of constraints.constraints_for
+
+        Returns:
+        - Boolean array with one entry per row
+        """
+        return constraint_mask(self.constraint_columns(), constraints)
+
+    def feature_columns(self):
+        # Rerank features: the constraint columns plus AverageRating
+        return {**self.constraint_columns(), "rating": self.array("feature_rating")}
+
+    def ingredient_index(self):
+        # Dictionary and CSR arrays built by data_preprocessing, sliced to this catalog by embed.py
+        if self._ingredient_index is None:
+            with open(self._fetch("ingredient_vocabulary.json")) as f:
+                vocabulary = json.load(f)
+            self._ingredient_index = IngredientIndex(
+                vocabulary, self.array("ingredient_indptr"), self.array("ingredient_indices")
+            )
+        return self._ingredient_index
+
+    def match(self, row, score):
+        # Same shape as a Pinecone match, so filtering and the app work unchanged
+        recipe = self.record(row)
+        return {"id": recipe["id"], "score": float(score), "metadata": recipe["metadata"]}
+
+    def similar(self, recipe_id, top_k=None):
+        """
+        Precomputed nearest neighbours of a recipe, best first
+
+        Parameters:
+        - recipe_id: Recipe to find neighbours for
+        - top_k: Number of neighbours (default: the whole table row)
+
+        Returns:
+        - List of matches, or None if the recipe isn't in this catalog version
+        """
+        row = self.row_of.get(str(recipe_id))
+        if row is None:
+            return None
+        neighbours = self.array("neighbours")[row, :top_k]
+        scores = self.array("neighbour_scores")[row, :top_k]
+        return [self.match(n, s) for n, s in zip(neighbours, scores)]
+
+
+def remove_old_versions(local_root, active_version, keep=KEEP_LOCAL_VERSIONS):
+    """
+    Deletes all but the keep most recently activated version directories under local_root
+
+    Activation order is the directories' modification time, which
+    get_catalog_store bumps whenever a process switches to a version, so
+    the version just replaced is kept for processes that haven't switched yet.
+    The 'unknown' fallback directory is left to the processes using it.
+    """
+    if not os.path.isdir(local_root):
+        return
+    others = [
+        os.path.join(local_root, entry) for entry in os.listdir(local_root)
+        if entry not in (active_version, 'unknown') and os.path.isdir(os.path.join(local_root, entry))
+    ]
+    others.sort(key=os.path.getmtime, reverse=True)
+    for path in others[keep - 1:]:
+        print(f"[INFO] Removing old catalog version {path}")
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def get_catalog_store():
+    """
+    Returns the catalog of the active index version, loaded once per container and version
+
+    Configuration (environment variables):
+    - CATALOG_S3_PREFIX: Where embed.py publishes catalog versions
+    - CATALOG_DIR: Local cache directory (default /tmp/catalog)
+    """
+    version = get_active_index_version().get('version', 'unknown')
+    with _lock:
+        if version not in _stores:
+            s3_prefix = os.environ.get('CATALOG_S3_PREFIX', DEFAULT_CATALOG_S3_PREFIX).rstrip('/')
+            local_root = os.environ.get('CATALOG_DIR', '/tmp/catalog')
+            local_dir = os.path.join(local_root, version)
+            # Only the active version is kept in memory
+            _stores.clear()
+            os.makedirs(local_dir, exist_ok=True)
+            os.utime(local_dir)
+            # An unreadable pointer says nothing about which versions are stale
+            if version != 'unknown':
+                remove_old_versions(local_root, version)
+            _stores[version] = CatalogStore(version, local_dir, f"{s3_prefix}/{version}")
+        return _stores[version]
@@ -0,0 +1,21 @@
+import os
+
+import pytest
+
+from local_stack import local_environment, write_synthetic_catalog
+
+
+@pytest.fixture(scope="session")
+def local_stack(tmp_path_factory):
+    """
+    Points get_recipes at a small synthetic catalog and the other local stand-ins
+
+    The modules cache their stores per process, so one catalog serves the whole session.
+    """
+    root = str(tmp_path_factory.mktemp("catalog"))
+    write_synthetic_catalog(root, rows=2000)
+    saved = dict(os.environ)
+    os.environ.update(local_environment(root))
+    yield root
+    os.environ.clear()
+    os.environ.update(saved)
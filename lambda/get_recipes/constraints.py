@@ -0,0 +1,210 @@
+import os
+import time
+
+import numpy as np
+
+# Meal types the app offers, one bit each in the meal_types column
+MEAL_TYPES = ("Breakfast", "Lunch", "Dinner", "Snack", "Dessert")
+MEAL_TYPE_BITS = {meal_type: 1 << i for i, meal_type in enumerate(MEAL_TYPES)}
+ALL_MEAL_TYPES = (1 << len(MEAL_TYPES)) - 1
+
+# Macro rankings from preprocessing (FatRanking etc.) as uint8 codes
+RANK_CODES = {"low": 0, "medium": 1, "high": 2}
+UNKNOWN_RANK = 255
+
+# Unknown times are stored as -1, so "at most N minutes" lets them through
+UNKNOWN_MINUTES = -1
+MAX_MINUTES = int(np.iinfo(np.int16).max)
+
+# Typed columns published with each catalog version, row-aligned with recipes.json
+COLUMN_DTYPES = {
+    "total_minutes": np.int16,
+    "meal_types": np.uint8,
+    "protein_rank": np.uint8,
+    "fat_rank": np.uint8,
+    "carb_rank": np.uint8
+}
+
+# Keys of the user's macros block and the column each one is checked against
+MACRO_COLUMNS = {"protein": "protein_rank", "fats": "fat_rank", "carbs": "carb_rank"}
+
+
+def _max_minutes(value):
+    # Clients send anything; a value that isn't a number is ignored rather than failing the request
+    if value is None or isinstance(value, bool):
+        return None
+    try:
+        minutes = float(value)
+    except (TypeError, ValueError):
+        print(f"[WARN] Ignoring max_time_minutes {value!r}: not a number")
+        return None
+    if minutes != minutes:
+        print(f"[WARN] Ignoring max_time_minutes {value!r}: not a number")
+        return None
+    # Never below 0, so unknown times (-1) always pass
+    return int(min(max(minutes, 0), MAX_MINUTES))
+
+
+def constraints_for(user_data, request_data):
+    """
+    Hard constraints of a request
+
+    The time budget and meal type always apply. The user's macro levels are
+    preferences, and only become hard constraints when HARD_MACRO_CONSTRAINTS is set.
+    A max_time_minutes that isn't a number is ignored; one below 0 counts as 0.
+
+    Parameters:
+    - user_data: The request's user block
+    - request_data: The request's request block
+
+    Returns:
+    - Dictionary with 'max_minutes' (or None), 'meal_type' (or None) and 'macros' ({column: code})
+    """
+    request_data = request_data or {}
+    meal_type = request_data.get('meal_type')
+
+    macros = {}
+    if os.environ.get('HARD_MACRO_CONSTRAINTS', '').lower() in ('1', 'true', 'yes'):
+        for key, column in MACRO_COLUMNS.items():
+            level = str(((user_data or {}).get('macros') or {}).get(key, '')).lower()
+            if level in RANK_CODES:
+                macros[column] = RANK_CODES[level]
+
+    return {
+        'max_minutes': _max_minutes(request_data.get('max_time_minutes')),
+        'meal_type': meal_type if meal_type in MEAL_TYPE_BITS else None,
+        'macros': macros
+    }
+
+
+def constraint_mask(columns, constraints):
+    """
+    Rows of the catalog that satisfy the constraints, as one boolean array
+
+    Parameters:
+    - columns: Dictionary of typed columns (see COLUMN_DTYPES), arrays or memory maps
+    - constraints: Output of constraints_for
+
+    Returns:
+    - Boolean NumPy array with one entry per catalog row
+    """
+    mask = np.ones(len(columns['total_minutes']), dtype=bool)
+    if constraints['max_minutes'] is not None:
+        mask &= columns['total_minutes'] <= constraints['max_minutes']
+    if constraints['meal_type'] is not None:
+        mask &= (columns['meal_types'] & MEAL_TYPE_BITS[constraints['meal_type']]) != 0
+    for column, code in constraints['macros'].items():
+        values = columns[column]
+        mask &= (values == code) | (values == UNKNOWN_RANK)
+    return mask
+
+
+def pinecone_filter(constraints):
+    """
+    The same constraints as a Pinecone metadata filter
+
+    Parameters:
+    - constraints: Output of constraints_for
+
+    Returns:
+    - Filter dictionary, or None when there is nothing to filter on
+    """
+    clauses = []
+    if constraints['max_minutes'] is not None:
+        clauses.append({"total_minutes": {"$lte": constraints['max_minutes']}})
+    if constraints['meal_type'] is not None:
+        clauses.append({"meal_types": {"$in": [constraints['meal_type']]}})
+    for column, code in constraints['macros'].items():
+        clauses.append({column: {"$in": [code, UNKNOWN_RANK]}})
+
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+def meal_type_names(bits):
+    return [meal_type for meal_type in MEAL_TYPES if bits & MEAL_TYPE_BITS[meal_type]]
+
+
+def metadata_fields(columns, row):
+    """
+    Typed Pinecone metadata for one catalog row, matching pinecone_filter
+
+    Parameters:
+    - columns: Dictionary of typed columns
+    - row: Catalog row
+
+    Returns:
+    - Dictionary to merge into the vector's metadata
+    """
+    return {
+        "total_minutes": int(columns["total_minutes"][row]),
+        # Pinecone has no bitwise operators, so the bitmask becomes a list for $in
+        "meal_types": meal_type_names(int(columns["meal_types"][row])),
+        "protein_rank": int(columns["protein_rank"][row]),
+        "fat_rank": int(columns["fat_rank"][row]),
+        "carb_rank": int(columns["carb_rank"][row])
+    }
+
+
+def benchmark_constraint_masks(rows=500000, iterations=50, seed=0):
+    """
+    Compares the vectorized mask with per-recipe filtering over metadata dicts
+
+    Columns are synthetic, with the same dtypes and value ranges as the catalog's.
+
+    Parameters:
+    - rows: Catalog size
+    - iterations: Timed mask computations
+
+    Returns:
+    - Dictionary of latencies in milliseconds and the share of rows kept
+    """
+    rng = np.random.default_rng(seed)
+    columns = {
+        "total_minutes": rng.integers(UNKNOWN_MINUTES, 240, size=rows).astype(np.int16),
+        "meal_types": rng.integers(1, ALL_MEAL_TYPES + 1, size=rows).astype(np.uint8),
+        "protein_rank": rng.integers(0, 3, size=rows).astype(np.uint8),
+        "fat_rank": rng.integers(0, 3, size=rows).astype(np.uint8),
+        "carb_rank": rng.integers(0, 3, size=rows).astype(np.uint8)
+    }
+    constraints = {'max_minutes': 30, 'meal_type': "Dinner", 'macros': {"protein_rank": RANK_CODES["high"]}}
+
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        mask = constraint_mask(columns, constraints)
+        timings.append((time.perf_counter() - start) * 1000)
+    timings = np.array(timings)
+
+    # What filtering the metadata dicts of the same rows one by one costs
+    dicts = [metadata_fields(columns, row) for row in range(rows)]
+    start = time.perf_counter()
+    kept = [
+        d for d in dicts
+        if d["total_minutes"] <= 30 and "Dinner" in d["meal_types"]
+        and d["protein_rank"] in (RANK_CODES["high"], UNKNOWN_RANK)
+    ]
+    per_dict_ms = (time.perf_counter() - start) * 1000
+    assert len(kept) == int(mask.sum())
+
+    return {
+        "rows": rows,
+        "kept_fraction": float(mask.mean()),
+        "mask_p50_ms": float(np.percentile(timings, 50)),
+        "mask_p95_ms": float(np.percentile(timings, 95)),
+        "per_dict_ms": per_dict_ms,
+        "column_bytes": int(sum(column.nbytes for column in columns.values()))
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Latency benchmark for vectorized constraint masks")
+    parser.add_argument("--rows", type=int, default=500000)
+    parser.add_argument("--iterations", type=int, default=50)
+    args = parser.parse_args()
+
+    print(json.dumps(benchmark_constraint_masks(args.rows, args.iterations), indent=2))
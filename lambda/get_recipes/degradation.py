@@ -0,0 +1,233 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from urllib.parse import urlparse
+
+import boto3
+
+from async_pipeline import DeadlineExceeded
+
+# Time kept back from every stage so the handler can still build a response
+DEFAULT_RESERVE_MS = 300
+
+# Budget used when there is no Lambda context (local runs)
+DEFAULT_BUDGET_MS = 10000
+
+# Top-rated recipes published by embed.py
+DEFAULT_POPULAR_RECIPES_S3_URI = "s3://cs401r-mlops-final/popular-recipes/popular_recipes.json"
+
+# Remote calls run here so a stuck call can be abandoned at its deadline
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="deadline")
+
+# Last embedding seen for each query string, bounded
+_embedding_cache = OrderedDict()
+_embedding_cache_lock = threading.Lock()
+EMBEDDING_CACHE_SIZE = 512
+
+_popular_recipes = None
+_popular_lock = threading.Lock()
+# At most one background load at a time, and none for a while after one failed
+_popular_loader = None
+_popular_failed_at = None
+_popular_loader_lock = threading.Lock()
+
+
+def _env_ms(name, default):
+    return float(os.environ.get(name, default))
+
+
+# Degradation thresholds on the remaining budget, in milliseconds
+SKIP_OPTIONAL_BELOW_MS = _env_ms('DEGRADE_SKIP_OPTIONAL_MS', 1500)
+EMBED_MIN_MS = _env_ms('DEGRADE_EMBED_MIN_MS', 800)
+FULL_SEARCH_MIN_MS = _env_ms('DEGRADE_FULL_SEARCH_MS', 1000)
+SEARCH_MIN_MS = _env_ms('DEGRADE_SEARCH_MIN_MS', 400)
+DEGRADED_TOP_K = int(os.environ.get('DEGRADED_TOP_K', '3'))
+
+
+class RequestBudget:
+    """
+    Remaining time for one request, taken from the Lambda context
+    """
+
+    def __init__(self, context=None, reserve_ms=None, default_ms=DEFAULT_BUDGET_MS):
+        """
+        Parameters:
+        - context: Lambda context object (or None for local runs)
+        - reserve_ms: Time held back for building the response
+        - default_ms: Total budget when context is None
+        """
+        self.context = context if hasattr(context, 'get_remaining_time_in_millis') else None
+        self.reserve_ms = reserve_ms if reserve_ms is not None else _env_ms('DEADLINE_RESERVE_MS', DEFAULT_RESERVE_MS)
+        self._local_deadline = time.monotonic() + default_ms / 1000.0
+
+    def remaining_ms(self):
+        """
+        Milliseconds left for work, after the reserve
+        """
+        if self.context is not None:
+            remaining = self.context.get_remaining_time_in_millis()
+        else:
+            remaining = (self._local_deadline - time.monotonic()) * 1000
+        return max(0.0, remaining - self.reserve_ms)
+
+    def stage_timeout(self, stage_max_ms, keep_ms=0):
+        """
+        Deadline in seconds for a stage: its own cap or whatever budget is left, if smaller
+
+        keep_ms is left over for the stages that still have to run after this one.
+        """
+        return max(0.0, min(stage_max_ms, self.remaining_ms() - keep_ms)) / 1000.0
+
+
+class Degradation:
+    """
+    Records which degradation steps a request took
+    """
+
+    def __init__(self):
+        self.reasons = []
+
+    def add(self, reason):
+        print(f"[WARN] Degrading request: {reason}")
+        self.reasons.append(reason)
+
+    @property
+    def degraded(self):
+        return bool(self.reasons)
+
+    @property
+    def reason(self):
+        return "; ".join(self.reasons) if self.reasons else None
+
+
+def run_with_deadline(stage, fn, *args, timeout, executor=None):
+    """
+    Runs a blocking call on the deadline pool (or executor, if given),
+    abandoning it after timeout seconds
+
+    Returns:
+    - fn's return value
+    """
+    if timeout <= 0:
+        raise DeadlineExceeded(stage, 0)
+    future = (executor or _executor).submit(fn, *args)
+    try:
+        return future.result(timeout=timeout)
+    except FutureTimeoutError:
+        future.cancel()
+        raise DeadlineExceeded(stage, timeout)
+
+
+def remember_embedding(query_string, embedding):
+    with _embedding_cache_lock:
+        _embedding_cache[query_string] = embedding
+        _embedding_cache.move_to_end(query_string)
+        while len(_embedding_cache) > EMBEDDING_CACHE_SIZE:
+            _embedding_cache.popitem(last=False)
+
+
+def last_known_embedding(query_string):
+    """
+    Returns the last embedding computed for this query string in this container, if any
+    """
+    with _embedding_cache_lock:
+        return _embedding_cache.get(query_string)
+
+
+def load_popular_recipes():
+    """
+    Loads the precomputed popular recipes once per container
+
+    Each entry has the same shape as a Pinecone match: id, score and metadata.
+    POPULAR_RECIPES_S3_URI may also be a local path (local_stack uses one).
+    """
+    global _popular_recipes, _popular_failed_at
+    with _popular_lock:
+        if _popular_recipes is not None:
+            return _popular_recipes
+
+        s3_uri = os.environ.get('POPULAR_RECIPES_S3_URI', DEFAULT_POPULAR_RECIPES_S3_URI)
+        try:
+            parsed = urlparse(s3_uri)
+            if parsed.scheme == 's3':
+                body = boto3.client('s3').get_object(Bucket=parsed.netloc, Key=parsed.path.lstrip('/'))['Body'].read()
+            else:
+                with open(s3_uri, 'rb') as f:
+                    body = f.read()
+            _popular_recipes = json.loads(body.decode('utf-8'))
+        except Exception as e:
+            print(f"[WARN] Could not load popular recipes: {e}")
+            _popular_failed_at = time.monotonic()
+            return []
+
+        print(f"[INFO] Loaded {len(_popular_recipes)} popular recipes")
+        return _popular_recipes
+
+
+def prefetch_popular_recipes():
+    """
+    Loads the popular recipes in the background so a low-budget request never waits on S3
+
+    Called on every request, so it starts no load while one is running, and
+    none for POPULAR_RETRY_SECONDS (default 60) after one failed.
+    """
+    global _popular_loader
+    if _popular_recipes is not None:
+        return
+    with _popular_loader_lock:
+        if _popular_loader is not None and _popular_loader.is_alive():
+            return
+        retry_s = float(os.environ.get('POPULAR_RETRY_SECONDS', '60'))
+        if _popular_failed_at is not None and time.monotonic() - _popular_failed_at < retry_s:
+            return
+        _popular_loader = threading.Thread(target=load_popular_recipes, daemon=True, name="popular-recipes")
+        _popular_loader.start()
+
+
+def popular_fallback(allergies, dislikes, filter_fn, top_k=None):
+    """
+    Popular recipes filtered for the user's allergies and dislikes
+
+    Returns an empty list rather than blocking when the prefetch hasn't finished.
+    """
+    if _popular_recipes is None:
+        print("[WARN] Popular recipes not loaded yet")
+        return []
+    top_k = top_k or int(os.environ.get('PINECONE_TOP_K', '5'))
+    return filter_fn(_popular_recipes, allergies, dislikes)[:top_k]
+
+
+def embedding_fallback(query_string, degradation, why):
+    """
+    Falls back to the last-known embedding for the query, recording the step taken
+
+    Returns:
+    - The cached embedding, or None when the caller must serve popular recipes
+    """
+    embedding = last_known_embedding(query_string)
+    if embedding is not None:
+        degradation.add(f"{why}; served last-known embedding")
+    else:
+        degradation.add(f"{why}; no cached embedding")
+    return embedding
+
+
+def search_plan(budget, degradation):
+    """
+    Decides how much search the remaining budget allows
+
+    Returns:
+    - (run_search, top_k): top_k is None for the normal candidate count
+    """
+    remaining = budget.remaining_ms()
+    if remaining < SEARCH_MIN_MS:
+        degradation.add(f"{remaining:.0f} ms left, skipped vector search")
+        return False, None
+    if remaining < FULL_SEARCH_MIN_MS:
+        degradation.add(f"{remaining:.0f} ms left, reduced candidate set to {DEGRADED_TOP_K}")
+        return True, DEGRADED_TOP_K
+    return True, None
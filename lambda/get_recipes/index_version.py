@@ -0,0 +1,55 @@
+import json
+import os
+import threading
+import time
+from urllib.parse import urlparse
+
+import boto3
+
+# Pointer object written by embed.py each time it publishes a new index version
+DEFAULT_INDEX_VERSION_S3_URI = "s3://cs401r-mlops-final/index-metadata/active_index.json"
+
+_cached_pointer = None
+_cached_at = 0.0
+_lock = threading.Lock()
+
+
+def get_active_index_version():
+    """
+    Returns the active index version pointer, re-read from S3 at most once per TTL
+
+    Configuration (environment variables):
+    - INDEX_VERSION_S3_URI: Location of the pointer object
+    - INDEX_VERSION_FILE: Local pointer file, read instead of S3 (local serving)
+    - INDEX_VERSION_TTL_SECONDS: How long a read is trusted (default 60)
+
+    Returns:
+    - Dictionary with at least 'version'; {'version': 'unknown'} if the pointer can't be read
+    """
+    global _cached_pointer, _cached_at
+    ttl = float(os.environ.get('INDEX_VERSION_TTL_SECONDS', '60'))
+
+    with _lock:
+        if _cached_pointer is not None and time.monotonic() - _cached_at < ttl:
+            return _cached_pointer
+
+        s3_uri = os.environ.get('INDEX_VERSION_S3_URI', DEFAULT_INDEX_VERSION_S3_URI)
+        parsed = urlparse(s3_uri)
+        try:
+            if os.environ.get('INDEX_VERSION_FILE'):
+                with open(os.environ['INDEX_VERSION_FILE']) as f:
+                    pointer = json.load(f)
+            else:
+                obj = boto3.client('s3').get_object(Bucket=parsed.netloc, Key=parsed.path.lstrip('/'))
+                pointer = json.loads(obj['Body'].read().decode('utf-8'))
+        except Exception as e:
+            print(f"[WARN] Could not read index version pointer: {e}")
+            # Keep serving the last pointer we saw rather than flapping to 'unknown'
+            pointer = _cached_pointer or {'version': 'unknown'}
+
+        if _cached_pointer is not None and pointer.get('version') != _cached_pointer.get('version'):
+            print(f"[INFO] Index version changed: {_cached_pointer.get('version')} -> {pointer.get('version')}")
+
+        _cached_pointer = pointer
+        _cached_at = time.monotonic()
+        return pointer
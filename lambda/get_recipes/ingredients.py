@@ -0,0 +1,165 @@
+import time
+
+import numpy as np
+
+
+def normalize_ingredient(name):
+    # Same normalization as data_preprocessing's dictionary build
+    return " ".join(str(name).lower().split())
+
+
+class IngredientIndex:
+    """
+    Catalog ingredients in CSR layout: row i's sorted ingredient ids are
+    indices[indptr[i]:indptr[i + 1]], ids indexing into vocabulary.
+
+    The inverted index (recipes per ingredient) is the same layout transposed,
+    built on first use.
+    """
+
+    def __init__(self, vocabulary, indptr, indices):
+        self.vocabulary = vocabulary
+        self.id_of = {name: i for i, name in enumerate(vocabulary)}
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = indices
+        self.lengths = np.diff(self.indptr)
+        self._postings = None
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def encode(self, names):
+        """
+        Sorted ids of the names found in the dictionary
+
+        Parameters:
+        - names: Ingredient names as the user typed them
+
+        Returns:
+        - Sorted uint32 array; unknown names are dropped
+        """
+        ids = {self.id_of[key] for key in map(normalize_ingredient, names or []) if key in self.id_of}
+        return np.array(sorted(ids), dtype=np.uint32)
+
+    def coverage(self, rows, have_ids):
+        """
+        How much of each recipe the user can cook from what they have
+
+        Parameters:
+        - rows: Catalog rows to score
+        - have_ids: Output of encode()
+
+        Returns:
+        - (coverage, missing): share of each recipe's ingredients the user has
+          (float32) and how many they lack (int64)
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        lengths = self.lengths[rows]
+        if len(have_ids) == 0:
+            return np.zeros(len(rows), dtype=np.float32), lengths
+
+        # Positions of every ingredient of every row, gathered in one pass
+        starts = self.indptr[rows]
+        total = int(lengths.sum())
+        positions = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(total)
+        ids = self.indices[positions]
+
+        # Membership in the sorted have_ids by binary search
+        found = np.searchsorted(have_ids, ids)
+        hit = have_ids[np.minimum(found, len(have_ids) - 1)] == ids
+        matched = np.bincount(np.repeat(np.arange(len(rows)), lengths), weights=hit, minlength=len(rows))
+
+        coverage = (matched / np.maximum(lengths, 1)).astype(np.float32)
+        return coverage, lengths - matched.astype(np.int64)
+
+    def _inverted(self):
+        if self._postings is None:
+            order = np.argsort(self.indices, kind="stable")
+            recipe_rows = np.repeat(np.arange(len(self.lengths), dtype=np.int64), self.lengths)[order]
+            counts = np.bincount(np.asarray(self.indices, dtype=np.int64), minlength=len(self.vocabulary))
+            postings_indptr = np.zeros(len(self.vocabulary) + 1, dtype=np.int64)
+            np.cumsum(counts, out=postings_indptr[1:])
+            self._postings = (postings_indptr, recipe_rows)
+        return self._postings
+
+    def cook_with(self, have_ids, max_missing=0, mask=None):
+        """
+        Recipes the user can cook with what they have, through the inverted index
+
+        Only recipes sharing at least one ingredient with have_ids are touched.
+
+        Parameters:
+        - have_ids: Output of encode()
+        - max_missing: Most ingredients a recipe may lack
+        - mask: Optional boolean array of allowed catalog rows
+
+        Returns:
+        - (rows, coverage, missing), fewest missing first, then highest coverage
+        """
+        postings_indptr, recipe_rows = self._inverted()
+        have_ids = np.asarray(have_ids, dtype=np.int64)
+        if len(have_ids) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int64)
+
+        # Each recipe is counted once per ingredient it shares with the user
+        counts = postings_indptr[have_ids + 1] - postings_indptr[have_ids]
+        positions = np.repeat(postings_indptr[have_ids] - np.cumsum(counts) + counts, counts) + np.arange(int(counts.sum()))
+        matched = np.bincount(recipe_rows[positions], minlength=len(self.lengths))
+
+        missing = self.lengths - matched
+        eligible = (matched > 0) & (missing <= max_missing)
+        if mask is not None:
+            eligible &= mask
+        rows = np.flatnonzero(eligible)
+        coverage = (matched[rows] / self.lengths[rows]).astype(np.float32)
+
+        order = np.lexsort((-coverage, missing[rows]))
+        return rows[order], coverage[order], missing[rows][order]
+
+
+def benchmark_cook_with(recipes=500000, vocabulary=5000, per_recipe=9, pantry=12, iterations=50, seed=0):
+    """
+    Measures pantry search latency over a synthetic catalog
+
+    Ingredient popularity is Zipf-like, as in real recipes.
+
+    Returns:
+    - Dictionary of latency percentiles in milliseconds and the result count
+    """
+    rng = np.random.default_rng(seed)
+    popularity = 1.0 / np.arange(1, vocabulary + 1)
+    popularity /= popularity.sum()
+    per_row = [np.unique(rng.choice(vocabulary, size=per_recipe, p=popularity)) for _ in range(recipes)]
+    indptr = np.zeros(recipes + 1, dtype=np.int64)
+    np.cumsum([len(ids) for ids in per_row], out=indptr[1:])
+    index = IngredientIndex([f"ingredient {i}" for i in range(vocabulary)], indptr, np.concatenate(per_row).astype(np.uint32))
+    index._inverted()
+
+    have = [np.sort(rng.choice(200, size=pantry, replace=False)).astype(np.uint32) for _ in range(iterations)]
+    timings = []
+    results = 0
+    for have_ids in have:
+        start = time.perf_counter()
+        rows, _, _ = index.cook_with(have_ids, max_missing=2)
+        timings.append((time.perf_counter() - start) * 1000)
+        results += len(rows)
+    timings = np.array(timings)
+
+    return {
+        "recipes": recipes,
+        "mean_results": results / iterations,
+        "p50_ms": float(np.percentile(timings, 50)),
+        "p95_ms": float(np.percentile(timings, 95))
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Latency benchmark for the pantry (inverted index) search")
+    parser.add_argument("--recipes", type=int, default=500000)
+    parser.add_argument("--iterations", type=int, default=50)
+    args = parser.parse_args()
+
+    print(json.dumps(benchmark_cook_with(args.recipes, iterations=args.iterations), indent=2))
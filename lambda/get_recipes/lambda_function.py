@@ -1,12 +1,53 @@
+import asyncio
 import json
 import boto3
 import os
 from pinecone import Pinecone
-import re
+import sys
+import time
+
+from admission import Overloaded, priority_of, run_admitted
+from async_pipeline import DeadlineExceeded
+from catalog_store import get_catalog_store
+from constraints import constraints_for, pinecone_filter
+from degradation import (
+    EMBED_MIN_MS,
+    SEARCH_MIN_MS,
+    SKIP_OPTIONAL_BELOW_MS,
+    Degradation,
+    RequestBudget,
+    embedding_fallback,
+    popular_fallback,
+    prefetch_popular_recipes,
+    remember_embedding,
+    run_with_deadline,
+    search_plan
+)
+from index_version import get_active_index_version
+from pagination import candidate_count, get_cursor_store, page_size
+from precomputed import lookup_precomputed
+from profile_store import load_profile, save_profile
+from profile_vectors import compose_query_vector, get_profile_vector_store
+from recommendation import build_profile_string, build_query_string, build_request_string, filterAllergiesAndDislikes
+from rerank import rerank
+from sharded_search import discard_shard_pool, get_shard_pool
+from response_cache import get_response_cache
+
+# metrics is shared with the embedding monitor: build.sh packages it next to
+# this file, and in the repo it lives in monitoring/
+try:
+    from metrics import get_metrics
+except ImportError:
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "monitoring"))
+    from metrics import get_metrics
 
 # Initialize the SageMaker runtime client
 sagemaker_runtime = boto3.client('sagemaker-runtime')
 
+# Pinecone client and index handles, reused across warm invocations
+_pinecone_client = None
+_pinecone_indexes = {}
+
 def lambda_handler(event, context):
     """
     Lambda function that processes recipe recommendation requests
@@ -18,6 +59,28 @@ def lambda_handler(event, context):
     Returns:
     - JSON response with recipe recommendations
     """
+    try:
+        return handle_event(event, context)
+    finally:
+        # A container can be frozen as soon as it returns, so flush every invocation
+        get_metrics().flush()
+
+def handle_event(event, context):
+    """
+    Processes one recommendation request; shared by the Lambda and the HTTP server
+    
+    Metrics are recorded but not flushed; callers flush on their own schedule.
+    
+    Parameters:
+    - event: The input JSON event
+    - context: Lambda context object, or None outside Lambda
+    
+    Returns:
+    - Response dictionary with statusCode, body and headers
+    """
+    # Aggregated in process and flushed by the caller
+    metrics = get_metrics()
+    start = time.perf_counter()
     try:
         print(f"[INFO] Received event: {json.dumps(event)}")
         
@@ -33,40 +96,142 @@ def lambda_handler(event, context):
         print(f"[INFO] Allergies: {allergies}")
         print(f"[INFO] Dislikes : {dislikes}") 
         
-        # Build the query string from user preferences and request
-        query_string = build_query_string(user_data, request_data)
-        print(f"[INFO] Built query string: {query_string}")
+        if event.get('type') == 'similar':
+            # "More like this": a lookup in the precomputed neighbour table, no embed or search
+            recipes = recommend_similar(event.get('recipe_id'), allergies, dislikes)
+            metrics.increment("SimilarRequests")
+            return {
+                'statusCode': 200 if recipes is not None else 404,
+                'body': json.dumps({
+                    'recipes': recipes or [],
+                    'recipe_id': event.get('recipe_id')
+                }),
+                'headers': {
+                    'Content-Type': 'application/json'
+                }
+            }
         
-        # Call the SageMaker endpoint with the query string
-        print("[INFO] Calling SageMaker endpoint...")
-        embedding = call_sagemaker_endpoint(query_string)
-        print(f"[INFO] Received embedding with length: {len(embedding)}")
+        if event.get('cursor'):
+            # Later pages are slices of the list cached with the first page
+            page = get_cursor_store().next_page(event['cursor'], page_size())
+            metrics.increment("PageRequests")
+            if page is None:
+                print(f"[WARN] Cursor {event['cursor']} is unknown or has expired")
+                return {
+                    'statusCode': 410,
+                    'body': json.dumps({'error': 'Cursor has expired, run the search again'}),
+                    'headers': {
+                        'Content-Type': 'application/json'
+                    }
+                }
+            recipes, next_cursor = page
+            metrics.observe("RecipesReturned", len(recipes), unit="Count")
+            return {
+                'statusCode': 200,
+                'body': json.dumps({
+                    'recipes': recipes,
+                    'cursor': next_cursor,
+                    'cached': True,
+                    'precomputed': False,
+                    'degraded': False,
+                    'degraded_reason': None
+                }),
+                'headers': {
+                    'Content-Type': 'application/json'
+                }
+            }
         
-        # Now use Pinecone to find similar recipes
-        print("[INFO] Querying Pinecone...")
-        recipes = query_pinecone(embedding)
-        print(f"[INFO] Received {len(recipes)} recipes from Pinecone")
-
-        # Filter out recipes that contain user allergies or dislikes
-        print("[INFO] Filtering recipes for allergies and dislikes...")
-        recipes = filterAllergiesAndDislikes(recipes, allergies, dislikes)
-        print(f"[INFO] Filtered down to {len(recipes)} recipes after allergy/dislike check")
+        # Every stage works within what is left of the Lambda's time budget
+        budget = RequestBudget(context)
+        degradation = Degradation()
+        prefetch_popular_recipes()
+        print(f"[INFO] Remaining time budget: {budget.remaining_ms():.0f} ms")
+        
+        # Both paths, the reranker and the response cache see the same user block
+        user_data = merge_stored_profile(user_data, budget)
+        
+        pantry = request_data.get('search_mode') == 'pantry'
+        if not pantry and os.environ.get('ASYNC_REQUEST_PATH', '').lower() in ('1', 'true', 'yes'):
+            # Cache lookups, index warm-up and the profile save run concurrently with per-call deadlines
+            print("[INFO] Using async request path...")
+            from async_pipeline import recommend_async
+            recipes, source = asyncio.run(recommend_async(
+                user_data, request_data, budget=budget, degradation=degradation, priority=priority_of(event)
+            ))
+            print(f"[INFO] Async path returned {len(recipes)} recipes")
+        else:
+            # Repeat and profile-only requests are answered from the caches
+            source, recipes = lookup_cached_recipes(user_data, request_data) or (None, None)
+            if source is not None:
+                print(f"[INFO] Serving {len(recipes)} recipes from {source}")
+            elif pantry:
+                # "Cook with what I have" goes through the ingredient index, not the encoder
+                print("[INFO] Using pantry search...")
+                recipes = recommend_from_pantry(user_data, request_data)
+            else:
+                recipes = recommend_with_budget(user_data, request_data, budget, degradation, priority_of(event))
+            # Lets the nightly batch precompute for this profile
+            save_profile(user_data)
+        cached = source == 'cache'
+        precomputed = source == 'precomputed'
+        
+        # Fresh candidate lists are reordered before they are cached and paged;
+        # pantry results are already ordered by what the user has
+        if not cached and not precomputed and not pantry and not degradation.degraded:
+            rerank_start = time.perf_counter()
+            recipes = rerank_candidates(recipes, user_data, request_data)
+            metrics.observe("RerankLatency", (time.perf_counter() - rerank_start) * 1000)
+        
+        # Degraded lists are a stopgap, so they are never cached
+        if not cached and not precomputed and not degradation.degraded:
+            response_cache = get_response_cache()
+            response_cache.set(response_cache.key_for(user_data, request_data), recipes)
+        
+        # The response shows one page; the rest stays behind a cursor
+        recipes, next_cursor = get_cursor_store().first_page(recipes, page_size())
+        
+        metrics.increment("Requests")
+        metrics.increment("ResponseCacheHits" if cached else "ResponseCacheMisses")
+        if degradation.degraded:
+            metrics.increment("DegradedResponses")
+        metrics.observe("RecipesReturned", len(recipes), unit="Count")
         
         return {
             'statusCode': 200,
             'body': json.dumps({
-                'recipes': recipes
+                'recipes': recipes,
+                'cursor': next_cursor,
+                'cached': cached,
+                'precomputed': precomputed,
+                'degraded': degradation.degraded,
+                'degraded_reason': degradation.reason
             }),
             'headers': {
                 'Content-Type': 'application/json'
             }
         }
         
+    except Overloaded as e:
+        # Shed fast so the caller can back off, instead of queueing past the deadline
+        print(f"[WARN] {e}")
+        metrics.increment("ShedResponses", dimensions={"Priority": e.priority})
+        return {
+            'statusCode': 429,
+            'body': json.dumps({
+                'error': 'Recommender is overloaded, retry later',
+                'details': str(e)
+            }),
+            'headers': {
+                'Content-Type': 'application/json',
+                'Retry-After': str(int(e.retry_after_s))
+            }
+        }
     except Exception as e:
         # Log the error and return an error response
         import traceback
         print(f"[ERROR] Error processing request: {str(e)}")
         print(f"[ERROR] Traceback: {traceback.format_exc()}")
+        metrics.increment("Errors")
         return {
             'statusCode': 500,
             'body': json.dumps({
@@ -77,82 +242,294 @@ def lambda_handler(event, context):
                 'Content-Type': 'application/json'
             }
         }
+    finally:
+        metrics.observe("RequestLatency", (time.perf_counter() - start) * 1000)
+
+def merge_stored_profile(user_data, budget):
+    """
+    Fills the profile fields the request didn't send from the user's stored profile
+    
+    The load is optional: it is skipped when the budget is low and abandoned
+    after AUX_TIMEOUT_MS (default 300).
+    
+    Parameters:
+    - user_data: The request's user block
+    - budget: RequestBudget of the request
+    
+    Returns:
+    - The user block with stored fields filled in, or user_data unchanged
+    """
+    if budget.remaining_ms() < SKIP_OPTIONAL_BELOW_MS:
+        return user_data
+    try:
+        profile = run_with_deadline(
+            "load_profile", load_profile, user_data.get('username'),
+            timeout=budget.stage_timeout(float(os.environ.get('AUX_TIMEOUT_MS', '300')))
+        )
+    except Exception as e:
+        print(f"[WARN] Optional stage load_profile skipped: {e}")
+        return user_data
+    if not isinstance(profile, dict):
+        return user_data
+    return {**profile, **user_data}
+
+def lookup_cached_recipes(user_data, request_data):
+    """
+    Looks a request up in the response cache, then in the nightly batch's results
+    
+    The list is deterministic for a given profile, request and index version,
+    and profile-only requests may have been precomputed.
+    
+    Parameters:
+    - user_data: Dictionary containing user information
+    - request_data: Dictionary containing request details
+    
+    Returns:
+    - ('cache' or 'precomputed', recipes), or None on a miss
+    """
+    response_cache = get_response_cache()
+    recipes = response_cache.get(response_cache.key_for(user_data, request_data))
+    if recipes is not None:
+        return 'cache', recipes
+    recipes = lookup_precomputed(user_data, request_data)
+    if recipes is not None:
+        return 'precomputed', recipes
+    return None
+
+def recommend_with_budget(user_data, request_data, budget, degradation, priority="interactive"):
+    """
+    Runs the embed -> search -> filter pipeline within the request's time budget
+    
+    When the budget runs low the request degrades in steps: a last-known
+    embedding instead of a fresh one, a smaller candidate set, and finally
+    precomputed popular recipes filtered for the user. With admission control
+    on, an interactive request shed by a dependency degrades the same way; a
+    batch request is rejected with Overloaded.
+    
+    Parameters:
+    - user_data: Dictionary containing user information
+    - request_data: Dictionary containing request details
+    - budget: RequestBudget for this invocation
+    - degradation: Degradation that records any steps taken
+    - priority: 'interactive' or 'batch'
+    
+    Returns:
+    - List of filtered recipe matches
+    """
+    allergies = [s.lower() for s in user_data.get("allergies", [])]
+    dislikes  = [s.lower() for s in user_data.get("dislikes",  [])]
+    
+    # Build the query string from user preferences and request
+    query_string = build_query_string(user_data, request_data)
+    print(f"[INFO] Built query string: {query_string}")
+    
+    # Embed the query string with the configured encoder
+    if budget.remaining_ms() < EMBED_MIN_MS:
+        embedding = embedding_fallback(query_string, degradation, f"{budget.remaining_ms():.0f} ms left, skipped embedding")
+    else:
+        try:
+            embedding = run_admitted(
+                "embed", embed_request, user_data, request_data, priority=priority, budget=budget,
+                stage_max_ms=float(os.environ.get('EMBED_TIMEOUT_MS', '2000')), keep_ms=SEARCH_MIN_MS
+            )
+            remember_embedding(query_string, embedding)
+            print(f"[INFO] Received embedding with length: {len(embedding)}")
+        except Overloaded as e:
+            if priority == "batch":
+                raise
+            embedding = embedding_fallback(query_string, degradation, str(e))
+        except DeadlineExceeded as e:
+            embedding = embedding_fallback(query_string, degradation, str(e))
+    
+    if embedding is None:
+        degradation.add("served popular recipes")
+        return popular_fallback(allergies, dislikes, filterAllergiesAndDislikes)
+    
+    # Now use Pinecone to find similar recipes
+    run_search, top_k = search_plan(budget, degradation)
+    recipes = None
+    if run_search:
+        print("[INFO] Searching the index...")
+        try:
+            recipes = run_admitted(
+                "search", search_index, embedding, top_k, constraints_for(user_data, request_data),
+                priority=priority, budget=budget, stage_max_ms=float(os.environ.get('SEARCH_TIMEOUT_MS', '2000'))
+            )
+            print(f"[INFO] Received {len(recipes)} recipes from the index")
+        except Overloaded as e:
+            if priority == "batch":
+                raise
+            degradation.add(str(e))
+        except DeadlineExceeded as e:
+            degradation.add(str(e))
+    
+    if recipes is None:
+        degradation.add("served popular recipes")
+        return popular_fallback(allergies, dislikes, filterAllergiesAndDislikes)
+    
+    # Filter out recipes that contain user allergies or dislikes
+    print("[INFO] Filtering recipes for allergies and dislikes...")
+    recipes = filterAllergiesAndDislikes(recipes, allergies, dislikes)
+    print(f"[INFO] Filtered down to {len(recipes)} recipes after allergy/dislike check")
+    return recipes
+
+def rerank_candidates(recipes, user_data, request_data):
+    """
+    Reorders filtered candidates by similarity blended with rating, ingredient
+    coverage and macro match
+    
+    Configuration (environment variables):
+    - RERANK: Enable the rerank stage
+    - RERANK_WEIGHTS: JSON object overriding rerank.DEFAULT_WEIGHTS
+    
+    Parameters:
+    - recipes: Filtered candidate matches, best similarity first
+    - user_data: Dictionary containing user information
+    - request_data: Dictionary containing request details
+    
+    Returns:
+    - Reordered list, or recipes unchanged if reranking is off or fails
+    """
+    if os.environ.get('RERANK', '').lower() not in ('1', 'true', 'yes'):
+        return recipes
+    try:
+        return rerank(recipes, user_data, request_data, get_catalog_store())
+    except Exception as e:
+        # Catalog versions built before the feature columns can't be reranked
+        print(f"[WARN] Rerank skipped: {e}")
+        return recipes
 
-def build_query_string(user_data, request_data):
+def recommend_from_pantry(user_data, request_data):
     """
-    Builds a query string from user data and request data
+    Recipes the user can cook with their ingredients, fewest missing first
+    
+    Uses the catalog's ingredient inverted index instead of the embedding
+    search, with the request's hard constraints applied as a row mask.
+    
+    Configuration (environment variables):
+    - PANTRY_MAX_MISSING: Most ingredients a recipe may lack (default 2)
     
     Parameters:
     - user_data: Dictionary containing user information
     - request_data: Dictionary containing request details
     
     Returns:
-    - String containing all relevant information for the model
-    """
-    print("[INFO] Building query string...")
-    query_parts = []
-    
-    # Add macros information
-    macros = user_data.get('macros', {})
-    print(f"[INFO] Macros: {json.dumps(macros)}")
-    if macros:
-        for macro_type, level in macros.items():
-            query_parts.append(f"{level} {macro_type}")
-    
-    # Add available ingredients
-    ingredients = request_data.get('ingredients_available', [])
-    print(f"[INFO] Ingredients: {json.dumps(ingredients)}")
-    if ingredients:
-        query_parts.extend(ingredients)
-    
-    # Add user likes
-    likes = user_data.get('likes', [])
-    print(f"[INFO] Likes: {json.dumps(likes)}")
-    if likes:
-        query_parts.extend(likes)
-    
-    # Add user dislikes (prefixed with "no")
-    dislikes = user_data.get('dislikes', [])
-    print(f"[INFO] Dislikes: {json.dumps(dislikes)}")
-    if dislikes:
-        query_parts.extend([f"no {item}" for item in dislikes])
-    
-    # Add user allergies (prefixed with "allergy")
-    allergies = user_data.get('allergies', [])
-    print(f"[INFO] Allergies: {json.dumps(allergies)}")
-    if allergies:
-        query_parts.extend([f"allergy {item}" for item in allergies])
-    
-    # Add max time
-    max_time = request_data.get('max_time_minutes')
-    print(f"[INFO] Max time: {max_time}")
-    if max_time:
-        query_parts.append(f"max_time {max_time}")
-    
-    # Add meal type
-    meal_type = request_data.get('meal_type')
-    print(f"[INFO] Meal type: {meal_type}")
-    if meal_type:
-        query_parts.append(meal_type)
-    
-    # Add spice level
-    preferences = request_data.get('preferences', {})
-    print(f"[INFO] Preferences: {json.dumps(preferences)}")
-    spice_level = preferences.get('spice_level')
-    print(f"[INFO] Spice level: {spice_level}")
-    if spice_level:
-        query_parts.append(f"spice {spice_level}")
-    
-    # Add diet type
-    diet_type = preferences.get('diet_type')
-    print(f"[INFO] Diet type: {diet_type}")
-    if diet_type:
-        query_parts.append(diet_type)
-    
-    # Join all parts with spaces
-    result = " ".join(query_parts)
-    print(f"[INFO] Final query string: {result}")
-    return result
+    - List of filtered recipe matches; 'score' is the ingredient coverage and
+      'missing_ingredients' the number the user lacks
+    """
+    allergies = [s.lower() for s in user_data.get("allergies", [])]
+    dislikes  = [s.lower() for s in user_data.get("dislikes",  [])]
+    
+    catalog = get_catalog_store()
+    index = catalog.ingredient_index()
+    have_ids = index.encode(request_data.get('ingredients_available'))
+    print(f"[INFO] {len(have_ids)} of {len(request_data.get('ingredients_available') or [])} ingredients are in the dictionary")
+    
+    mask = None
+    if get_active_index_version().get('constraint_columns'):
+        mask = catalog.constraint_mask(constraints_for(user_data, request_data))
+    
+    rows, coverage, missing = index.cook_with(have_ids, int(os.environ.get('PANTRY_MAX_MISSING', '2')), mask)
+    print(f"[INFO] Pantry search found {len(rows)} recipes")
+    
+    # Allergy filtering is per recipe, so only look at a few pages' worth
+    limit = candidate_count()
+    matches = [
+        {**catalog.match(row, row_coverage), 'missing_ingredients': int(row_missing)}
+        for row, row_coverage, row_missing in zip(rows[:4 * limit], coverage, missing)
+    ]
+    return filterAllergiesAndDislikes(matches, allergies, dislikes)[:limit]
+
+def recommend_similar(recipe_id, allergies, dislikes):
+    """
+    Returns the recipes most similar to recipe_id that are safe for the user
+    
+    Parameters:
+    - recipe_id: Recipe the user asked for more of
+    - allergies: Lowercased allergies to filter out
+    - dislikes: Lowercased dislikes to filter out
+    
+    Returns:
+    - List of filtered recipe matches, or None if the recipe is unknown
+    """
+    top_k = int(os.environ.get('SIMILAR_TOP_K', '10'))
+    matches = get_catalog_store().similar(recipe_id)
+    if matches is None:
+        print(f"[WARN] Recipe {recipe_id} is not in the active catalog")
+        return None
+    
+    recipes = filterAllergiesAndDislikes(matches, allergies, dislikes)
+    print(f"[INFO] {len(recipes)} of {len(matches)} neighbours of {recipe_id} pass the allergy/dislike check")
+    return recipes[:top_k]
+
+def embed_request(user_data, request_data):
+    """
+    Embeds a request, composing a cached profile vector with a short request
+    vector when COMPOSED_QUERY_VECTORS is set
+    
+    Configuration (environment variables):
+    - COMPOSED_QUERY_VECTORS: Enable profile/request composition
+    - PROFILE_VECTOR_WEIGHT: Share of the profile in the query (default 0.5)
+    
+    Parameters:
+    - user_data: Dictionary containing user information
+    - request_data: Dictionary containing request details
+    
+    Returns:
+    - Embedding vector as a list of floats
+    """
+    if os.environ.get('COMPOSED_QUERY_VECTORS', '').lower() not in ('1', 'true', 'yes'):
+        return embed_query(build_query_string(user_data, request_data))
+    
+    profile_string = build_profile_string(user_data)
+    request_string = build_request_string(request_data)
+    print(f"[INFO] Profile string: {profile_string}")
+    print(f"[INFO] Request string: {request_string}")
+    
+    profile_vector = None
+    if profile_string:
+        profile_vector = get_profile_vector_store().get_or_compute(user_data, profile_string, embed_query)
+    request_vector = embed_query(request_string) if request_string else None
+    
+    return compose_query_vector(
+        profile_vector,
+        request_vector,
+        float(os.environ.get('PROFILE_VECTOR_WEIGHT', '0.5'))
+    )
+
+def embed_query(query_string):
+    """
+    Embeds the query string with the encoder selected by EMBEDDING_BACKEND
+    
+    Parameters:
+    - query_string: The formatted query string
+    
+    Returns:
+    - Embedding vector as a list of floats
+    """
+    backend = os.environ.get('EMBEDDING_BACKEND', 'sagemaker').lower()
+    print(f"[INFO] Embedding backend: {backend}")
+    
+    if backend == 'onnx':
+        # Imported lazily so the SageMaker path doesn't need onnxruntime
+        from onnx_encoder import get_encoder
+        return get_encoder().encode([query_string])[0].tolist()
+    
+    if backend == 'stub':
+        # Local stand-in: deterministic vectors, no endpoint
+        from async_pipeline import stub_embed
+        return stub_embed(query_string, int(os.environ.get('STUB_EMBEDDING_DIM', '384')))
+    
+    if backend != 'sagemaker':
+        raise ValueError(f"Unknown EMBEDDING_BACKEND: {backend}")
+    
+    if os.environ.get('EMBEDDING_MICROBATCH', '').lower() in ('1', 'true', 'yes'):
+        # Long-running servers coalesce concurrent queries into one endpoint call
+        from batching import get_batcher
+        return get_batcher().embed(query_string)
+    
+    print("[INFO] Calling SageMaker endpoint...")
+    return call_sagemaker_endpoint(query_string)
 
 def call_sagemaker_endpoint(query_string):
     """
@@ -212,25 +589,74 @@ def call_sagemaker_endpoint(query_string):
         raise ValueError("Unexpected embedding data structure: first element empty or not a list")
     
     # Take the average of all token embeddings
-    embedding_sum = [sum(x) for x in zip(*embedding_data[0])]
-    embedding_vector = [x / len(embedding_data[0]) for x in embedding_sum]
+    embedding_vector = _mean_token_embedding(embedding_data[0])
     print(f"[INFO] Extracted embedding vector length: {len(embedding_vector) if embedding_vector else 'N/A'}")
     
     return embedding_vector
 
-def query_pinecone(embedding_vector):
+def call_sagemaker_endpoint_batch(query_strings):
     """
-    Queries Pinecone to find recipes with similar embeddings
+    Calls the SageMaker endpoint once for several query strings
     
     Parameters:
-    - embedding_vector: The embedding vector from SageMaker
+    - query_strings: List of formatted query strings
     
     Returns:
-    - List of recipe objects from Pinecone
+    - List of embedding vectors, in the same order as query_strings
     """
+    endpoint_name = os.environ.get('SAGEMAKER_ENDPOINT_NAME')
+    if not endpoint_name:
+        raise ValueError("SAGEMAKER_ENDPOINT_NAME environment variable is not set")
+    
+    print(f"[INFO] Invoking SageMaker endpoint with batch of {len(query_strings)}...")
+    response = sagemaker_runtime.invoke_endpoint(
+        EndpointName=endpoint_name,
+        ContentType='application/json',
+        Body=json.dumps({"inputs": list(query_strings)})
+    )
+    embedding_data = json.loads(response['Body'].read().decode('utf-8'))
+    
+    if not isinstance(embedding_data, list) or len(embedding_data) != len(query_strings):
+        raise ValueError("Unexpected embedding data structure: batch size mismatch")
+    
+    embeddings = []
+    for item in embedding_data:
+        # Each item is [tokens x dim], or [[tokens x dim]] when the endpoint keeps the batch axis
+        if item and isinstance(item[0], list) and item[0] and isinstance(item[0][0], list):
+            item = item[0]
+        if not item or not isinstance(item, list):
+            raise ValueError("Unexpected embedding data structure: empty item in batch")
+        embeddings.append(_mean_token_embedding(item))
+    
+    return embeddings
+
+def _mean_token_embedding(token_embeddings):
+    """
+    Averages a list of token embeddings into a single vector
+    """
+    embedding_sum = [sum(x) for x in zip(*token_embeddings)]
+    return [x / len(token_embeddings) for x in embedding_sum]
+
+def get_pinecone_index(index_name=None):
+    """
+    Returns a Pinecone index handle, connecting on first use
+    
+    Handles are cached at module level so warm containers skip client setup.
+    
+    Parameters:
+    - index_name: Index to connect to (defaults to the active version's index)
+    
+    Returns:
+    - Pinecone Index object
+    """
+    global _pinecone_client
+    if index_name is None:
+        index_name = get_active_index_version().get('index_name') or os.environ.get('PINECONE_INDEX_NAME')
+    if index_name in _pinecone_indexes:
+        return _pinecone_indexes[index_name]
+    
     # Initialize Pinecone client
     pinecone_api_key = os.environ.get('PINECONE_API_KEY')
-    index_name = os.environ.get('PINECONE_INDEX_NAME')
     
     print(f"[INFO] Pinecone API key exists: {bool(pinecone_api_key)}")
     print(f"[INFO] Pinecone index name: {index_name}")
@@ -239,22 +665,100 @@ def query_pinecone(embedding_vector):
         raise ValueError("One or more Pinecone environment variables are not set")
     
     # Initialize Pinecone
-    print("[INFO] Initializing Pinecone client...")
-    pc = Pinecone(api_key=pinecone_api_key)
+    if _pinecone_client is None:
+        print("[INFO] Initializing Pinecone client...")
+        _pinecone_client = Pinecone(api_key=pinecone_api_key)
     
     # Connect to the index
     print(f"[INFO] Connecting to Pinecone index: {index_name}")
-    index = pc.Index(index_name)
+    _pinecone_indexes[index_name] = _pinecone_client.Index(index_name)
+    return _pinecone_indexes[index_name]
+
+def search_index(embedding_vector, top_k=None, constraints=None):
+    """
+    Finds the recipes nearest to the embedding in the store selected by SEARCH_BACKEND
+    
+    'pinecone' (default) queries the active Pinecone namespace; 'catalog'
+    scans the active catalog version's memory-mapped embeddings, for local
+    serving without the remote store, split over SEARCH_SHARDS worker
+    processes when that is more than 1.
+    
+    Parameters:
+    - embedding_vector: The query embedding
+    - top_k: Number of matches to return (defaults to the paginated candidate count)
+    - constraints: Hard constraints from constraints_for, or None
+    
+    Returns:
+    - List of recipe matches, best first
+    """
+    backend = os.environ.get('SEARCH_BACKEND', 'pinecone').lower()
+    if backend == 'catalog':
+        catalog = get_catalog_store()
+        top_k = top_k or candidate_count()
+        if not get_active_index_version().get('constraint_columns'):
+            constraints = None
+        shard_pool = get_shard_pool(catalog)
+        if shard_pool is not None:
+            try:
+                return [catalog.match(row, score) for row, score in shard_pool.search(embedding_vector, top_k, constraints)]
+            except Exception as e:
+                print(f"[WARN] Sharded search failed, scanning in process: {e}")
+                if shard_pool.broken:
+                    # Restarted on the next search instead of failing every one
+                    discard_shard_pool(shard_pool)
+        mask = catalog.constraint_mask(constraints) if constraints else None
+        return catalog.search(embedding_vector, top_k, mask)
+    
+    if backend != 'pinecone':
+        raise ValueError(f"Unknown SEARCH_BACKEND: {backend}")
+    return query_pinecone(embedding_vector, top_k, pinecone_filter(constraints) if constraints else None)
+
+def warm_search_index():
+    """
+    Opens the search backend ahead of the first query: the Pinecone index
+    handle, or the catalog's memory-mapped embeddings
+    """
+    if os.environ.get('SEARCH_BACKEND', 'pinecone').lower() == 'catalog':
+        catalog = get_catalog_store()
+        return get_shard_pool(catalog) or catalog.embedding_norms()
+    return get_pinecone_index()
+
+def query_pinecone(embedding_vector, top_k=None, metadata_filter=None):
+    """
+    Queries Pinecone to find recipes with similar embeddings
+    
+    Parameters:
+    - embedding_vector: The embedding vector from SageMaker
+    - top_k: Number of matches to return (defaults to the paginated candidate count)
+    - metadata_filter: Hard constraints as a Pinecone filter (see constraints.pinecone_filter)
+    
+    Returns:
+    - List of recipe objects from Pinecone
+    """
+    # Query whichever index version is active; a rebuild flips this pointer atomically
+    active = get_active_index_version()
+    index = get_pinecone_index(active.get('index_name') or os.environ.get('PINECONE_INDEX_NAME'))
+    namespace = active.get('namespace', '')
+    print(f"[INFO] Active index version: {active.get('version')} (namespace '{namespace}')")
     
     # Perform the query
-    top_k = int(os.environ.get('PINECONE_TOP_K', '5'))  # Default to 5 results if not specified
+    if top_k is None:
+        top_k = candidate_count()  # Several pages' worth, served through cursors
     print(f"[INFO] Querying Pinecone with top_k: {top_k}")
     
+    # Versions built before the typed constraint metadata would match nothing
+    query_args = {}
+    if metadata_filter and active.get('constraint_columns'):
+        query_args['filter'] = metadata_filter
+        print(f"[INFO] Metadata filter: {json.dumps(metadata_filter)}")
+    
     query_response = index.query(
         vector=embedding_vector,
         top_k=top_k,
+        namespace=namespace,
         include_values=True,
-        include_metadata=True
+        include_metadata=True,
+        **query_args
     )
     
     print(f"[INFO] Pinecone query response received")
@@ -279,46 +783,3 @@ def query_pinecone(embedding_vector):
     
     print(f"[INFO] Returning {len(recipes)} recipes")
     return recipes
-
-def filterAllergiesAndDislikes(
-    matches: list,
-    allergies: list[str] | None = None,
-    dislikes:  list[str] | None = None
-) -> list:
-    """
-    Returns list of matches that do not contain any allergens or disliked items.
-    """
-    allergies = set(a.lower() for a in (allergies or []))
-    dislikes  = set(d.lower() for d in (dislikes  or []))
-
-    safe_matches = []
-    for m in matches:
-        ing_raw  = m.get("metadata", {}).get("ingredients")
-        ing_set  = set(i.lower() for i in _to_token_list(ing_raw))
-
-        if ing_set & allergies:
-            continue                
-        if ing_set & dislikes:
-            continue               
-
-        safe_matches.append(m)
-
-    return safe_matches
-
-def _to_token_list(raw):
-    """
-    Normalize the 'ingredients' field into a list[str].
-    """
-    if raw is None:
-        return []
-
-    # Already a list?  Good.
-    if isinstance(raw, list):
-        return raw
-
-    # String?  Strip brackets & quotes, then split on commas
-    if isinstance(raw, str):
-        cleaned = re.sub(r"[\[\]\"'()]", "", raw)
-        return [tok.strip() for tok in cleaned.split(",") if tok.strip()]
-
-    return []   # fallback
\ No newline at end of file
@@ -0,0 +1,217 @@
+import asyncio
+import json
+import os
+import time
+
+import numpy as np
+
+from constraints import ALL_MEAL_TYPES, COLUMN_DTYPES
+
+LOCAL_VERSION = "local"
+
+PANTRY = [
+    "beans", "broccoli", "butter", "carrot", "cheese", "chicken", "egg", "flour", "garlic", "milk",
+    "mushroom", "olive oil", "onion", "peanuts", "pepper", "potato", "rice", "salt", "shrimp", "sugar",
+    "tomato", "tofu", "basil", "lemon", "beef", "pasta", "spinach", "yogurt", "honey", "cinnamon"
+]
+
+
+def write_synthetic_catalog(root, rows=10000, dim=384, seed=0):
+    """
+    Writes a catalog version with every file get_recipes reads, plus a local pointer
+
+    Parameters:
+    - root: Catalog directory (CATALOG_DIR); the version goes in root/LOCAL_VERSION
+    - rows: Number of recipes
+    - dim: Embedding dimension (must match STUB_EMBEDDING_DIM)
+
+    Returns:
+    - Path of the pointer file, for INDEX_VERSION_FILE
+    """
+    rng = np.random.default_rng(seed)
+    directory = os.path.join(root, LOCAL_VERSION)
+    os.makedirs(directory, exist_ok=True)
+
+    ingredient_ids = [np.unique(rng.integers(0, len(PANTRY), size=rng.integers(3, 10))) for _ in range(rows)]
+    recipes = [
+        {
+            "id": str(row),
+            "metadata": {
+                "recipe_id": str(row),
+                "recipe_name": f"Synthetic recipe {row}",
+                "ingredients": str([PANTRY[i] for i in ids]),
+                "amounts": str([PANTRY[i] for i in ids]),
+                "units": "4",
+                "instructions": str(["Combine everything.", "Cook until done."]),
+                "cook_time": "0.5",
+                "prep_time": "0.25",
+                "description": "Generated for local serving and load tests"
+            }
+        }
+        for row, ids in enumerate(ingredient_ids)
+    ]
+    with open(os.path.join(directory, "recipes.json"), "w") as f:
+        json.dump(recipes, f)
+
+    np.save(os.path.join(directory, "embeddings.npy"), rng.normal(size=(rows, dim)).astype(np.float32))
+    ratings = rng.uniform(0, 5, size=rows).astype(np.float32)
+    np.save(os.path.join(directory, "feature_rating.npy"), ratings)
+
+    # The degraded path's fallback list, shaped like embed.py's popular_recipes.json
+    with open(os.path.join(root, "popular_recipes.json"), "w") as f:
+        json.dump([
+            {"id": recipes[row]["id"], "score": float(ratings[row]), "metadata": recipes[row]["metadata"]}
+            for row in np.argsort(-ratings)[:100]
+        ], f)
+
+    columns = {
+        "total_minutes": rng.integers(5, 180, size=rows),
+        "meal_types": rng.integers(1, ALL_MEAL_TYPES + 1, size=rows),
+        "protein_rank": rng.integers(0, 3, size=rows),
+        "fat_rank": rng.integers(0, 3, size=rows),
+        "carb_rank": rng.integers(0, 3, size=rows)
+    }
+    for name, dtype in COLUMN_DTYPES.items():
+        np.save(os.path.join(directory, f"constraint_{name}.npy"), columns[name].astype(dtype))
+
+    indptr = np.zeros(rows + 1, dtype=np.uint32)
+    np.cumsum([len(ids) for ids in ingredient_ids], out=indptr[1:])
+    np.save(os.path.join(directory, "ingredient_indptr.npy"), indptr)
+    np.save(os.path.join(directory, "ingredient_indices.npy"), np.concatenate(ingredient_ids).astype(np.uint32))
+    with open(os.path.join(directory, "ingredient_vocabulary.json"), "w") as f:
+        json.dump(PANTRY, f)
+
+    pointer_path = os.path.join(root, "active_index.json")
+    with open(pointer_path, "w") as f:
+        json.dump({"version": LOCAL_VERSION, "model_name": "stub", "vector_count": rows, "constraint_columns": True}, f)
+    print(f"[INFO] Wrote a {rows}-recipe synthetic catalog to {directory}")
+    return pointer_path
+
+
+def local_environment(root, dim=384):
+    """
+    Environment that points get_recipes at local stand-ins: stub embeddings,
+    catalog search, a local pointer and no AWS calls on the request path;
+    metrics are appended to root/metrics.jsonl
+    """
+    return {
+        "CATALOG_DIR": root,
+        "INDEX_VERSION_FILE": os.path.join(root, "active_index.json"),
+        "EMBEDDING_BACKEND": "stub",
+        "STUB_EMBEDDING_DIM": str(dim),
+        "SEARCH_BACKEND": "catalog",
+        "PROFILE_S3_PREFIX": "",
+        "POPULAR_RECIPES_S3_URI": os.path.join(root, "popular_recipes.json"),
+        "METRICS_SINK": "local",
+        "METRICS_LOCAL_FILE": os.path.join(root, "metrics.jsonl"),
+        "AWS_DEFAULT_REGION": os.environ.get("AWS_DEFAULT_REGION", "us-west-2"),
+        "AWS_EC2_METADATA_DISABLED": "true"
+    }
+
+
+async def _client(host, port, path, bodies, latencies, statuses):
+    # One keep-alive connection, requests sent back to back
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for body in bodies:
+            payload = json.dumps(body).encode("utf-8")
+            start = time.perf_counter()
+            writer.write(
+                f"POST {path} HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n"
+                f"Content-Length: {len(payload)}\r\n\r\n".encode("latin-1") + payload
+            )
+            await writer.drain()
+            status_line = await reader.readline()
+            length = 0
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                if name.strip().lower() == "content-length":
+                    length = int(value.strip())
+            await reader.readexactly(length)
+            latencies.append((time.perf_counter() - start) * 1000)
+            statuses.append(int(status_line.split()[1]))
+    finally:
+        writer.close()
+
+
+def sample_events(count, seed=0):
+    """
+    Requests shaped like app.py's, with varied profiles so the response cache doesn't answer them all
+    """
+    rng = np.random.default_rng(seed)
+    meal_types = ["Breakfast", "Lunch", "Dinner", "Snack", "Dessert"]
+    return [
+        {
+            "user": {
+                "username": f"load{i}",
+                "allergies": ["peanuts"],
+                "likes": [PANTRY[j] for j in rng.integers(0, len(PANTRY), size=3)],
+                "dislikes": [],
+                "macros": {"protein": "high", "carbs": "low", "fats": "medium"}
+            },
+            "request": {
+                "ingredients_available": [PANTRY[j] for j in rng.integers(0, len(PANTRY), size=4)],
+                "max_time_minutes": int(rng.integers(15, 120)),
+                "meal_type": meal_types[i % len(meal_types)],
+                "preferences": {"spice_level": "medium", "diet_type": "none"}
+            }
+        }
+        for i in range(count)
+    ]
+
+
+def run_load_test(host="127.0.0.1", port=8080, path="/recommender", concurrency=32, total=2000, seed=0):
+    """
+    Closed-loop load test: concurrency keep-alive connections sharing total requests
+
+    Returns:
+    - Dictionary with throughput, latency percentiles and status counts
+    """
+    events = sample_events(total, seed)
+    latencies, statuses = [], []
+
+    async def run():
+        await asyncio.gather(*(
+            _client(host, port, path, events[i::concurrency], latencies, statuses)
+            for i in range(concurrency)
+        ))
+
+    start = time.perf_counter()
+    asyncio.run(run())
+    elapsed = time.perf_counter() - start
+
+    timings = np.array(latencies)
+    return {
+        "requests": len(latencies),
+        "concurrency": concurrency,
+        "throughput_rps": len(latencies) / elapsed,
+        "p50_ms": float(np.percentile(timings, 50)),
+        "p95_ms": float(np.percentile(timings, 95)),
+        "p99_ms": float(np.percentile(timings, 99)),
+        "statuses": {str(code): statuses.count(code) for code in sorted(set(statuses))}
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Local stand-ins and load tests for the recommender server")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    catalog_parser = subcommands.add_parser("catalog", help="Write a synthetic catalog")
+    catalog_parser.add_argument("--dir", type=str, default="/tmp/local-catalog")
+    catalog_parser.add_argument("--rows", type=int, default=10000)
+    catalog_parser.add_argument("--dim", type=int, default=384)
+    load_parser = subcommands.add_parser("loadtest", help="Drive a running server")
+    load_parser.add_argument("--host", type=str, default="127.0.0.1")
+    load_parser.add_argument("--port", type=int, default=8080)
+    load_parser.add_argument("--concurrency", type=int, default=32)
+    load_parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+
+    if args.command == "catalog":
+        write_synthetic_catalog(args.dir, args.rows, args.dim)
+    else:
+        print(json.dumps(run_load_test(args.host, args.port, concurrency=args.concurrency, total=args.requests), indent=2))
@@ -0,0 +1,207 @@
+import json
+import os
+import time
+from urllib.parse import urlparse
+
+import boto3
+import numpy as np
+import onnxruntime as ort
+from tokenizers import Tokenizer
+
+# Local directory the quantized model is loaded from (downloaded from S3 when missing)
+DEFAULT_MODEL_DIR = "/tmp/onnx-encoder"
+MODEL_FILE = "model.onnx"
+TOKENIZER_FILE = "tokenizer.json"
+
+# The HF feature-extraction endpoint does not truncate, so match BERT's position limit
+MAX_SEQ_LENGTH = 512
+
+# Loaded once per container and reused across invocations
+_encoder = None
+
+
+class OnnxQueryEncoder:
+    """
+    In-process query encoder backed by an ONNX-exported, int8-quantized model.
+
+    Produces the same representation as the SageMaker path: the mean of all
+    token embeddings (special tokens included) of the last hidden state.
+    """
+
+    def __init__(self, model_dir, num_threads=None):
+        """
+        Parameters:
+        - model_dir: Directory containing model.onnx and tokenizer.json
+        - num_threads: Intra-op thread count for onnxruntime (defaults to ORT's choice)
+        """
+        print(f"[INFO] Loading ONNX encoder from {model_dir}")
+        start = time.time()
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, TOKENIZER_FILE))
+        self.tokenizer.enable_truncation(max_length=MAX_SEQ_LENGTH)
+        self.tokenizer.enable_padding()
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = int(num_threads)
+
+        self.session = ort.InferenceSession(
+            os.path.join(model_dir, MODEL_FILE),
+            sess_options=options,
+            providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+        print(f"[INFO] ONNX encoder loaded in {(time.time() - start) * 1000:.1f} ms")
+
+    def encode(self, texts):
+        """
+        Encodes a batch of texts
+
+        Parameters:
+        - texts: List of strings
+
+        Returns:
+        - float32 array of shape (len(texts), dim)
+        """
+        encodings = self.tokenizer.encode_batch(list(texts))
+        input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.array([e.type_ids for e in encodings], dtype=np.int64)
+
+        last_hidden_state = self.session.run(None, feeds)[0]
+
+        # Mask out padding, then average over the real tokens of each sentence
+        mask = attention_mask[..., None].astype(np.float32)
+        summed = (last_hidden_state * mask).sum(axis=1)
+        counts = np.clip(mask.sum(axis=1), 1.0, None)
+        return (summed / counts).astype(np.float32)
+
+
+def _download_model(s3_uri, model_dir):
+    """
+    Downloads model.onnx and tokenizer.json from an S3 prefix into model_dir
+    """
+    parsed = urlparse(s3_uri)
+    bucket = parsed.netloc
+    prefix = parsed.path.strip("/")
+
+    os.makedirs(model_dir, exist_ok=True)
+    s3 = boto3.client("s3")
+    for fname in (MODEL_FILE, TOKENIZER_FILE):
+        key = f"{prefix}/{fname}" if prefix else fname
+        print(f"[INFO] Downloading s3://{bucket}/{key}")
+        s3.download_file(bucket, key, os.path.join(model_dir, fname))
+
+
+def get_encoder():
+    """
+    Returns the container-wide ONNX encoder, loading it on first use
+
+    Configuration (environment variables):
+    - ONNX_MODEL_DIR: Local model directory (default /tmp/onnx-encoder)
+    - ONNX_MODEL_S3_URI: S3 prefix to download the model from when the directory is empty
+    - ONNX_NUM_THREADS: Intra-op thread count
+    """
+    global _encoder
+    if _encoder is None:
+        model_dir = os.environ.get("ONNX_MODEL_DIR", DEFAULT_MODEL_DIR)
+        if not os.path.exists(os.path.join(model_dir, MODEL_FILE)):
+            s3_uri = os.environ.get("ONNX_MODEL_S3_URI")
+            if not s3_uri:
+                raise ValueError("ONNX model not found locally and ONNX_MODEL_S3_URI is not set")
+            _download_model(s3_uri, model_dir)
+        _encoder = OnnxQueryEncoder(model_dir, num_threads=os.environ.get("ONNX_NUM_THREADS"))
+    return _encoder
+
+
+def check_parity(encoder, sentences, reference_fn, min_cosine=0.99):
+    """
+    Compares the ONNX encoder's vectors with a reference encoder (e.g. the SageMaker endpoint)
+
+    Parameters:
+    - encoder: OnnxQueryEncoder
+    - sentences: List of query strings
+    - reference_fn: Callable mapping a query string to its reference embedding
+    - min_cosine: Lowest acceptable cosine agreement for any sentence
+
+    Returns:
+    - Dictionary with per-sentence cosines, summary stats and a pass flag
+    """
+    onnx_vectors = encoder.encode(sentences)
+    reference_vectors = np.array([reference_fn(s) for s in sentences], dtype=np.float32)
+
+    onnx_vectors /= np.linalg.norm(onnx_vectors, axis=1, keepdims=True)
+    reference_vectors /= np.linalg.norm(reference_vectors, axis=1, keepdims=True)
+    cosines = (onnx_vectors * reference_vectors).sum(axis=1)
+
+    return {
+        "cosines": cosines.tolist(),
+        "cosine_mean": float(cosines.mean()),
+        "cosine_min": float(cosines.min()),
+        "passed": bool(cosines.min() >= min_cosine)
+    }
+
+
+def benchmark_latency(encoder, sentences, warmup=10, iterations=200):
+    """
+    Measures single-query CPU latency of the encoder
+
+    Parameters:
+    - encoder: OnnxQueryEncoder
+    - sentences: Query strings to cycle through
+    - warmup: Untimed calls made first
+    - iterations: Timed calls
+
+    Returns:
+    - Dictionary of latency percentiles in milliseconds
+    """
+    for i in range(warmup):
+        encoder.encode([sentences[i % len(sentences)]])
+
+    timings = []
+    for i in range(iterations):
+        start = time.perf_counter()
+        encoder.encode([sentences[i % len(sentences)]])
+        timings.append((time.perf_counter() - start) * 1000)
+
+    timings = np.array(timings)
+    return {
+        "iterations": iterations,
+        "p50_ms": float(np.percentile(timings, 50)),
+        "p95_ms": float(np.percentile(timings, 95)),
+        "p99_ms": float(np.percentile(timings, 99)),
+        "mean_ms": float(timings.mean())
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Parity check and latency benchmark for the ONNX query encoder")
+    parser.add_argument("command", choices=["parity", "benchmark"])
+    parser.add_argument("--model-dir", type=str, default=DEFAULT_MODEL_DIR)
+    parser.add_argument("--sentences-file", type=str, required=True, help="One query string per line")
+    parser.add_argument("--min-cosine", type=float, default=0.99)
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--num-threads", type=int, default=None)
+    args = parser.parse_args()
+
+    with open(args.sentences_file) as f:
+        test_sentences = [line.strip() for line in f if line.strip()]
+
+    onnx_encoder = OnnxQueryEncoder(args.model_dir, num_threads=args.num_threads)
+
+    if args.command == "parity":
+        # Reference vectors come from the live endpoint named by SAGEMAKER_ENDPOINT_NAME
+        from lambda_function import call_sagemaker_endpoint
+        result = check_parity(onnx_encoder, test_sentences, call_sagemaker_endpoint, args.min_cosine)
+        print(json.dumps({k: v for k, v in result.items() if k != "cosines"}, indent=2))
+        if not result["passed"]:
+            raise SystemExit(1)
+    else:
+        print(json.dumps(benchmark_latency(onnx_encoder, test_sentences, iterations=args.iterations), indent=2))
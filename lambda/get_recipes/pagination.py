@@ -0,0 +1,135 @@
+import os
+import secrets
+import threading
+
+from response_cache import DynamoDBBackend, InMemoryBackend, LocalDirectoryBackend
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def page_size():
+    # PINECONE_TOP_K keeps its old meaning: how many recipes a response shows
+    return int(os.environ.get('PINECONE_TOP_K', '5'))
+
+
+def candidate_count():
+    """
+    Number of candidates fetched from the vector store for the first page
+
+    Configuration (environment variables):
+    - PAGINATION_CANDIDATES: Candidates fetched once and paged through (default 100);
+      0 turns over-fetching off and fetches a single page
+    """
+    candidates = int(os.environ.get('PAGINATION_CANDIDATES', '100'))
+    return max(candidates, page_size()) if candidates > 0 else page_size()
+
+
+class CursorStore:
+    """
+    Filtered candidate lists held under opaque cursor tokens
+
+    A list is stored once, under a random id, when its first page is served;
+    a cursor is that id plus the offset of the next page. Later pages are
+    slices of the stored list, so they need neither the encoder nor the
+    vector store.
+    """
+
+    def __init__(self, memory, shared=None, ttl=900):
+        self.memory = memory
+        self.shared = shared
+        self.ttl = ttl
+
+    def _get(self, list_id):
+        recipes = self.memory.get(list_id)
+        if recipes is None and self.shared is not None:
+            try:
+                recipes = self.shared.get(list_id)
+            except Exception as e:
+                print(f"[WARN] Cursor store read failed: {e}")
+                return None
+            if recipes is not None:
+                self.memory.set(list_id, recipes, self.ttl)
+        return recipes
+
+    def _set(self, list_id, recipes):
+        self.memory.set(list_id, recipes, self.ttl)
+        if self.shared is not None:
+            try:
+                self.shared.set(list_id, recipes, self.ttl)
+            except Exception as e:
+                print(f"[WARN] Cursor store write failed: {e}")
+
+    def first_page(self, recipes, size):
+        """
+        Returns the first page of recipes and a cursor to the rest
+
+        Parameters:
+        - recipes: The full filtered candidate list
+        - size: Recipes per page
+
+        Returns:
+        - (page, cursor): cursor is None when everything fits on one page
+        """
+        if len(recipes) <= size:
+            return recipes, None
+        list_id = secrets.token_urlsafe(16)
+        self._set(list_id, recipes)
+        return recipes[:size], f"{list_id}.{size}"
+
+    def next_page(self, cursor, size):
+        """
+        Returns the page a cursor points at and a cursor to the page after it
+
+        Parameters:
+        - cursor: Token returned with the previous page
+        - size: Recipes per page
+
+        Returns:
+        - (page, cursor), or None if the cursor is malformed or has expired
+        """
+        list_id, _, offset = str(cursor).rpartition('.')
+        if not list_id or not offset.isdigit():
+            return None
+        recipes = self._get(list_id)
+        if recipes is None:
+            return None
+
+        offset = int(offset)
+        end = offset + size
+        return recipes[offset:end], (f"{list_id}.{end}" if end < len(recipes) else None)
+
+
+def get_cursor_store():
+    """
+    Returns the container-wide cursor store
+
+    With the default in-memory backend a cursor only works on the container
+    that issued it; use 'dynamodb' when requests are spread over containers.
+
+    Configuration (environment variables):
+    - PAGINATION_BACKEND: 'memory' (default), 'dynamodb' or 'local'
+    - PAGINATION_TABLE: DynamoDB table for the 'dynamodb' backend
+    - PAGINATION_DIR: Directory for the 'local' backend
+    - PAGINATION_TTL_SECONDS: How long a cursor stays valid (default 900)
+    - PAGINATION_MAX_ENTRIES: In-memory size bound (default 1024)
+    """
+    global _store
+    with _store_lock:
+        if _store is None:
+            backend = os.environ.get('PAGINATION_BACKEND', 'memory').lower()
+            if backend == 'dynamodb':
+                shared = DynamoDBBackend(os.environ['PAGINATION_TABLE'])
+            elif backend == 'local':
+                shared = LocalDirectoryBackend(os.environ.get('PAGINATION_DIR', '/tmp/cursors'))
+            elif backend == 'memory':
+                shared = None
+            else:
+                raise ValueError(f"Unknown PAGINATION_BACKEND: {backend}")
+
+            _store = CursorStore(
+                InMemoryBackend(int(os.environ.get('PAGINATION_MAX_ENTRIES', '1024'))),
+                shared=shared,
+                ttl=float(os.environ.get('PAGINATION_TTL_SECONDS', '900'))
+            )
+    return _store
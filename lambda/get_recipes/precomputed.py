@@ -0,0 +1,137 @@
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+from index_version import get_active_index_version
+from profile_store import profile_hash
+from response_cache import DynamoDBBackend, LocalDirectoryBackend
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def precomputed_key(user_data, request_data):
+    """
+    Key of the nightly recommendations for a profile and a default request
+
+    Parameters:
+    - user_data: The request's user block
+    - request_data: The request's request block
+
+    Returns:
+    - Hex digest string
+    """
+    request = json.dumps(normalized_request(request_data), sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(f"precomputed:{profile_hash(user_data)}:{request}".encode("utf-8")).hexdigest()
+
+
+def normalized_request(request_data):
+    """
+    The fields of a profile-only request that change its recommendations
+
+    Empty fields are dropped, so a client that omits ingredients_available or
+    sends empty preferences looks up the same entry as one that sends them.
+
+    Parameters:
+    - request_data: The request's request block
+
+    Returns:
+    - Dictionary of the non-empty request fields
+    """
+    normalized = {}
+    for key, value in (request_data or {}).items():
+        if isinstance(value, dict):
+            value = normalized_request(value)
+        if value not in (None, "", [], {}):
+            normalized[key] = value
+    return normalized
+
+
+def count_lookup(result):
+    # metrics lives in monitoring/ in the repo; the batch job imports this module without it
+    try:
+        from metrics import get_metrics
+    except ImportError:
+        sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "monitoring"))
+        from metrics import get_metrics
+    get_metrics().increment(f"Precomputed{result}")
+
+
+def is_profile_only(request_data):
+    # The batch job precomputes requests without ingredients; anything with ingredients is live
+    return bool((request_data or {}).get('meal_type')) and not (request_data or {}).get('ingredients_available')
+
+
+def get_precomputed_store():
+    """
+    Returns the store the batch job writes to, or None if precomputation is off
+
+    Configuration (environment variables):
+    - PRECOMPUTED_BACKEND: 'dynamodb', 'local' or unset (off)
+    - PRECOMPUTED_TABLE: DynamoDB table for the 'dynamodb' backend
+    - PRECOMPUTED_DIR: Directory for the 'local' backend
+    """
+    global _store
+    backend = os.environ.get('PRECOMPUTED_BACKEND', '').lower()
+    if not backend:
+        return None
+    with _store_lock:
+        if _store is None:
+            if backend == 'dynamodb':
+                _store = DynamoDBBackend(os.environ['PRECOMPUTED_TABLE'])
+            elif backend == 'local':
+                _store = LocalDirectoryBackend(os.environ.get('PRECOMPUTED_DIR', '/tmp/precomputed'), max_entries=10**6)
+            else:
+                raise ValueError(f"Unknown PRECOMPUTED_BACKEND: {backend}")
+    return _store
+
+
+def lookup_precomputed(user_data, request_data):
+    """
+    Returns the nightly recommendations for a profile-only request if they are still fresh
+
+    An entry is fresh when it was built against the active index version and
+    is younger than PRECOMPUTED_MAX_AGE_HOURS (default 36). Every eligible
+    lookup counts as a PrecomputedHits or PrecomputedMisses metric.
+
+    Parameters:
+    - user_data: The request's user block
+    - request_data: The request's request block
+
+    Returns:
+    - List of recipes, or None
+    """
+    store = get_precomputed_store()
+    if store is None or not is_profile_only(request_data):
+        return None
+
+    try:
+        entry = store.get(precomputed_key(user_data, request_data))
+    except Exception as e:
+        print(f"[WARN] Precomputed store read failed: {e}")
+        count_lookup("Misses")
+        return None
+    if entry is None:
+        count_lookup("Misses")
+        return None
+
+    max_age = float(os.environ.get('PRECOMPUTED_MAX_AGE_HOURS', '36')) * 3600
+    age = time.time() - datetime.fromisoformat(entry['generated_at']).timestamp()
+    if entry['index_version'] != get_active_index_version().get('version') or age > max_age:
+        print(f"[INFO] Precomputed entry is stale (index {entry['index_version']}, {age / 3600:.1f} h old)")
+        count_lookup("Misses")
+        return None
+    count_lookup("Hits")
+    return entry['recipes']
+
+
+def precomputed_entry(recipes, index_version):
+    return {
+        'recipes': recipes,
+        'index_version': index_version,
+        'generated_at': datetime.now(timezone.utc).isoformat()
+    }
@@ -0,0 +1,95 @@
+import hashlib
+import json
+import os
+import threading
+from urllib.parse import urlparse
+
+import boto3
+
+# The `user` block of each request, one object per username; read by the nightly batch jobs
+DEFAULT_PROFILE_S3_PREFIX = "s3://cs401r-mlops-final/user-profiles"
+
+# Fields of the user block that describe the saved profile
+PROFILE_FIELDS = ("allergies", "likes", "dislikes", "macros")
+
+_saved_hashes = {}
+_lock = threading.Lock()
+
+
+def profile_hash(user_data):
+    """
+    Hashes the stable part of a user block, so equal profiles share a hash
+
+    Parameters:
+    - user_data: The request's user block
+
+    Returns:
+    - Hex digest string
+    """
+    profile = {field: (user_data or {}).get(field) for field in PROFILE_FIELDS}
+    payload = json.dumps(profile, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+
+def save_profile(user_data):
+    """
+    Stores the user block under its username, skipping the write when this
+    container already stored the same profile
+
+    Configuration (environment variables):
+    - PROFILE_S3_PREFIX: Where profiles are kept; empty to not keep them
+
+    Parameters:
+    - user_data: The request's user block
+    """
+    username = (user_data or {}).get('username')
+    if not username:
+        return
+
+    digest = profile_hash(user_data)
+    with _lock:
+        if _saved_hashes.get(username) == digest:
+            return
+
+    prefix = os.environ.get('PROFILE_S3_PREFIX', DEFAULT_PROFILE_S3_PREFIX)
+    if not prefix:
+        return
+    parsed = urlparse(prefix)
+    try:
+        boto3.client('s3').put_object(
+            Bucket=parsed.netloc,
+            Key=f"{parsed.path.strip('/')}/{username}.json",
+            Body=json.dumps({**user_data, 'profile_hash': digest}),
+            ContentType='application/json'
+        )
+    except Exception as e:
+        # The request doesn't depend on the stored profile
+        print(f"[WARN] Could not save profile for {username}: {e}")
+        return
+
+    with _lock:
+        _saved_hashes[username] = digest
+
+
+def load_profile(username):
+    """
+    Reads back the profile fields stored for a username
+
+    Parameters:
+    - username: The request's username
+
+    Returns:
+    - Dictionary of the stored PROFILE_FIELDS, or None if nothing is stored
+    """
+    prefix = os.environ.get('PROFILE_S3_PREFIX', DEFAULT_PROFILE_S3_PREFIX)
+    if not username or not prefix:
+        return None
+    parsed = urlparse(prefix)
+    try:
+        obj = boto3.client('s3').get_object(Bucket=parsed.netloc, Key=f"{parsed.path.strip('/')}/{username}.json")
+    except Exception as e:
+        if getattr(e, 'response', {}).get('Error', {}).get('Code') in ('404', 'NoSuchKey'):
+            return None
+        raise
+    stored = json.loads(obj['Body'].read().decode('utf-8'))
+    return {field: stored[field] for field in PROFILE_FIELDS if field in stored}
@@ -0,0 +1,122 @@
+import hashlib
+import os
+import threading
+
+import numpy as np
+
+from profile_store import profile_hash
+from response_cache import DynamoDBBackend, InMemoryBackend, LocalDirectoryBackend, current_model_version
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def compose_query_vector(profile_vector, request_vector, profile_weight=0.5):
+    """
+    Weighted sum of the unit-length profile and request vectors, renormalised
+
+    Either vector may be None, in which case the other is used alone.
+
+    Parameters:
+    - profile_vector: Embedding of the profile string
+    - request_vector: Embedding of the request string
+    - profile_weight: Share of the profile in the result, between 0 and 1
+
+    Returns:
+    - Query embedding as a list of floats
+    """
+    parts = []
+    for vector, weight in ((profile_vector, profile_weight), (request_vector, 1.0 - profile_weight)):
+        if vector is None:
+            continue
+        vector = np.asarray(vector, dtype=np.float32)
+        parts.append((vector / max(np.linalg.norm(vector), 1e-12), weight))
+    if not parts:
+        raise ValueError("Nothing to compose: both the profile and the request are empty")
+    if len(parts) == 1:
+        return parts[0][0].tolist()
+
+    composed = sum(vector * weight for vector, weight in parts)
+    return (composed / max(np.linalg.norm(composed), 1e-12)).tolist()
+
+
+class ProfileVectorStore:
+    """
+    Embeddings of profile strings, keyed on username, profile hash and encoder
+
+    A profile is embedded once and reused across requests and sessions until
+    it changes (new hash) or the encoder does.
+    """
+
+    def __init__(self, memory, shared=None, ttl=30 * 24 * 3600):
+        self.memory = memory
+        self.shared = shared
+        self.ttl = ttl
+
+    def key_for(self, user_data):
+        raw = f"profile-vector:{user_data.get('username', '')}:{profile_hash(user_data)}:{current_model_version()}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get_or_compute(self, user_data, profile_string, embed_fn):
+        """
+        Returns the profile's vector, embedding profile_string only on a miss
+
+        Parameters:
+        - user_data: The request's user block
+        - profile_string: Output of build_profile_string(user_data)
+        - embed_fn: Encoder used on a miss
+
+        Returns:
+        - Embedding as a list of floats
+        """
+        key = self.key_for(user_data)
+        vector = self.memory.get(key)
+        if vector is None and self.shared is not None:
+            try:
+                vector = self.shared.get(key)
+            except Exception as e:
+                print(f"[WARN] Profile vector read failed: {e}")
+        if vector is not None:
+            self.memory.set(key, vector, self.ttl)
+            return vector
+
+        print("[INFO] Profile vector miss, embedding profile")
+        vector = embed_fn(profile_string)
+        self.memory.set(key, vector, self.ttl)
+        if self.shared is not None:
+            try:
+                self.shared.set(key, vector, self.ttl)
+            except Exception as e:
+                print(f"[WARN] Profile vector write failed: {e}")
+        return vector
+
+
+def get_profile_vector_store():
+    """
+    Returns the container-wide profile vector store
+
+    Configuration (environment variables):
+    - PROFILE_VECTOR_BACKEND: 'memory' (default), 'dynamodb' or 'local'
+    - PROFILE_VECTOR_TABLE: DynamoDB table for the 'dynamodb' backend
+    - PROFILE_VECTOR_DIR: Directory for the 'local' backend
+    - PROFILE_VECTOR_TTL_SECONDS: Entry lifetime (default 30 days)
+    """
+    global _store
+    with _store_lock:
+        if _store is None:
+            backend = os.environ.get('PROFILE_VECTOR_BACKEND', 'memory').lower()
+            if backend == 'dynamodb':
+                shared = DynamoDBBackend(os.environ['PROFILE_VECTOR_TABLE'])
+            elif backend == 'local':
+                shared = LocalDirectoryBackend(os.environ.get('PROFILE_VECTOR_DIR', '/tmp/profile-vectors'))
+            elif backend == 'memory':
+                shared = None
+            else:
+                raise ValueError(f"Unknown PROFILE_VECTOR_BACKEND: {backend}")
+
+            _store = ProfileVectorStore(
+                InMemoryBackend(int(os.environ.get('PROFILE_VECTOR_MAX_ENTRIES', '4096'))),
+                shared=shared,
+                ttl=float(os.environ.get('PROFILE_VECTOR_TTL_SECONDS', str(30 * 24 * 3600)))
+            )
+    return _store
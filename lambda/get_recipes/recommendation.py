@@ -0,0 +1,161 @@
+import json
+import re
+
+# Query building and allergy filtering, shared by the Lambda and the offline batch jobs
+
+def build_query_string(user_data, request_data):
+    """
+    Builds a query string from user data and request data
+    
+    Parameters:
+    - user_data: Dictionary containing user information
+    - request_data: Dictionary containing request details
+    
+    Returns:
+    - String containing all relevant information for the model
+    """
+    print("[INFO] Building query string...")
+    query_parts = []
+    
+    # Add macros information
+    macros = user_data.get('macros', {})
+    print(f"[INFO] Macros: {json.dumps(macros)}")
+    if macros:
+        for macro_type, level in macros.items():
+            query_parts.append(f"{level} {macro_type}")
+    
+    # Add available ingredients
+    ingredients = request_data.get('ingredients_available', [])
+    print(f"[INFO] Ingredients: {json.dumps(ingredients)}")
+    if ingredients:
+        query_parts.extend(ingredients)
+    
+    # Add user likes
+    likes = user_data.get('likes', [])
+    print(f"[INFO] Likes: {json.dumps(likes)}")
+    if likes:
+        query_parts.extend(likes)
+    
+    # Add user dislikes (prefixed with "no")
+    dislikes = user_data.get('dislikes', [])
+    print(f"[INFO] Dislikes: {json.dumps(dislikes)}")
+    if dislikes:
+        query_parts.extend([f"no {item}" for item in dislikes])
+    
+    # Add user allergies (prefixed with "allergy")
+    allergies = user_data.get('allergies', [])
+    print(f"[INFO] Allergies: {json.dumps(allergies)}")
+    if allergies:
+        query_parts.extend([f"allergy {item}" for item in allergies])
+    
+    # Add max time
+    max_time = request_data.get('max_time_minutes')
+    print(f"[INFO] Max time: {max_time}")
+    if max_time:
+        query_parts.append(f"max_time {max_time}")
+    
+    # Add meal type
+    meal_type = request_data.get('meal_type')
+    print(f"[INFO] Meal type: {meal_type}")
+    if meal_type:
+        query_parts.append(meal_type)
+    
+    # Add spice level
+    preferences = request_data.get('preferences', {})
+    print(f"[INFO] Preferences: {json.dumps(preferences)}")
+    spice_level = preferences.get('spice_level')
+    print(f"[INFO] Spice level: {spice_level}")
+    if spice_level:
+        query_parts.append(f"spice {spice_level}")
+    
+    # Add diet type
+    diet_type = preferences.get('diet_type')
+    print(f"[INFO] Diet type: {diet_type}")
+    if diet_type:
+        query_parts.append(diet_type)
+    
+    # Join all parts with spaces
+    result = " ".join(query_parts)
+    print(f"[INFO] Final query string: {result}")
+    return result
+
+def build_profile_string(user_data):
+    """
+    Builds the long-lived part of the query: macros, likes, dislikes and allergies
+    
+    Parameters:
+    - user_data: Dictionary containing user information
+    
+    Returns:
+    - String with the profile's query terms
+    """
+    query_parts = [f"{level} {macro_type}" for macro_type, level in (user_data.get('macros') or {}).items()]
+    query_parts.extend(user_data.get('likes') or [])
+    query_parts.extend(f"no {item}" for item in user_data.get('dislikes') or [])
+    query_parts.extend(f"allergy {item}" for item in user_data.get('allergies') or [])
+    return " ".join(query_parts)
+
+def build_request_string(request_data):
+    """
+    Builds the per-request part of the query: ingredients, time, meal type and preferences
+    
+    Parameters:
+    - request_data: Dictionary containing request details
+    
+    Returns:
+    - String with the request's query terms
+    """
+    query_parts = list(request_data.get('ingredients_available') or [])
+    if request_data.get('max_time_minutes'):
+        query_parts.append(f"max_time {request_data['max_time_minutes']}")
+    if request_data.get('meal_type'):
+        query_parts.append(request_data['meal_type'])
+    preferences = request_data.get('preferences') or {}
+    if preferences.get('spice_level'):
+        query_parts.append(f"spice {preferences['spice_level']}")
+    if preferences.get('diet_type'):
+        query_parts.append(preferences['diet_type'])
+    return " ".join(query_parts)
+
+def filterAllergiesAndDislikes(
+    matches: list,
+    allergies: list[str] | None = None,
+    dislikes:  list[str] | None = None
+) -> list:
+    """
+    Returns list of matches that do not contain any allergens or disliked items.
+    """
+    allergies = set(a.lower() for a in (allergies or []))
+    dislikes  = set(d.lower() for d in (dislikes  or []))
+
+    safe_matches = []
+    for m in matches:
+        ing_raw  = m.get("metadata", {}).get("ingredients")
+        ing_set  = set(i.lower() for i in _to_token_list(ing_raw))
+
+        if ing_set & allergies:
+            continue                
+        if ing_set & dislikes:
+            continue               
+
+        safe_matches.append(m)
+
+    return safe_matches
+
+def _to_token_list(raw):
+    """
+    Normalize the 'ingredients' field into a list[str].
+    """
+    if raw is None:
+        return []
+
+    # Already a list?  Good.
+    if isinstance(raw, list):
+        return raw
+
+    # String?  Strip brackets & quotes, then split on commas
+    if isinstance(raw, str):
+        cleaned = re.sub(r"[\[\]\"'()]", "", raw)
+        return [tok.strip() for tok in cleaned.split(",") if tok.strip()]
+
+    return []   # fallback
@@ -0,0 +1,191 @@
+import json
+import os
+import time
+
+import numpy as np
+
+from constraints import MACRO_COLUMNS, RANK_CODES
+from ingredients import IngredientIndex
+
+# Weight of each feature in the blended score; every feature is on a 0-1 scale
+DEFAULT_WEIGHTS = {
+    "similarity": 1.0,
+    "rating": 0.2,
+    "coverage": 0.3,
+    "macros": 0.1
+}
+
+MAX_RATING = 5.0
+
+
+def rerank_weights():
+    """
+    Feature weights, with RERANK_WEIGHTS (a JSON object) overriding the defaults
+
+    Returns:
+    - Dictionary of feature name to weight
+    """
+    weights = dict(DEFAULT_WEIGHTS)
+    weights.update(json.loads(os.environ.get('RERANK_WEIGHTS') or '{}'))
+    unknown = set(weights) - set(DEFAULT_WEIGHTS)
+    if unknown:
+        raise ValueError(f"Unknown rerank features: {sorted(unknown)}")
+    return weights
+
+
+def macro_match(columns, rows, user_macros):
+    """
+    Share of the user's macro levels each candidate matches
+
+    Parameters:
+    - columns: Catalog feature columns
+    - rows: Catalog row of each candidate
+    - user_macros: The user's macros block, e.g. {'protein': 'high'}
+
+    Returns:
+    - float32 array, one entry per candidate
+    """
+    wanted = [
+        (MACRO_COLUMNS[key], RANK_CODES[str(level).lower()])
+        for key, level in (user_macros or {}).items()
+        if key in MACRO_COLUMNS and str(level).lower() in RANK_CODES
+    ]
+    matched = np.zeros(len(rows), dtype=np.float32)
+    for column, code in wanted:
+        matched += columns[column][rows] == code
+    return matched / max(len(wanted), 1)
+
+
+def candidate_features(matches, user_data, request_data, catalog):
+    """
+    Feature columns of the candidates, gathered from the catalog by row
+
+    Candidates missing from the catalog get 0 for the catalog features.
+
+    Parameters:
+    - matches: Candidate matches
+    - user_data: The request's user block
+    - request_data: The request's request block
+    - catalog: CatalogStore of the active version
+
+    Returns:
+    - Dictionary of feature name to float32 array
+    """
+    rows = np.fromiter((catalog.row_of.get(str(m['id']), -1) for m in matches), dtype=np.int64, count=len(matches))
+    known = rows >= 0
+    rows = np.where(known, rows, 0)
+    columns = catalog.feature_columns()
+
+    ingredient_index = catalog.ingredient_index()
+    coverage, _ = ingredient_index.coverage(rows, ingredient_index.encode((request_data or {}).get('ingredients_available')))
+    macros = macro_match(columns, rows, (user_data or {}).get('macros'))
+
+    return {
+        "similarity": np.fromiter((m['score'] for m in matches), dtype=np.float32, count=len(matches)),
+        "rating": np.where(known, columns["rating"][rows] / MAX_RATING, 0).astype(np.float32),
+        "coverage": np.where(known, coverage, 0).astype(np.float32),
+        "macros": np.where(known, macros, 0).astype(np.float32)
+    }
+
+
+def blend(features, weights):
+    score = np.zeros_like(features["similarity"])
+    for name, weight in weights.items():
+        if weight:
+            score += np.float32(weight) * features[name]
+    return score
+
+
+def rerank(matches, user_data, request_data, catalog, weights=None):
+    """
+    Reorders candidates by the blended score
+
+    Each match keeps its similarity in 'score' and gains 'rerank_score'.
+
+    Parameters:
+    - matches: Candidate matches, already filtered
+    - user_data: The request's user block
+    - request_data: The request's request block
+    - catalog: CatalogStore of the active version
+    - weights: Feature weights (default: rerank_weights())
+
+    Returns:
+    - List of matches, best first
+    """
+    if not matches:
+        return matches
+    scores = blend(candidate_features(matches, user_data, request_data, catalog), weights or rerank_weights())
+    order = np.argsort(-scores, kind="stable")
+    return [{**matches[i], 'rerank_score': float(scores[i])} for i in order]
+
+
+class _SyntheticCatalog:
+    def __init__(self, rows, pantry, seed):
+        rng = np.random.default_rng(seed)
+        self.row_of = {str(row): row for row in range(rows)}
+        self.columns = {
+            "rating": rng.uniform(0, MAX_RATING, size=rows).astype(np.float32),
+            **{column: rng.integers(0, 3, size=rows).astype(np.uint8) for column in MACRO_COLUMNS.values()}
+        }
+        ids = np.sort(rng.integers(0, len(pantry), size=(rows, 9)), axis=1).astype(np.uint32)
+        self.index = IngredientIndex(pantry, np.arange(0, rows * 9 + 1, 9), ids.ravel())
+
+    def feature_columns(self):
+        return self.columns
+
+    def ingredient_index(self):
+        return self.index
+
+
+def benchmark_rerank(candidates=200, catalog_rows=500000, iterations=200, seed=0):
+    """
+    Measures rerank latency over synthetic candidates and catalog columns
+
+    Parameters:
+    - candidates: Candidates per request
+    - catalog_rows: Catalog size the columns are gathered from
+    - iterations: Timed reranks
+
+    Returns:
+    - Dictionary of latency percentiles in milliseconds
+    """
+    rng = np.random.default_rng(seed)
+    pantry = [f"ingredient {i}" for i in range(40)]
+    catalog = _SyntheticCatalog(catalog_rows, pantry, seed)
+    user_data = {'macros': {'protein': 'high', 'carbs': 'low', 'fats': 'medium'}}
+    request_data = {'ingredients_available': pantry[:8]}
+
+    requests = []
+    for _ in range(iterations):
+        rows = rng.choice(catalog_rows, size=candidates, replace=False)
+        requests.append([
+            {'id': str(row), 'score': float(score), 'metadata': {}}
+            for row, score in zip(rows, np.sort(rng.uniform(0.3, 0.9, size=candidates))[::-1])
+        ])
+
+    timings = []
+    for matches in requests:
+        start = time.perf_counter()
+        rerank(matches, user_data, request_data, catalog)
+        timings.append((time.perf_counter() - start) * 1000)
+    timings = np.array(timings)
+
+    return {
+        "candidates": candidates,
+        "iterations": iterations,
+        "p50_ms": float(np.percentile(timings, 50)),
+        "p95_ms": float(np.percentile(timings, 95)),
+        "p99_ms": float(np.percentile(timings, 99))
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Latency benchmark for the rerank stage")
+    parser.add_argument("--candidates", type=int, default=200)
+    parser.add_argument("--catalog-rows", type=int, default=500000)
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    print(json.dumps(benchmark_rerank(args.candidates, args.catalog_rows, args.iterations), indent=2))
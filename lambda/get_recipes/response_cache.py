@@ -0,0 +1,227 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import boto3
+
+from index_version import get_active_index_version
+
+# Fields of the user block that don't change the recommendations
+_IGNORED_USER_FIELDS = ("username",)
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def canonical_request_key(user_data, request_data, index_version, model_version):
+    """
+    Hashes everything the recommendation list depends on into a cache key
+
+    Parameters:
+    - user_data: The request's user block (as built by app.py's prepare_request_data)
+    - request_data: The request's request block
+    - index_version: Active index version
+    - model_version: Identifies the query encoder
+
+    Returns:
+    - Hex digest string
+    """
+    user = {k: v for k, v in (user_data or {}).items() if k not in _IGNORED_USER_FIELDS}
+    payload = json.dumps(
+        {"user": user, "request": request_data or {}, "index": index_version, "model": model_version},
+        sort_keys=True,
+        separators=(",", ":"),
+        default=str
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def current_model_version():
+    """
+    Identifies the encoder serving queries, so switching it misses the cache
+    """
+    backend = os.environ.get('EMBEDDING_BACKEND', 'sagemaker').lower()
+    if backend == 'onnx':
+        return f"onnx:{os.environ.get('ONNX_MODEL_S3_URI') or os.environ.get('ONNX_MODEL_DIR', '')}"
+    return f"sagemaker:{os.environ.get('SAGEMAKER_ENDPOINT_NAME', '')}"
+
+
+class InMemoryBackend:
+    """
+    Per-process LRU with per-entry expiry
+    """
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (time.time() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class DynamoDBBackend:
+    """
+    Shared cache in a DynamoDB table keyed on 'cache_key', with native TTL on 'expires_at'
+    """
+
+    def __init__(self, table_name):
+        self.table = boto3.resource('dynamodb').Table(table_name)
+
+    def get(self, key):
+        item = self.table.get_item(Key={'cache_key': key}).get('Item')
+        # DynamoDB deletes expired items lazily, so check expiry ourselves
+        if not item or int(item['expires_at']) < time.time():
+            return None
+        return json.loads(item['value'])
+
+    def set(self, key, value, ttl):
+        self.table.put_item(Item={
+            'cache_key': key,
+            'value': json.dumps(value),
+            'expires_at': int(time.time() + ttl)
+        })
+
+
+class LocalDirectoryBackend:
+    """
+    Local stand-in for the shared backend: one JSON file per key in a directory
+    """
+
+    def __init__(self, directory, max_entries=10000):
+        self.directory = directory
+        self.max_entries = max_entries
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key):
+        try:
+            with open(self._path(key)) as f:
+                entry = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        if entry['expires_at'] < time.time():
+            return None
+        return entry['value']
+
+    def set(self, key, value, ttl):
+        # Write then rename so concurrent readers never see a partial file
+        tmp_path = f"{self._path(key)}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({'expires_at': time.time() + ttl, 'value': value}, f)
+        os.replace(tmp_path, self._path(key))
+        self._prune()
+
+    def _prune(self):
+        files = [os.path.join(self.directory, f) for f in os.listdir(self.directory) if f.endswith(".json")]
+        if len(files) <= self.max_entries:
+            return
+        files.sort(key=os.path.getmtime)
+        for path in files[:len(files) - self.max_entries]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+class ResponseCache:
+    """
+    Recommendation-list cache: in-memory LRU in front of an optional shared backend
+
+    Keys include the active index version, so publishing a new version
+    invalidates every entry; the in-memory tier is also dropped at that point.
+    """
+
+    def __init__(self, memory, shared=None, ttl=300):
+        self.memory = memory
+        self.shared = shared
+        self.ttl = ttl
+        self._index_version = None
+
+    def key_for(self, user_data, request_data):
+        version = get_active_index_version().get('version')
+        if version != self._index_version:
+            if self._index_version is not None:
+                print("[INFO] Index version changed, clearing in-memory response cache")
+                self.memory.clear()
+            self._index_version = version
+        return canonical_request_key(user_data, request_data, version, current_model_version())
+
+    def get(self, key):
+        value = self.memory.get(key)
+        if value is not None:
+            return value
+        if self.shared is not None:
+            try:
+                value = self.shared.get(key)
+            except Exception as e:
+                print(f"[WARN] Shared response cache read failed: {e}")
+                return None
+            if value is not None:
+                self.memory.set(key, value, self.ttl)
+        return value
+
+    def set(self, key, value):
+        self.memory.set(key, value, self.ttl)
+        if self.shared is not None:
+            try:
+                self.shared.set(key, value, self.ttl)
+            except Exception as e:
+                print(f"[WARN] Shared response cache write failed: {e}")
+
+
+def get_response_cache():
+    """
+    Returns the container-wide response cache
+
+    Configuration (environment variables):
+    - RESPONSE_CACHE_TTL_SECONDS: Entry lifetime (default 300)
+    - RESPONSE_CACHE_MAX_ENTRIES: In-memory size bound (default 1024)
+    - RESPONSE_CACHE_BACKEND: 'memory' (default), 'dynamodb' or 'local'
+    - RESPONSE_CACHE_TABLE: DynamoDB table for the 'dynamodb' backend
+    - RESPONSE_CACHE_DIR: Directory for the 'local' backend
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            backend = os.environ.get('RESPONSE_CACHE_BACKEND', 'memory').lower()
+            if backend == 'dynamodb':
+                shared = DynamoDBBackend(os.environ['RESPONSE_CACHE_TABLE'])
+            elif backend == 'local':
+                shared = LocalDirectoryBackend(os.environ.get('RESPONSE_CACHE_DIR', '/tmp/response-cache'))
+            elif backend == 'memory':
+                shared = None
+            else:
+                raise ValueError(f"Unknown RESPONSE_CACHE_BACKEND: {backend}")
+
+            _cache = ResponseCache(
+                InMemoryBackend(int(os.environ.get('RESPONSE_CACHE_MAX_ENTRIES', '1024'))),
+                shared=shared,
+                ttl=float(os.environ.get('RESPONSE_CACHE_TTL_SECONDS', '300'))
+            )
+    return _cache
@@ -0,0 +1,193 @@
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import lambda_function
+from index_version import get_active_index_version
+
+# metrics is shared with the embedding monitor: build.sh packages it next to
+# this file, and in the repo it lives in monitoring/
+try:
+    from metrics import get_metrics
+except ImportError:
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "monitoring"))
+    from metrics import get_metrics
+
+# Plain ASGI app serving the same pipeline as lambda_handler, for uvicorn:
+#   pip install uvicorn
+#   python server.py --workers 4                  (real SageMaker/Pinecone)
+#   python server.py --workers 4 --local          (stub embeddings, local catalog)
+# Each worker memory-maps the active catalog version read-only, so workers on
+# one host share its pages.
+
+RECOMMEND_PATHS = ("/", "/recommender")
+JSON_HEADERS = [(b"content-type", b"application/json")]
+
+_executor = None
+_started = False
+_start_lock = threading.Lock()
+_readiness = {"ready": False, "error": None, "index_version": None, "warmed_at": None}
+
+
+def _warm_up():
+    """
+    Loads what the first request would otherwise wait on; readiness flips when it's done
+    """
+    try:
+        start = time.perf_counter()
+        _readiness["index_version"] = get_active_index_version().get("version")
+        lambda_function.warm_search_index()
+        _readiness.update(ready=True, error=None, warmed_at=time.time())
+        print(f"[INFO] Worker {os.getpid()} ready in {(time.perf_counter() - start) * 1000:.0f} ms")
+    except Exception as e:
+        _readiness.update(ready=False, error=str(e))
+        print(f"[ERROR] Warm-up failed: {e}")
+
+
+async def _flush_metrics(interval):
+    # Requests only record; the buffer is flushed here on a timer
+    while True:
+        await asyncio.sleep(interval)
+        await asyncio.get_running_loop().run_in_executor(None, get_metrics().flush)
+
+
+def _ensure_started():
+    global _executor, _started
+    with _start_lock:
+        if _started:
+            return
+        _executor = ThreadPoolExecutor(
+            max_workers=int(os.environ.get("SERVER_THREADS", "16")),
+            thread_name_prefix="recommend"
+        )
+        _executor.submit(_warm_up)
+        _started = True
+
+
+async def _lifespan(receive, send):
+    flusher = None
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            _ensure_started()
+            interval = float(os.environ.get("METRICS_FLUSH_INTERVAL_SECONDS", "60"))
+            flusher = asyncio.create_task(_flush_metrics(interval))
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            if flusher is not None:
+                flusher.cancel()
+            get_metrics().flush()
+            if _executor is not None:
+                _executor.shutdown(wait=False)
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def _read_body(receive):
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            return body
+
+
+async def _respond(send, status, payload, extra_headers=None):
+    body = json.dumps(payload).encode("utf-8")
+    headers = JSON_HEADERS + [(b"content-length", str(len(body)).encode("latin-1"))]
+    headers += [(name.lower().encode("latin-1"), str(value).encode("latin-1")) for name, value in (extra_headers or {}).items()]
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": headers
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def app(scope, receive, send):
+    """
+    ASGI entry point
+
+    Routes:
+    - GET /healthz: The process is up
+    - GET /readyz: 200 once the worker has warmed up, 503 before that or if warm-up failed
+    - GET|POST / and /recommender: A recommendation event, answered with the
+      same response dictionary the Lambda returns (as API Gateway passes it on)
+    """
+    if scope["type"] == "lifespan":
+        await _lifespan(receive, send)
+        return
+    if scope["type"] != "http":
+        return
+
+    _ensure_started()
+    path, method = scope["path"], scope["method"]
+
+    if path == "/healthz":
+        await _respond(send, 200, {"status": "ok", "pid": os.getpid()})
+        return
+
+    if path == "/readyz":
+        await _respond(send, 200 if _readiness["ready"] else 503, {**_readiness, "pid": os.getpid()})
+        return
+
+    if path not in RECOMMEND_PATHS:
+        await _respond(send, 404, {"error": f"No route for {path}"})
+        return
+    if method not in ("GET", "POST"):
+        await _respond(send, 405, {"error": f"{method} not allowed"})
+        return
+    if not _readiness["ready"]:
+        await _respond(send, 503, {"error": "Warming up", "details": _readiness["error"]})
+        return
+
+    try:
+        event = json.loads(await _read_body(receive) or b"{}")
+    except ValueError as e:
+        await _respond(send, 400, {"error": "Request body is not valid JSON", "details": str(e)})
+        return
+
+    # The pipeline blocks on I/O, so it runs on the worker's thread pool
+    response = await asyncio.get_running_loop().run_in_executor(_executor, lambda_function.handle_event, event, None)
+    # Retry-After on a 429 is for the HTTP client, not just the body
+    extra_headers = {k: v for k, v in response.get("headers", {}).items() if k.lower() != "content-type"}
+    await _respond(send, response["statusCode"], response, extra_headers)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    import uvicorn
+
+    from local_stack import local_environment, write_synthetic_catalog
+
+    parser = argparse.ArgumentParser(description="HTTP server for the recipe recommender")
+    parser.add_argument("--host", type=str, default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--keep-alive", type=int, default=75, help="Seconds an idle connection is kept open")
+    parser.add_argument("--local", action="store_true", help="Serve from local stand-ins instead of AWS/Pinecone")
+    parser.add_argument("--catalog-dir", type=str, default="/tmp/local-catalog")
+    parser.add_argument("--catalog-rows", type=int, default=10000)
+    args = parser.parse_args()
+
+    if args.local:
+        # Set before uvicorn forks, so every worker inherits it
+        os.environ.update(local_environment(args.catalog_dir))
+        if not os.path.exists(os.path.join(args.catalog_dir, "active_index.json")):
+            write_synthetic_catalog(args.catalog_dir, args.catalog_rows)
+
+    uvicorn.run(
+        "server:app",
+        app_dir=os.path.dirname(os.path.abspath(__file__)),
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        timeout_keep_alive=args.keep_alive,
+        lifespan="on",
+        access_log=False
+    )
@@ -0,0 +1,359 @@
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from multiprocessing.connection import wait
+
+import numpy as np
+
+from constraints import COLUMN_DTYPES, constraint_mask
+
+# Each shard worker is single-threaded; the shards are the parallelism
+BLAS_THREAD_VARIABLES = ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS")
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _top_k(scores, top_k):
+    # Per column: row positions of the top_k scores, best first
+    top_k = min(top_k, scores.shape[0])
+    top = np.argpartition(-scores, top_k - 1, axis=0)[:top_k]
+    top_scores = np.take_along_axis(scores, top, axis=0)
+    order = np.argsort(-top_scores, axis=0)
+    return np.take_along_axis(top, order, axis=0), np.take_along_axis(top_scores, order, axis=0)
+
+
+def _search_rows(embeddings, norms, columns, queries, top_k, constraints):
+    scores = (embeddings @ queries.T) / norms[:, None]
+    if constraints:
+        scores[~constraint_mask(columns(), constraints)] = -np.inf
+    return _top_k(scores, top_k)
+
+
+def _serve_shard(connections, local_dir, start, end):
+    """
+    Worker loop: exact cosine top-k over rows [start, end) of the catalog's embeddings
+
+    The embeddings (and constraint columns) are memory-mapped, so every
+    worker reads the one copy in the page cache. Each connection belongs to
+    one channel of the pool and gets exactly one reply per request, an error
+    included, so a failed search never leaves a reply behind for the next one.
+    """
+    embeddings = np.load(os.path.join(local_dir, "embeddings.npy"), mmap_mode="r")[start:end]
+    norms = np.maximum(np.linalg.norm(embeddings, axis=1), 1e-12).astype(np.float32)
+    loaded = {}
+
+    def columns():
+        if not loaded:
+            loaded.update({
+                name: np.load(os.path.join(local_dir, f"constraint_{name}.npy"), mmap_mode="r")[start:end]
+                for name in COLUMN_DTYPES
+            })
+        return loaded
+
+    connections[0].send("ready")
+    open_connections = list(connections)
+    while open_connections:
+        for conn in wait(open_connections):
+            try:
+                message = conn.recv()
+            except EOFError:
+                open_connections.remove(conn)
+                continue
+            if message is None:
+                return
+            try:
+                rows, top_scores = _search_rows(embeddings, norms, columns, *message)
+                reply = ("ok", rows + start, top_scores)
+            except Exception as e:
+                reply = ("error", f"{type(e).__name__}: {e}")
+            conn.send(reply)
+
+
+class ShardError(RuntimeError):
+    """
+    Raised when a shard worker couldn't answer a search
+    """
+
+
+class ShardPool:
+    """
+    Persistent worker processes, each searching one row range of a catalog
+    version's memory-mapped embeddings
+
+    A search is scattered to every shard and the per-shard top-k lists are
+    merged. Every worker has one pipe per channel and serves whichever is
+    ready, so up to `channels` searches from different threads are in flight
+    at once; callers with many queries at once should still pass them
+    together to search_many.
+
+    A worker that dies breaks the pool: the channel that
+    saw it is dropped and broken is set, and get_shard_pool starts a new pool.
+    Threads waiting for a channel of a broken or closed pool, or for longer
+    than wait_s, get a ShardError instead of waiting forever.
+
+    Workers are spawned, so the program that starts a pool needs the usual
+    if __name__ == "__main__" guard.
+    """
+
+    def __init__(self, local_dir, rows, shards, channels=4, wait_s=5.0):
+        """
+        Parameters:
+        - local_dir: Catalog version directory holding embeddings.npy
+        - rows: Number of catalog rows
+        - shards: Number of worker processes
+        - channels: Searches that may be in flight at once
+        - wait_s: Longest a search waits for a free channel
+        """
+        self.local_dir = local_dir
+        self.wait_s = wait_s
+        self.broken = False
+        shards = max(1, min(shards, rows))
+        self.bounds = np.linspace(0, rows, shards + 1).astype(np.int64)
+        self._processes = []
+        self._shard_connections = []
+
+        # channel_ends[c][s]: (parent, child) pipe between channel c and shard s
+        context = multiprocessing.get_context("spawn")
+        channel_ends = [[context.Pipe() for _ in range(shards)] for _ in range(max(1, channels))]
+        self._channels = queue.Queue()
+        for ends in channel_ends:
+            self._channels.put([parent for parent, _ in ends])
+
+        # Spawned workers read the thread settings from the environment they start with
+        saved = {name: os.environ.get(name) for name in BLAS_THREAD_VARIABLES}
+        os.environ.update({name: "1" for name in BLAS_THREAD_VARIABLES})
+        try:
+            for shard, (start, end) in enumerate(zip(self.bounds[:-1], self.bounds[1:])):
+                process = context.Process(
+                    target=_serve_shard,
+                    args=([ends[shard][1] for ends in channel_ends], local_dir, int(start), int(end)),
+                    daemon=True
+                )
+                process.start()
+                self._processes.append(process)
+                self._shard_connections.append([ends[shard][0] for ends in channel_ends])
+        finally:
+            for name, value in saved.items():
+                if value is None:
+                    os.environ.pop(name, None)
+                else:
+                    os.environ[name] = value
+
+        for ends in channel_ends:
+            for _, child in ends:
+                child.close()
+        for connections in self._shard_connections:
+            connections[0].recv()
+        print(f"[INFO] Started {shards} search shards over {rows} rows, {len(channel_ends)} channels")
+
+    def __len__(self):
+        return len(self._processes)
+
+    def search_many(self, queries, top_k, constraints=None):
+        """
+        Exact cosine top-k for several queries at once
+
+        Parameters:
+        - queries: Query embeddings, one per row
+        - top_k: Matches per query
+        - constraints: Hard constraints from constraints_for, applied in the shards
+
+        Returns:
+        - (rows, scores): arrays of shape (len(queries), top_k), best first;
+          rows excluded by the constraints have score -inf
+
+        Raises:
+        - ShardError: A worker failed the search, or died (then the pool is broken)
+        """
+        if self.broken:
+            raise ShardError("Shard pool is broken")
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        message = (queries, top_k, constraints or None)
+
+        try:
+            channel = self._channels.get(timeout=self.wait_s)
+        except queue.Empty:
+            raise ShardError(f"No free search channel within {self.wait_s} s")
+        if channel is None:
+            # Pass the sentinel on to the next waiter
+            self._channels.put(None)
+            raise ShardError("Shard pool is broken")
+        try:
+            for conn in channel:
+                conn.send(message)
+            replies = [conn.recv() for conn in channel]
+        except (EOFError, OSError) as e:
+            # Other shards' replies may still be queued on this channel, so it is never reused
+            self._break()
+            raise ShardError(f"Shard worker is gone: {e!r}")
+        self._channels.put(channel)
+
+        errors = [reply[1] for reply in replies if reply[0] == "error"]
+        if errors:
+            raise ShardError(f"Shard search failed: {errors[0]}")
+
+        # Gather: the global top_k is among the shards' top_k lists
+        rows = np.concatenate([shard_rows for _, shard_rows, _ in replies])
+        scores = np.concatenate([shard_scores for _, _, shard_scores in replies])
+        top, top_scores = _top_k(scores, top_k)
+        return np.take_along_axis(rows, top, axis=0).T, top_scores.T
+
+    def search(self, vector, top_k, constraints=None):
+        """
+        Exact cosine top-k for one query
+
+        Returns:
+        - List of (row, score), best first, without rows excluded by the constraints
+        """
+        rows, scores = self.search_many([vector], top_k, constraints)
+        return [(int(row), float(score)) for row, score in zip(rows[0], scores[0]) if np.isfinite(score)]
+
+    def _break(self):
+        # Wakes the threads waiting for a channel; each one puts the sentinel back
+        self.broken = True
+        self._channels.put(None)
+
+    def close(self):
+        self._break()
+        for connections in self._shard_connections:
+            try:
+                connections[0].send(None)
+            except OSError:
+                pass
+        for process in self._processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        for connections in self._shard_connections:
+            for conn in connections:
+                conn.close()
+
+
+def search_shards():
+    # SEARCH_SHARDS: worker processes for the catalog search backend; 0 or 1 searches in process
+    return int(os.environ.get('SEARCH_SHARDS', '0'))
+
+
+def get_shard_pool(catalog):
+    """
+    Returns the shard pool for a catalog version, restarting it when the
+    version changes or the pool is broken
+
+    Every process that searches (each server.py worker, say) starts its own
+    pool, but all of them map the same embeddings file.
+
+    Configuration (environment variables):
+    - SEARCH_SHARDS: Worker processes; 0 or 1 searches in process
+    - SEARCH_SHARD_CHANNELS: Searches in flight at once (default 4)
+    - SEARCH_SHARD_WAIT_MS: Longest a search waits for a free channel (default 5000)
+
+    Parameters:
+    - catalog: CatalogStore of the active version
+
+    Returns:
+    - ShardPool, or None when SEARCH_SHARDS is 0 or 1
+    """
+    global _pool
+    shards = search_shards()
+    if shards <= 1:
+        return None
+    with _pool_lock:
+        if _pool is None or _pool.broken or _pool.local_dir != catalog.local_dir:
+            if _pool is not None:
+                _pool.close()
+            catalog.array("embeddings")  # downloads it if needed
+            _pool = ShardPool(
+                catalog.local_dir, len(catalog), shards,
+                channels=int(os.environ.get('SEARCH_SHARD_CHANNELS', '4')),
+                wait_s=float(os.environ.get('SEARCH_SHARD_WAIT_MS', '5000')) / 1000
+            )
+        return _pool
+
+
+def discard_shard_pool(pool):
+    """
+    Stops pool if it is still the process's pool, so the next search starts a new one
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.close()
+
+
+def benchmark_scaling(rows=500000, dim=384, shard_counts=(1, 2, 4), queries=200, batch=1, clients=1,
+                      directory="/tmp/shard-benchmark", seed=0):
+    """
+    Measures search throughput at increasing shard counts over one memory-mapped matrix
+
+    Parameters:
+    - rows: Catalog rows
+    - dim: Embedding dimension
+    - shard_counts: Worker counts to measure
+    - queries: Queries per measurement
+    - batch: Queries sent per search_many call
+    - clients: Threads searching at once, each on its own channel
+    - directory: Where the synthetic embeddings.npy is written
+
+    Returns:
+    - List of dictionaries with throughput and latency per shard count
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    rng = np.random.default_rng(seed)
+    path = os.path.join(directory, "embeddings.npy")
+    if not os.path.exists(path) or np.load(path, mmap_mode="r").shape != (rows, dim):
+        os.makedirs(directory, exist_ok=True)
+        np.save(path, rng.normal(size=(rows, dim)).astype(np.float32))
+    vectors = rng.normal(size=(queries, dim)).astype(np.float32)
+
+    results = []
+    for shards in shard_counts:
+        pool = ShardPool(directory, rows, shards, channels=clients)
+        try:
+            pool.search_many(vectors[:batch], 10)
+
+            def timed(i):
+                call_start = time.perf_counter()
+                pool.search_many(vectors[i:i + batch], 10)
+                return (time.perf_counter() - call_start) * 1000
+
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=clients) as executor:
+                timings = list(executor.map(timed, range(0, queries, batch)))
+            elapsed = time.perf_counter() - start
+        finally:
+            pool.close()
+        results.append({
+            "shards": shards,
+            "clients": clients,
+            "qps": queries / elapsed,
+            "p50_ms": float(np.percentile(timings, 50)),
+            "p95_ms": float(np.percentile(timings, 95))
+        })
+    for result in results:
+        result["speedup"] = result["qps"] / results[0]["qps"]
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Throughput of the sharded catalog search from 1 to N worker processes")
+    parser.add_argument("--rows", type=int, default=500000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4, os.cpu_count() or 1])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--batch", type=int, default=1)
+    parser.add_argument("--clients", type=int, default=4, help="Concurrent searching threads")
+    args = parser.parse_args()
+
+    print(json.dumps(
+        benchmark_scaling(args.rows, args.dim, sorted(set(args.shards)), args.queries, args.batch, args.clients),
+        indent=2
+    ))
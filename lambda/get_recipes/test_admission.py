@@ -0,0 +1,84 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("boto3")
+
+import admission
+from admission import AdaptiveLimit, AdmissionController, DependencyGate, Overloaded, run_admitted
+from async_pipeline import Dependencies, recommend_async, stub_embed, stub_search
+from degradation import Degradation, RequestBudget
+from recommendation import build_query_string, filterAllergiesAndDislikes
+
+
+def controller(embed_limit, search_limit, max_queue=64):
+    return AdmissionController({
+        "embed": DependencyGate("embed", AdaptiveLimit(embed_limit, max_limit=embed_limit), max_queue),
+        "search": DependencyGate("search", AdaptiveLimit(search_limit, max_limit=search_limit), max_queue)
+    })
+
+
+@pytest.fixture
+def admission_on(monkeypatch):
+    monkeypatch.setenv("ADMISSION_CONTROL", "1")
+
+    def install(instance):
+        monkeypatch.setattr(admission, "_controller", instance)
+        return instance
+    return install
+
+
+def test_admitted_calls_run_up_to_the_limit(admission_on):
+    admission_on(controller(embed_limit=1, search_limit=16))
+    running = [0, 0]
+    lock = threading.Lock()
+
+    def search():
+        with lock:
+            running[0] += 1
+            running[1] = max(running[1], running[0])
+        time.sleep(0.2)
+        with lock:
+            running[0] -= 1
+
+    threads = [
+        threading.Thread(target=run_admitted, args=("search", search), kwargs={
+            "priority": "interactive", "budget": RequestBudget(), "stage_max_ms": 2000
+        })
+        for _ in range(16)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # More than the 8 threads of the shared deadline pool
+    assert running[1] == 16
+
+
+def run_pipeline(priority):
+    deps = Dependencies(stub_embed, stub_search, filterAllergiesAndDislikes, build_query_string)
+    degradation = Degradation()
+    recipes, _ = asyncio.run(recommend_async(
+        {"username": priority}, {"meal_type": "Dinner"}, deps=deps, degradation=degradation, priority=priority
+    ))
+    return recipes, degradation
+
+
+def test_async_path_sheds_at_the_gate(admission_on):
+    gates = admission_on(controller(embed_limit=1, search_limit=1, max_queue=0)).gates
+    # The only embed slot is taken and nothing may queue
+    gates["embed"].acquire("interactive", 0)
+    try:
+        with pytest.raises(Overloaded):
+            run_pipeline("batch")
+
+        recipes, degradation = run_pipeline("interactive")
+        assert "embed is overloaded" in degradation.reason
+    finally:
+        gates["embed"].release_unused()
+
+    recipes, degradation = run_pipeline("interactive")
+    assert recipes and not degradation.degraded
@@ -0,0 +1,121 @@
+import asyncio
+import json
+import time
+
+import pytest
+
+pytest.importorskip("boto3")
+
+from async_pipeline import Dependencies, recommend_async, stub_embed, stub_search
+from degradation import Degradation, RequestBudget
+from recommendation import build_query_string, filterAllergiesAndDislikes
+
+SLOW_CALL_S = 2.0
+
+
+def slow_search(embedding_vector, top_k=None, constraints=None):
+    time.sleep(SLOW_CALL_S)
+    return stub_search(embedding_vector, top_k, constraints)
+
+
+def stand_ins(**overrides):
+    return Dependencies(
+        embed=overrides.pop("embed", stub_embed),
+        search=overrides.pop("search", stub_search),
+        filter_fn=overrides.pop("filter_fn", filterAllergiesAndDislikes),
+        build_query=build_query_string,
+        **overrides
+    )
+
+
+def test_abandoned_stage_does_not_hold_up_the_request(monkeypatch):
+    monkeypatch.setenv("SEARCH_TIMEOUT_MS", "100")
+    degradation = Degradation()
+
+    start = time.perf_counter()
+    recipes, source = asyncio.run(recommend_async(
+        {"username": "slow"}, {"meal_type": "Dinner"}, deps=stand_ins(search=slow_search),
+        budget=RequestBudget(), degradation=degradation
+    ))
+    elapsed = time.perf_counter() - start
+
+    assert elapsed < SLOW_CALL_S / 2
+    assert source is None
+    assert degradation.degraded
+    assert "search exceeded" in degradation.reason
+
+
+def test_cache_hit_skips_embed_and_search():
+    def fail(*args):
+        raise AssertionError("should not be called")
+
+    cached = [{"id": "7", "score": 0.9, "metadata": {}}]
+    recipes, source = asyncio.run(recommend_async(
+        {"username": "cached"}, {"meal_type": "Dinner"},
+        deps=stand_ins(embed=fail, search=fail, cache_lookup=lambda user_data, request_data: ("cache", cached))
+    ))
+
+    assert (recipes, source) == (cached, "cache")
+
+
+@pytest.mark.parametrize("async_path", [False, True])
+def test_stored_profile_is_used_and_cached_under_the_merged_block(local_stack, monkeypatch, async_path):
+    pytest.importorskip("pinecone")
+    import lambda_function
+    from response_cache import get_response_cache
+
+    username = f"returning-{async_path}"
+    stored = {"allergies": ["Peanuts"], "dislikes": ["tofu"], "macros": {"protein": "high"}}
+    monkeypatch.setattr(lambda_function, "load_profile", lambda name: stored if name == username else None)
+    if async_path:
+        monkeypatch.setenv("ASYNC_REQUEST_PATH", "1")
+    request = {"meal_type": "Dinner", "max_time_minutes": 60, "ingredients_available": ["rice"]}
+
+    response = lambda_function.handle_event({"user": {"username": username}, "request": request}, None)
+    recipes = json.loads(response["body"])["recipes"]
+
+    assert recipes
+    assert not any(
+        "peanuts" in recipe["metadata"]["ingredients"] or "tofu" in recipe["metadata"]["ingredients"]
+        for recipe in recipes
+    )
+    cache = get_response_cache()
+    merged = {**stored, "username": username}
+    assert cache.get(cache.key_for(merged, request))[:len(recipes)] == recipes
+
+
+def test_sync_and_async_paths_agree_on_a_stored_profile(local_stack, monkeypatch):
+    pytest.importorskip("pinecone")
+    import lambda_function
+
+    stored = {"allergies": ["Peanuts"], "likes": ["rice"]}
+    monkeypatch.setattr(lambda_function, "load_profile", lambda name: stored)
+    request = {"meal_type": "Lunch", "max_time_minutes": 90, "ingredients_available": ["egg", "cheese"]}
+
+    ids = {}
+    for async_path in (False, True):
+        monkeypatch.setenv("ASYNC_REQUEST_PATH", "1" if async_path else "")
+        response = lambda_function.handle_event({"user": {"username": f"agree-{async_path}"}, "request": request}, None)
+        ids[async_path] = [recipe["id"] for recipe in json.loads(response["body"])["recipes"]]
+
+    assert ids[False] and ids[False] == ids[True]
+
+
+def test_handler_returns_within_its_deadline(local_stack, monkeypatch):
+    pytest.importorskip("pinecone")
+    import lambda_function
+
+    monkeypatch.setenv("ASYNC_REQUEST_PATH", "1")
+    monkeypatch.setenv("SEARCH_TIMEOUT_MS", "100")
+    monkeypatch.setattr(lambda_function, "search_index", slow_search)
+
+    start = time.perf_counter()
+    response = lambda_function.handle_event(
+        {"user": {"username": "deadline"}, "request": {"meal_type": "Lunch", "max_time_minutes": 45}}, None
+    )
+    elapsed = time.perf_counter() - start
+
+    body = json.loads(response["body"])
+    assert response["statusCode"] == 200
+    assert body["degraded"]
+    assert elapsed < SLOW_CALL_S / 2
@@ -0,0 +1,75 @@
+import threading
+
+import pytest
+
+from batching import MicroBatcher
+# Importable once batching has found monitoring/
+import metrics
+from metrics import LocalSink, MetricsBuffer
+
+CALLERS = 8
+
+
+@pytest.fixture
+def sink(monkeypatch):
+    sink = LocalSink()
+    monkeypatch.setattr(metrics, "_metrics", MetricsBuffer("Test", sink, flush_interval_s=3600))
+    return sink
+
+
+def embed_concurrently(batcher, queries):
+    start = threading.Barrier(len(queries))
+    results = {}
+
+    def call(query):
+        start.wait()
+        results[query] = batcher.embed(query, timeout=5)
+
+    threads = [threading.Thread(target=call, args=(query,)) for query in queries]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_concurrent_calls_share_one_batch_and_get_their_own_vectors(sink):
+    batches = []
+
+    def batch_fn(queries):
+        batches.append(list(queries))
+        return [[float(len(query)), float(query.split()[-1])] for query in queries]
+
+    batcher = MicroBatcher(batch_fn, max_batch_size=CALLERS, max_wait_ms=500)
+    try:
+        queries = [f"query {'x' * i} {i}" for i in range(CALLERS)]
+        results = embed_concurrently(batcher, queries)
+    finally:
+        batcher.close()
+
+    assert len(batches) == 1 and sorted(batches[0]) == sorted(queries)
+    assert results == {query: [float(len(query)), float(query.split()[-1])] for query in queries}
+    assert batcher.metrics()["batch_size_histogram"] == {CALLERS: 1}
+
+    metrics.get_metrics().flush()
+    (batch_size,) = sink.datums("EmbedBatchSize")
+    assert batch_size["Counts"] == [1.0] and batch_size["Values"][0] == pytest.approx(CALLERS, rel=0.02)
+    assert sink.datums("EmbedQueueDepth")[0]["Value"] == 0.0
+    assert sink.datums("EmbedQueueWait")
+
+
+def test_a_failed_batch_fails_each_caller_and_is_counted(sink):
+    def batch_fn(queries):
+        raise RuntimeError("endpoint unavailable")
+
+    batcher = MicroBatcher(batch_fn, max_batch_size=2, max_wait_ms=500)
+    try:
+        futures = [batcher.submit(query) for query in ("a", "b")]
+        for future in futures:
+            with pytest.raises(RuntimeError, match="endpoint unavailable"):
+                future.result(timeout=5)
+    finally:
+        batcher.close()
+
+    metrics.get_metrics().flush()
+    assert sink.datums("EmbedBatchErrors")[0]["Value"] == 1.0
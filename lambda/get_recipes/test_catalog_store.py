@@ -0,0 +1,33 @@
+import os
+
+import pytest
+
+pytest.importorskip("boto3")
+
+from catalog_store import remove_old_versions
+
+
+def make_versions(root, names):
+    # names are newest first
+    for age, name in enumerate(names):
+        path = root / name
+        path.mkdir()
+        os.utime(path, (1000 - age, 1000 - age))
+
+
+def test_previous_version_survives_the_switch(tmp_path):
+    # v3 was activated last, v2 before it
+    make_versions(tmp_path, ["v3", "v2", "v1", "v0"])
+    (tmp_path / "active_index.json").write_text("{}")
+
+    remove_old_versions(str(tmp_path), "v3")
+
+    assert sorted(os.listdir(tmp_path)) == ["active_index.json", "v2", "v3"]
+
+
+def test_unknown_fallback_is_neither_removed_nor_counted(tmp_path):
+    make_versions(tmp_path, ["unknown", "v2", "v1"])
+
+    remove_old_versions(str(tmp_path), "v3")
+
+    assert sorted(os.listdir(tmp_path)) == ["unknown", "v2"]
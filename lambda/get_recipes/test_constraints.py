@@ -0,0 +1,112 @@
+import numpy as np
+import pytest
+
+from constraints import (
+    ALL_MEAL_TYPES,
+    MAX_MINUTES,
+    RANK_CODES,
+    UNKNOWN_MINUTES,
+    UNKNOWN_RANK,
+    constraint_mask,
+    constraints_for,
+    metadata_fields,
+    pinecone_filter
+)
+
+ROWS = 5000
+
+
+@pytest.fixture(scope="module")
+def columns():
+    rng = np.random.default_rng(0)
+    ranks = [0, 1, 2, UNKNOWN_RANK]
+    return {
+        "total_minutes": rng.integers(UNKNOWN_MINUTES, 120, size=ROWS).astype(np.int16),
+        "meal_types": rng.integers(1, ALL_MEAL_TYPES + 1, size=ROWS).astype(np.uint8),
+        "protein_rank": rng.choice(ranks, size=ROWS).astype(np.uint8),
+        "fat_rank": rng.choice(ranks, size=ROWS).astype(np.uint8),
+        "carb_rank": rng.choice(ranks, size=ROWS).astype(np.uint8)
+    }
+
+
+def matches(metadata, metadata_filter):
+    # The subset of Pinecone's filter language pinecone_filter emits
+    if metadata_filter is None:
+        return True
+    if "$and" in metadata_filter:
+        return all(matches(metadata, clause) for clause in metadata_filter["$and"])
+    ((field, condition),) = metadata_filter.items()
+    value = metadata[field]
+    if "$lte" in condition:
+        return value <= condition["$lte"]
+    values = value if isinstance(value, list) else [value]
+    return any(v in condition["$in"] for v in values)
+
+
+@pytest.mark.parametrize("user_data,request_data", [
+    ({}, {}),
+    ({}, {"max_time_minutes": 30}),
+    ({}, {"meal_type": "Dessert"}),
+    ({"macros": {"protein": "high"}}, {"max_time_minutes": 45, "meal_type": "Dinner"}),
+    ({"macros": {"protein": "low", "fats": "medium", "carbs": "High"}}, {"meal_type": "Breakfast"}),
+    ({"macros": {"protein": "lots"}}, {"max_time_minutes": 0, "meal_type": "Brunch"})
+])
+def test_mask_matches_the_metadata_filter(columns, monkeypatch, user_data, request_data):
+    monkeypatch.setenv("HARD_MACRO_CONSTRAINTS", "1")
+    constraints = constraints_for(user_data, request_data)
+
+    mask = constraint_mask(columns, constraints)
+    metadata_filter = pinecone_filter(constraints)
+    expected = np.array([matches(metadata_fields(columns, row), metadata_filter) for row in range(ROWS)])
+
+    np.testing.assert_array_equal(mask, expected)
+
+
+def test_macros_are_preferences_unless_hard_constraints_are_on(monkeypatch):
+    user_data = {"macros": {"protein": "high", "fats": "low"}}
+    monkeypatch.delenv("HARD_MACRO_CONSTRAINTS", raising=False)
+    assert constraints_for(user_data, {})["macros"] == {}
+
+    monkeypatch.setenv("HARD_MACRO_CONSTRAINTS", "true")
+    assert constraints_for(user_data, {})["macros"] == {
+        "protein_rank": RANK_CODES["high"], "fat_rank": RANK_CODES["low"]
+    }
+
+
+@pytest.mark.parametrize("max_time_minutes,expected", [
+    (30, 30),
+    ("45", 45),
+    (12.5, 12),
+    (10**9, MAX_MINUTES),
+    (-20, 0),
+    ("soon", None),
+    ("", None),
+    (["30"], None),
+    (float("nan"), None),
+    (True, None)
+])
+def test_bad_time_budgets_are_clamped_or_ignored(max_time_minutes, expected):
+    assert constraints_for({}, {"max_time_minutes": max_time_minutes})["max_minutes"] == expected
+
+
+def test_negative_budget_keeps_recipes_with_unknown_times():
+    columns = {
+        "total_minutes": np.array([UNKNOWN_MINUTES, 0, 5], dtype=np.int16),
+        "meal_types": np.full(3, ALL_MEAL_TYPES, dtype=np.uint8)
+    }
+    constraints = constraints_for({}, {"max_time_minutes": -5})
+
+    assert constraint_mask(columns, constraints).tolist() == [True, True, False]
+
+
+def test_unknown_values_pass_every_constraint():
+    constraints = {"max_minutes": 10, "meal_type": "Snack", "macros": {"protein_rank": RANK_CODES["high"]}}
+    unknown = {
+        "total_minutes": np.array([UNKNOWN_MINUTES], dtype=np.int16),
+        "meal_types": np.array([ALL_MEAL_TYPES], dtype=np.uint8),
+        "protein_rank": np.array([UNKNOWN_RANK], dtype=np.uint8),
+        "fat_rank": np.array([UNKNOWN_RANK], dtype=np.uint8),
+        "carb_rank": np.array([UNKNOWN_RANK], dtype=np.uint8)
+    }
+
+    assert constraint_mask(unknown, constraints).tolist() == [True]
@@ -0,0 +1,62 @@
+import json
+import threading
+
+import pytest
+
+pytest.importorskip("boto3")
+
+import degradation
+from degradation import load_popular_recipes, popular_fallback, prefetch_popular_recipes
+from recommendation import filterAllergiesAndDislikes
+
+
+@pytest.fixture
+def popular(monkeypatch):
+    monkeypatch.setattr(degradation, "_popular_recipes", None)
+    monkeypatch.setattr(degradation, "_popular_loader", None)
+    monkeypatch.setattr(degradation, "_popular_failed_at", None)
+    return monkeypatch
+
+
+def test_failing_loads_run_one_at_a_time_and_back_off(popular, tmp_path):
+    popular.setenv("POPULAR_RECIPES_S3_URI", str(tmp_path / "missing.json"))
+    release = threading.Event()
+    calls = []
+
+    def slow_load():
+        calls.append(1)
+        release.wait(5)
+        return load_popular_recipes()
+    popular.setattr(degradation, "load_popular_recipes", slow_load)
+
+    for _ in range(50):
+        prefetch_popular_recipes()
+    release.set()
+    degradation._popular_loader.join(5)
+    assert len(calls) == 1
+    assert degradation._popular_failed_at is not None
+
+    # Within the retry interval a failed load is not retried
+    for _ in range(50):
+        prefetch_popular_recipes()
+    assert len(calls) == 1
+
+    popular.setenv("POPULAR_RETRY_SECONDS", "0")
+    prefetch_popular_recipes()
+    degradation._popular_loader.join(5)
+    assert len(calls) == 2
+
+
+def test_local_popular_recipes_are_served_filtered(popular, tmp_path):
+    path = tmp_path / "popular_recipes.json"
+    path.write_text(json.dumps([
+        {"id": "1", "score": 5.0, "metadata": {"ingredients": str(["peanuts", "rice"])}},
+        {"id": "2", "score": 4.0, "metadata": {"ingredients": str(["tofu", "rice"])}}
+    ]))
+    popular.setenv("POPULAR_RECIPES_S3_URI", str(path))
+
+    assert popular_fallback(["peanuts"], [], filterAllergiesAndDislikes) == []
+    prefetch_popular_recipes()
+    degradation._popular_loader.join(5)
+
+    assert [recipe["id"] for recipe in popular_fallback(["peanuts"], [], filterAllergiesAndDislikes)] == ["2"]
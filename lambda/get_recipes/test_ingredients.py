@@ -0,0 +1,154 @@
+import importlib.util
+import json
+import os
+
+import numpy as np
+import pytest
+
+from ingredients import IngredientIndex
+
+VOCABULARY = ["beans", "cheese", "egg", "garlic", "onion", "rice", "tomato"]
+RECIPES = [
+    ["rice", "beans"],
+    ["egg", "cheese", "onion"],
+    [],
+    ["tomato", "garlic", "onion", "rice"],
+    ["egg"],
+    ["cheese", "rice", "beans", "garlic", "egg"],
+    ["onion", "garlic"]
+]
+
+
+def build_index(vocabulary, recipes):
+    ids = [sorted(vocabulary.index(name) for name in set(recipe)) for recipe in recipes]
+    indptr = np.zeros(len(recipes) + 1, dtype=np.uint32)
+    np.cumsum([len(row) for row in ids], out=indptr[1:])
+    indices = np.array([i for row in ids for i in row], dtype=np.uint32)
+    return IngredientIndex(vocabulary, indptr, indices)
+
+
+def brute_force(recipes, have, max_missing=None, allowed=None):
+    results = []
+    for row, recipe in enumerate(recipes):
+        matched = len(set(recipe) & set(have))
+        coverage = matched / len(recipe) if recipe else 0.0
+        missing = len(set(recipe)) - matched
+        results.append((row, coverage, missing, matched))
+    if max_missing is None:
+        return results
+    kept = [
+        (row, coverage, missing) for row, coverage, missing, matched in results
+        if matched > 0 and missing <= max_missing and (allowed is None or allowed[row])
+    ]
+    return sorted(kept, key=lambda result: (result[2], -result[1], result[0]))
+
+
+def random_catalog(seed, rows=300, vocabulary_size=40):
+    rng = np.random.default_rng(seed)
+    vocabulary = [f"ingredient {i:02d}" for i in range(vocabulary_size)]
+    recipes = [list(rng.choice(vocabulary, size=rng.integers(0, 9), replace=False)) for _ in range(rows)]
+    have = list(rng.choice(vocabulary, size=8, replace=False))
+    return vocabulary, recipes, have
+
+
+def test_encode_normalizes_and_drops_unknown_names():
+    index = build_index(VOCABULARY, RECIPES)
+    assert index.encode(["  Rice", "ONION", "saffron", "rice"]).tolist() == [VOCABULARY.index("onion"), VOCABULARY.index("rice")]
+    assert len(index.encode(None)) == 0
+
+
+@pytest.mark.parametrize("rows", [[0, 1, 2, 3, 4, 5, 6], [5, 2, 5, 0], [2], []])
+def test_coverage_matches_brute_force(rows):
+    index = build_index(VOCABULARY, RECIPES)
+    have = ["rice", "egg", "onion", "garlic"]
+
+    coverage, missing = index.coverage(rows, index.encode(have))
+
+    expected = brute_force(RECIPES, have)
+    np.testing.assert_allclose(coverage, [expected[row][1] for row in rows], rtol=1e-6)
+    assert missing.tolist() == [expected[row][2] for row in rows]
+
+
+def test_coverage_without_ingredients_is_zero():
+    index = build_index(VOCABULARY, RECIPES)
+    coverage, missing = index.coverage([1, 3], index.encode([]))
+    assert coverage.tolist() == [0.0, 0.0]
+    assert missing.tolist() == [3, 4]
+
+
+@pytest.mark.parametrize("max_missing", [0, 1, 2, 5])
+def test_cook_with_matches_brute_force(max_missing):
+    index = build_index(VOCABULARY, RECIPES)
+    have = ["rice", "egg", "onion", "garlic", "cheese"]
+
+    rows, coverage, missing = index.cook_with(index.encode(have), max_missing)
+
+    expected = brute_force(RECIPES, have, max_missing)
+    assert rows.tolist() == [row for row, _, _ in expected]
+    np.testing.assert_allclose(coverage, [c for _, c, _ in expected], rtol=1e-6)
+    assert missing.tolist() == [m for _, _, m in expected]
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_random_catalogs_match_brute_force(seed):
+    vocabulary, recipes, have = random_catalog(seed)
+    index = build_index(vocabulary, recipes)
+    allowed = np.random.default_rng(seed + 100).random(len(recipes)) < 0.7
+    have_ids = index.encode(have)
+
+    rows, coverage, missing = index.cook_with(have_ids, max_missing=3, mask=allowed)
+    expected = brute_force(recipes, have, 3, allowed)
+    assert rows.tolist() == [row for row, _, _ in expected]
+    np.testing.assert_allclose(coverage, [c for _, c, _ in expected], rtol=1e-6)
+    assert missing.tolist() == [m for _, _, m in expected]
+
+    shuffled = np.random.default_rng(seed).permutation(len(recipes))
+    coverage, missing = index.coverage(shuffled, have_ids)
+    every = brute_force(recipes, have)
+    np.testing.assert_allclose(coverage, [every[row][1] for row in shuffled], rtol=1e-6)
+    assert missing.tolist() == [every[row][2] for row in shuffled]
+
+
+def test_preprocessing_builds_the_same_layout():
+    pd = pytest.importorskip("pandas")
+    pytest.importorskip("boto3")
+    pytest.importorskip("isodate")
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data_preprocessing", "lambda_function.py")
+    # Loaded under its own name: this directory has a lambda_function module too
+    spec = importlib.util.spec_from_file_location("data_preprocessing_lambda", path)
+    preprocessing = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(preprocessing)
+
+    # As preprocessing sees them: R vectors become lists, one ingredient stays a string
+    parts = pd.Series([["Rice", "beans", "rice"], "Egg", None, ["tomato ", "garlic", "onion", "rice"]])
+    vocabulary, indptr, indices = preprocessing.build_ingredient_csr(parts)
+
+    expected = build_index(["beans", "egg", "garlic", "onion", "rice", "tomato"], [
+        ["rice", "beans"], ["egg"], [], ["tomato", "garlic", "onion", "rice"]
+    ])
+    assert vocabulary == expected.vocabulary
+    assert indptr.tolist() == expected.indptr.tolist()
+    assert indices.tolist() == expected.indices.tolist()
+
+
+def test_pantry_route_orders_by_missing_then_coverage(local_stack):
+    pytest.importorskip("boto3")
+    pytest.importorskip("pinecone")
+    import lambda_function
+
+    event = {
+        "user": {"username": "pantry", "allergies": ["peanuts"]},
+        "request": {
+            "search_mode": "pantry",
+            "meal_type": "Dinner",
+            "ingredients_available": ["rice", "Chicken", "garlic", "onion", "salt", "pepper", "egg", "butter"]
+        }
+    }
+    response = lambda_function.handle_event(event, None)
+    recipes = json.loads(response["body"])["recipes"]
+
+    assert response["statusCode"] == 200 and recipes
+    keys = [(recipe["missing_ingredients"], -recipe["score"]) for recipe in recipes]
+    assert keys == sorted(keys)
+    assert all(recipe["missing_ingredients"] <= 2 for recipe in recipes)
+    assert not any("peanuts" in recipe["metadata"]["ingredients"] for recipe in recipes)
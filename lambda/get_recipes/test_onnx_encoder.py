@@ -0,0 +1,45 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+pytest.importorskip("boto3")
+pytest.importorskip("onnxruntime")
+pytest.importorskip("tokenizers")
+pytest.importorskip("torch")
+pytest.importorskip("transformers")
+
+from onnx_encoder import OnnxQueryEncoder, check_parity
+
+# The optimization step exports and quantizes the artifact the Lambda serves
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "pipeline_steps"))
+from model_optimization import DEFAULT_VALIDATION_SENTENCES, ExportOnnx, QuantizeOnnx, TorchEncoder
+
+MODEL_ID = os.environ.get("PARITY_MODEL_ID", "sentence-transformers/all-MiniLM-L6-v2")
+MIN_COSINE = 0.99
+
+
+@pytest.fixture(scope="module")
+def model_dir(tmp_path_factory):
+    model_dir = str(tmp_path_factory.mktemp("onnx-encoder"))
+    QuantizeOnnx(ExportOnnx(MODEL_ID, model_dir), os.path.join(model_dir, "model.onnx"))
+    return model_dir
+
+
+def test_quantized_encoder_agrees_with_the_fp32_model(model_dir):
+    reference = TorchEncoder(MODEL_ID)
+    report = check_parity(
+        OnnxQueryEncoder(model_dir, num_threads=1), DEFAULT_VALIDATION_SENTENCES,
+        lambda sentence: reference([sentence])[0], min_cosine=MIN_COSINE
+    )
+
+    assert report["passed"], f"min cosine {report['cosine_min']:.4f} below {MIN_COSINE}"
+
+
+def test_padding_does_not_change_a_query_vector(model_dir):
+    encoder = OnnxQueryEncoder(model_dir, num_threads=1)
+    batched = encoder.encode(DEFAULT_VALIDATION_SENTENCES)
+    single = np.concatenate([encoder.encode([sentence]) for sentence in DEFAULT_VALIDATION_SENTENCES])
+
+    np.testing.assert_allclose(batched, single, rtol=1e-3, atol=1e-4)
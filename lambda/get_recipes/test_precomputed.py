@@ -0,0 +1,45 @@
+import pytest
+
+pytest.importorskip("boto3")
+
+import precomputed
+from precomputed import lookup_precomputed, precomputed_entry, precomputed_key
+from response_cache import LocalDirectoryBackend
+
+PROFILE = {"username": "batch", "allergies": ["peanuts"], "likes": ["tofu"]}
+DEFAULT_REQUEST = {
+    "ingredients_available": [],
+    "max_time_minutes": 30,
+    "meal_type": "Dinner",
+    "preferences": {"spice_level": "medium", "diet_type": "none"}
+}
+
+
+@pytest.fixture
+def lookups(tmp_path, monkeypatch):
+    monkeypatch.setenv("PRECOMPUTED_BACKEND", "local")
+    monkeypatch.setenv("PRECOMPUTED_DIR", str(tmp_path))
+    monkeypatch.setattr(precomputed, "_store", None)
+    monkeypatch.setattr(precomputed, "get_active_index_version", lambda: {"version": "v1"})
+    counted = []
+    monkeypatch.setattr(precomputed, "count_lookup", counted.append)
+    LocalDirectoryBackend(str(tmp_path), max_entries=10**6).set(
+        precomputed_key(PROFILE, DEFAULT_REQUEST), precomputed_entry([{"id": "1"}], "v1"), 3600
+    )
+    return counted
+
+
+def test_requests_differing_only_in_empty_fields_share_a_key():
+    sparse = {"max_time_minutes": 30, "meal_type": "Dinner", "preferences": {"spice_level": "medium", "diet_type": "none"}}
+    assert precomputed_key(PROFILE, sparse) == precomputed_key(PROFILE, DEFAULT_REQUEST)
+    assert precomputed_key(PROFILE, {**sparse, "preferences": {**sparse["preferences"], "diet_type": ""}}) != \
+        precomputed_key(PROFILE, DEFAULT_REQUEST)
+
+
+def test_eligible_lookups_count_hits_and_misses(lookups):
+    assert lookup_precomputed(PROFILE, {**DEFAULT_REQUEST, "ingredients_available": None}) == [{"id": "1"}]
+    assert lookup_precomputed(PROFILE, {**DEFAULT_REQUEST, "meal_type": "Lunch"}) is None
+    # Requests with ingredients are never precomputed, so they are not counted
+    assert lookup_precomputed(PROFILE, {**DEFAULT_REQUEST, "ingredients_available": ["rice"]}) is None
+
+    assert lookups == ["Hits", "Misses"]
@@ -0,0 +1,117 @@
+import json
+
+import numpy as np
+import pytest
+
+from constraints import MACRO_COLUMNS, RANK_CODES
+from ingredients import IngredientIndex
+from rerank import DEFAULT_WEIGHTS, MAX_RATING, candidate_features, rerank, rerank_weights
+
+VOCABULARY = ["beans", "cheese", "egg", "rice", "tomato"]
+
+
+class HandBuiltCatalog:
+    # Row 0 is the best rated and the best macro match, so a row that falls
+    # back to 0 would show up in the features of unknown candidates
+    def __init__(self):
+        self.recipes = [["rice", "beans"], ["egg", "cheese", "tomato"], ["rice", "tomato"]]
+        self.row_of = {"a": 0, "b": 1, "c": 2}
+        self.columns = {
+            "rating": np.array([5.0, 2.5, 4.0], dtype=np.float32),
+            MACRO_COLUMNS["protein"]: np.array([RANK_CODES["high"], RANK_CODES["low"], RANK_CODES["high"]], dtype=np.uint8),
+            MACRO_COLUMNS["carbs"]: np.array([RANK_CODES["low"], RANK_CODES["low"], RANK_CODES["high"]], dtype=np.uint8),
+            MACRO_COLUMNS["fats"]: np.array([RANK_CODES["medium"]] * 3, dtype=np.uint8)
+        }
+        ids = [sorted(VOCABULARY.index(name) for name in recipe) for recipe in self.recipes]
+        indptr = np.zeros(len(ids) + 1, dtype=np.uint32)
+        np.cumsum([len(row) for row in ids], out=indptr[1:])
+        self.index = IngredientIndex(VOCABULARY, indptr, np.array([i for row in ids for i in row], dtype=np.uint32))
+
+    def feature_columns(self):
+        return self.columns
+
+    def ingredient_index(self):
+        return self.index
+
+
+USER = {"macros": {"protein": "high", "carbs": "low", "fats": "medium"}}
+REQUEST = {"ingredients_available": ["rice", "Tomato"]}
+
+
+def brute_force_score(catalog, match, weights):
+    row = catalog.row_of.get(match["id"])
+    features = {"similarity": match["score"], "rating": 0.0, "coverage": 0.0, "macros": 0.0}
+    if row is not None:
+        recipe = catalog.recipes[row]
+        have = [name.lower() for name in REQUEST["ingredients_available"]]
+        macros = USER["macros"]
+        features["rating"] = catalog.columns["rating"][row] / MAX_RATING
+        features["coverage"] = sum(name in have for name in recipe) / len(recipe)
+        features["macros"] = sum(
+            catalog.columns[MACRO_COLUMNS[key]][row] == RANK_CODES[level] for key, level in macros.items()
+        ) / len(macros)
+    return sum(weights[name] * value for name, value in features.items())
+
+
+def make_matches(scores):
+    return [{"id": recipe_id, "score": score, "metadata": {}} for recipe_id, score in scores.items()]
+
+
+@pytest.mark.parametrize("weights", [
+    DEFAULT_WEIGHTS,
+    {"similarity": 1.0, "rating": 0.0, "coverage": 0.0, "macros": 0.0},
+    {"similarity": 0.1, "rating": 1.0, "coverage": 0.5, "macros": 0.5}
+])
+def test_blended_order_matches_brute_force(weights):
+    catalog = HandBuiltCatalog()
+    matches = make_matches({"b": 0.9, "missing": 0.85, "a": 0.7, "c": 0.6})
+
+    reranked = rerank(matches, USER, REQUEST, catalog, weights)
+
+    expected = sorted(matches, key=lambda m: -brute_force_score(catalog, m, weights))
+    assert [m["id"] for m in reranked] == [m["id"] for m in expected]
+    for match in reranked:
+        assert match["rerank_score"] == pytest.approx(brute_force_score(catalog, match, weights), rel=1e-5)
+        # The similarity stays where filters and the app read it
+        assert match["score"] == next(m["score"] for m in matches if m["id"] == match["id"])
+
+
+def test_features_lift_a_less_similar_recipe():
+    catalog = HandBuiltCatalog()
+    matches = make_matches({"b": 0.80, "c": 0.75})
+
+    assert [m["id"] for m in rerank(matches, USER, REQUEST, catalog, DEFAULT_WEIGHTS)] == ["c", "b"]
+
+
+def test_candidates_missing_from_the_catalog_get_zeroed_features():
+    catalog = HandBuiltCatalog()
+    matches = make_matches({"missing": 0.9, "a": 0.5, "also missing": 0.4})
+
+    features = candidate_features(matches, USER, REQUEST, catalog)
+
+    assert features["similarity"].tolist() == pytest.approx([0.9, 0.5, 0.4])
+    for name in ("rating", "coverage", "macros"):
+        assert features[name][[0, 2]].tolist() == [0.0, 0.0]
+        assert features[name][1] > 0
+    reranked = rerank(matches, USER, REQUEST, catalog, DEFAULT_WEIGHTS)
+    assert reranked[-1]["rerank_score"] == pytest.approx(0.4)
+
+
+def test_no_matches_are_returned_as_is():
+    assert rerank([], USER, REQUEST, HandBuiltCatalog()) == []
+
+
+def test_weights_override_the_defaults(monkeypatch):
+    monkeypatch.setenv("RERANK_WEIGHTS", json.dumps({"rating": 0.5, "macros": 0}))
+    assert rerank_weights() == {**DEFAULT_WEIGHTS, "rating": 0.5, "macros": 0}
+
+    monkeypatch.setenv("RERANK_WEIGHTS", "")
+    assert rerank_weights() == DEFAULT_WEIGHTS
+
+
+def test_unknown_weight_keys_raise(monkeypatch):
+    monkeypatch.setenv("RERANK_WEIGHTS", json.dumps({"rating": 0.5, "freshness": 1.0}))
+    with pytest.raises(ValueError, match="freshness"):
+        rerank_weights()
+    with pytest.raises(ValueError):
+        rerank(make_matches({"a": 0.5}), USER, REQUEST, HandBuiltCatalog())
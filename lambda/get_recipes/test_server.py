@@ -0,0 +1,72 @@
+import asyncio
+import json
+import time
+
+import pytest
+
+pytest.importorskip("boto3")
+pytest.importorskip("pinecone")
+
+import server
+
+
+def call(method, path, body=b""):
+    """
+    One HTTP request through the ASGI app, as uvicorn would make it
+    """
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {"type": "http", "method": method, "path": path, "headers": []}
+    asyncio.run(server.app(scope, receive, send))
+    start, response = messages
+    return start["status"], dict(start["headers"]), json.loads(response["body"])
+
+
+@pytest.fixture(scope="module")
+def ready_server(local_stack):
+    deadline = time.monotonic() + 30
+    while call("GET", "/readyz")[0] != 200:
+        assert time.monotonic() < deadline, "worker never became ready"
+        time.sleep(0.05)
+    yield
+    server._executor.shutdown(wait=True)
+    server._started = False
+    server._readiness["ready"] = False
+
+
+def test_health_and_readiness(ready_server):
+    status, _, body = call("GET", "/healthz")
+    assert status == 200 and body["status"] == "ok"
+
+    status, _, body = call("GET", "/readyz")
+    assert status == 200
+    assert body["index_version"] is not None
+
+
+def test_recommendation_round_trip(ready_server):
+    event = {
+        "user": {"username": "smoke", "allergies": ["peanuts"], "macros": {"protein": "high"}},
+        "request": {"meal_type": "Dinner", "max_time_minutes": 45, "ingredients_available": ["rice"]}
+    }
+    status, headers, response = call("POST", "/recommender", json.dumps(event).encode("utf-8"))
+
+    assert status == 200
+    assert headers[b"content-type"] == b"application/json"
+    recipes = json.loads(response["body"])["recipes"]
+    assert recipes
+    assert all(recipe["metadata"] for recipe in recipes)
+
+
+@pytest.mark.parametrize("method,path,body,expected", [
+    ("GET", "/nowhere", b"", 404),
+    ("DELETE", "/recommender", b"", 405),
+    ("POST", "/recommender", b"{not json", 400)
+])
+def test_bad_requests_are_rejected(ready_server, method, path, body, expected):
+    assert call(method, path, body)[0] == expected
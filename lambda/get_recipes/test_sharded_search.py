@@ -0,0 +1,166 @@
+import os
+import signal
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+pytest.importorskip("boto3")
+
+import sharded_search
+from catalog_store import get_catalog_store
+from constraints import constraints_for
+from sharded_search import ShardError, ShardPool, get_shard_pool
+
+TOP_K = 20
+
+
+@pytest.fixture(scope="module")
+def catalog(local_stack):
+    return get_catalog_store()
+
+
+@pytest.fixture(scope="module")
+def pool(catalog):
+    pool = ShardPool(catalog.local_dir, len(catalog), shards=3, channels=4)
+    yield pool
+    pool.close()
+
+
+def queries(count, dim=384, seed=1):
+    return np.random.default_rng(seed).normal(size=(count, dim)).astype(np.float32)
+
+
+def expected(catalog, vector, constraints=None):
+    mask = catalog.constraint_mask(constraints) if constraints else None
+    return [(match["id"], match["score"]) for match in catalog.search(vector, TOP_K, mask)]
+
+
+def sharded(catalog, pool, vector, constraints=None):
+    return [(catalog.record(row)["id"], score) for row, score in pool.search(vector, TOP_K, constraints)]
+
+
+def assert_same(actual, wanted):
+    assert [recipe_id for recipe_id, _ in actual] == [recipe_id for recipe_id, _ in wanted]
+    np.testing.assert_allclose([score for _, score in actual], [score for _, score in wanted], rtol=1e-5)
+
+
+@pytest.mark.parametrize("request_data", [
+    {},
+    {"meal_type": "Dinner", "max_time_minutes": 45},
+    {"meal_type": "Dessert", "max_time_minutes": 10}
+])
+def test_sharded_results_match_catalog_search(catalog, pool, request_data):
+    constraints = constraints_for({}, request_data) if request_data else None
+    for vector in queries(5):
+        assert_same(sharded(catalog, pool, vector, constraints), expected(catalog, vector, constraints))
+
+
+def test_concurrent_searches_get_their_own_results(catalog, pool):
+    vectors = queries(40, seed=2)
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(lambda vector: sharded(catalog, pool, vector), vectors))
+    for vector, result in zip(vectors, results):
+        assert_same(result, expected(catalog, vector))
+
+
+def test_worker_error_leaves_the_pool_usable(catalog, pool):
+    bad_constraints = {"max_minutes": None, "meal_type": "Brunch", "macros": {}}
+    with pytest.raises(ShardError):
+        pool.search(queries(1)[0], TOP_K, bad_constraints)
+    assert not pool.broken
+
+    # No reply of the failed search is left behind for the next one
+    for vector in queries(8, seed=3):
+        assert_same(sharded(catalog, pool, vector), expected(catalog, vector))
+
+
+def test_dead_worker_breaks_the_pool_and_it_is_replaced(catalog, monkeypatch):
+    monkeypatch.setenv("SEARCH_SHARDS", "2")
+    monkeypatch.setattr(sharded_search, "_pool", None)
+    first = get_shard_pool(catalog)
+    try:
+        first._processes[1].terminate()
+        first._processes[1].join()
+        with pytest.raises(ShardError):
+            first.search(queries(1)[0], TOP_K)
+        assert first.broken
+
+        second = get_shard_pool(catalog)
+        assert second is not first
+        vector = queries(1, seed=4)[0]
+        assert_same(sharded(catalog, second, vector), expected(catalog, vector))
+    finally:
+        sharded_search._pool.close()
+        first.close()
+
+
+def search_in_thread(pool, outcomes):
+    def run():
+        try:
+            pool.search(queries(1)[0], TOP_K)
+            outcomes.append("ok")
+        except ShardError as e:
+            outcomes.append(e)
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread
+
+
+def test_waiting_searches_wake_when_a_worker_dies(catalog):
+    pool = ShardPool(catalog.local_dir, len(catalog), shards=2, channels=1, wait_s=30)
+    try:
+        # The first search holds the only channel, stuck on a stopped worker
+        os.kill(pool._processes[1].pid, signal.SIGSTOP)
+        outcomes = []
+        holder = search_in_thread(pool, outcomes)
+        time.sleep(0.2)
+        waiter = search_in_thread(pool, outcomes)
+        time.sleep(0.2)
+        assert not outcomes
+
+        start = time.perf_counter()
+        pool._processes[1].kill()
+        holder.join(5)
+        waiter.join(5)
+
+        assert not holder.is_alive() and not waiter.is_alive()
+        assert time.perf_counter() - start < 5
+        assert len(outcomes) == 2 and all(isinstance(outcome, ShardError) for outcome in outcomes)
+        assert pool.broken
+    finally:
+        pool.close()
+
+
+def test_closing_the_pool_wakes_waiting_searches(catalog):
+    pool = ShardPool(catalog.local_dir, len(catalog), shards=2, channels=1, wait_s=30)
+    # Held by a search still in flight
+    pool._channels.get()
+    outcomes = []
+    waiter = search_in_thread(pool, outcomes)
+    time.sleep(0.2)
+
+    pool.close()
+    waiter.join(5)
+
+    assert not waiter.is_alive()
+    assert isinstance(outcomes[0], ShardError)
+    # A search after closing fails straight away
+    with pytest.raises(ShardError):
+        pool.search(queries(1)[0], TOP_K)
+
+
+def test_search_gives_up_waiting_for_a_busy_pool(catalog):
+    pool = ShardPool(catalog.local_dir, len(catalog), shards=2, channels=1, wait_s=0.2)
+    channel = pool._channels.get()
+    try:
+        with pytest.raises(ShardError, match="No free search channel"):
+            pool.search(queries(1)[0], TOP_K)
+        assert not pool.broken
+        pool._channels.put(channel)
+        vector = queries(1, seed=5)[0]
+        assert_same(sharded(catalog, pool, vector), expected(catalog, vector))
+    finally:
+        pool.close()
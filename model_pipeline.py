@@ -66,6 +66,10 @@ model_selection_step = ProcessingStep(
         ProcessingInput(
             source=requirements_s3_uri,
             destination="/opt/ml/processing/input/requirements"
+        ),
+        ProcessingInput(
+            source="pipeline_steps",
+            destination="/opt/ml/processing/input/lib"
         )
     ],
     outputs=[best_model_output],
@@ -76,6 +80,60 @@ model_selection_step = ProcessingStep(
     ]
 )
 
+# Define the Python processor for ONNX export, quantization and the latency gate
+optimization_processor = ScriptProcessor(
+    image_uri=image_uris.retrieve(
+        framework="pytorch",
+        region=region,
+        version="1.13.1",
+        py_version="py39",
+        image_scope="training",
+        instance_type="ml.m5.large"
+    ),
+    role=role,
+    instance_count=1,
+    instance_type="ml.m5.large",
+    base_job_name="model-optimization",
+    command=["python"],
+    env={'PIP_PACKAGES': 'sentence-transformers'}
+)
+
+# Define the model optimization step
+model_optimization_step = ProcessingStep(
+    name="ModelOptimization",
+    processor=optimization_processor,
+    code="pipeline_steps/model_optimization.py",
+    inputs=[
+        ProcessingInput(
+            source=model_selection_step.properties.ProcessingOutputConfig.Outputs["best_model"].S3Output.S3Uri,
+            destination="/opt/ml/processing/input/model"
+        ),
+        ProcessingInput(
+            source=requirements_s3_uri,
+            destination="/opt/ml/processing/input/requirements"
+        ),
+        ProcessingInput(
+            source="pipeline_steps",
+            destination="/opt/ml/processing/input/lib"
+        )
+    ],
+    outputs=[
+        ProcessingOutput(
+            output_name="optimized_model",
+            source="/opt/ml/processing/output",
+            destination=f"s3://{bucket}/{prefix}/model-optimization"
+        )
+    ],
+    job_arguments=[
+        "--install-dependencies",
+        "--requirements-file", "/opt/ml/processing/input/requirements/requirements.txt",
+        "--best-model-file", "/opt/ml/processing/input/model/best_model.json",
+        "--output-dir", "/opt/ml/processing/output",
+        "--max-p95-ms", "15",
+        "--min-cosine", "0.99"
+    ]
+)
+
 # Define the Python processor for model registration and deployment
 deploy_processor = ScriptProcessor(
     image_uri=image_uris.retrieve(
@@ -109,9 +167,17 @@ model_reg_step = ProcessingStep(
             source=model_selection_step.properties.ProcessingOutputConfig.Outputs["best_model"].S3Output.S3Uri,
             destination="/opt/ml/processing/input/model"
         ),
+        ProcessingInput(
+            source=model_optimization_step.properties.ProcessingOutputConfig.Outputs["optimized_model"].S3Output.S3Uri,
+            destination="/opt/ml/processing/input/optimized"
+        ),
         ProcessingInput(
             source=requirements_s3_uri,
             destination="/opt/ml/processing/input/requirements"
+        ),
+        ProcessingInput(
+            source="pipeline_steps",
+            destination="/opt/ml/processing/input/lib"
         )
     ]
 )
@@ -119,7 +185,7 @@ model_reg_step = ProcessingStep(
 # Create the pipeline
 pipeline = Pipeline(
     name="RecipeModelManagerPipeline",
-    steps=[model_selection_step, model_reg_step],
+    steps=[model_selection_step, model_optimization_step, model_reg_step],
     sagemaker_session=session
 )
 
@@ -0,0 +1,248 @@
+import json
+import math
+import os
+import sys
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+
+# put_metric_data accepts up to 1000 datums per call and 150 distinct values per datum
+MAX_DATUMS_PER_CALL = 1000
+MAX_VALUES_PER_DATUM = 150
+
+# EMF allows up to 100 values per metric and 100 metrics per log line
+MAX_EMF_VALUES = 100
+MAX_EMF_METRICS = 100
+
+# Histogram values are snapped to buckets this far apart (relative), so a
+# flush sends a bounded number of distinct values however many were observed
+HISTOGRAM_PRECISION = 0.02
+
+
+def _bucket(value):
+    if value == 0:
+        return 0.0
+    base = math.log1p(HISTOGRAM_PRECISION)
+    return math.copysign(math.exp(round(math.log(abs(value)) / base) * base), value)
+
+
+class CloudWatchSink:
+    """
+    Sends datums with as few put_metric_data calls as the API limits allow.
+    """
+
+    def __init__(self, client=None):
+        self._client = client
+
+    @property
+    def client(self):
+        if self._client is None:
+            import boto3
+            self._client = boto3.client("cloudwatch")
+        return self._client
+
+    def send(self, namespace, datums):
+        calls = 0
+        for i in range(0, len(datums), MAX_DATUMS_PER_CALL):
+            self.client.put_metric_data(Namespace=namespace, MetricData=datums[i:i + MAX_DATUMS_PER_CALL])
+            calls += 1
+        return calls
+
+
+class EmfSink:
+    """
+    Writes datums as CloudWatch embedded-metric-format log lines; no API call at all.
+
+    Lambda (and anything else shipping stdout to CloudWatch Logs) turns these
+    lines into metrics asynchronously.
+    """
+
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout
+
+    def send(self, namespace, datums):
+        # One line per dimension set; histograms are expanded back to their values
+        groups = {}
+        for datum in datums:
+            dims = tuple((d["Name"], d["Value"]) for d in datum.get("Dimensions", []))
+            if "Values" in datum:
+                values = [v for v, c in zip(datum["Values"], datum["Counts"]) for _ in range(int(c))]
+            else:
+                values = [datum["Value"]]
+            groups.setdefault(dims, []).append((datum["MetricName"], datum.get("Unit", "None"), values))
+
+        lines = 0
+        for dims, metrics in groups.items():
+            pending = list(metrics)
+            while pending:
+                record = {name: value for name, value in dims}
+                definitions = []
+                leftover = []
+                for name, unit, values in pending:
+                    if len(definitions) >= MAX_EMF_METRICS or name in record:
+                        leftover.append((name, unit, values))
+                        continue
+                    chunk, rest = values[:MAX_EMF_VALUES], values[MAX_EMF_VALUES:]
+                    record[name] = chunk if len(chunk) > 1 else chunk[0]
+                    definitions.append({"Name": name, "Unit": unit})
+                    if rest:
+                        leftover.append((name, unit, rest))
+                record["_aws"] = {
+                    "Timestamp": int(time.time() * 1000),
+                    "CloudWatchMetrics": [{
+                        "Namespace": namespace,
+                        "Dimensions": [[name for name, _ in dims]],
+                        "Metrics": definitions
+                    }]
+                }
+                self.stream.write(json.dumps(record) + "\n")
+                lines += 1
+                pending = leftover
+        self.stream.flush()
+        return lines
+
+
+class LocalSink:
+    """
+    Keeps the most recent flushed batches in memory, for tests and local runs.
+
+    A long local run (a load test, say) keeps only the last max_batches; pass
+    path to also append every batch to a JSON-lines file.
+    """
+
+    def __init__(self, max_batches=100, path=None):
+        self.batches = deque(maxlen=max_batches)
+        self.path = path
+
+    def send(self, namespace, datums):
+        self.batches.append((namespace, datums))
+        if self.path:
+            with open(self.path, "a") as f:
+                f.write(json.dumps({"namespace": namespace, "datums": datums}, default=str) + "\n")
+        return 1
+
+    def datums(self, metric_name=None):
+        return [
+            datum for _, datums in self.batches for datum in datums
+            if metric_name is None or datum["MetricName"] == metric_name
+        ]
+
+
+class MetricsBuffer:
+    """
+    Aggregates counters, gauges and histograms in process and flushes them in batches.
+
+    Nothing is sent while recording; flush() runs when flush_interval_s has
+    passed since the last one, or explicitly (e.g. at the end of an invocation).
+    """
+
+    def __init__(self, namespace, sink, dimensions=None, flush_interval_s=60.0):
+        self.namespace = namespace
+        self.sink = sink
+        self.dimensions = dict(dimensions or {})
+        self.flush_interval_s = flush_interval_s
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+        self._last_flush = time.monotonic()
+
+    def _key(self, name, unit, dimensions):
+        dims = {**self.dimensions, **(dimensions or {})}
+        return (name, unit, tuple(sorted(dims.items())))
+
+    def increment(self, name, value=1, unit="Count", dimensions=None):
+        key = self._key(name, unit, dimensions)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+        self._maybe_flush()
+
+    def gauge(self, name, value, unit="None", dimensions=None):
+        key = self._key(name, unit, dimensions)
+        with self._lock:
+            self._gauges[key] = value
+        self._maybe_flush()
+
+    def observe(self, name, value, unit="Milliseconds", dimensions=None):
+        key = self._key(name, unit, dimensions)
+        bucket = _bucket(float(value))
+        with self._lock:
+            histogram = self._histograms.setdefault(key, {})
+            histogram[bucket] = histogram.get(bucket, 0) + 1
+        self._maybe_flush()
+
+    def _maybe_flush(self):
+        if time.monotonic() - self._last_flush >= self.flush_interval_s:
+            self.flush()
+
+    def _drain(self):
+        with self._lock:
+            counters, self._counters = self._counters, {}
+            gauges, self._gauges = self._gauges, {}
+            histograms, self._histograms = self._histograms, {}
+            self._last_flush = time.monotonic()
+        return counters, gauges, histograms
+
+    def flush(self):
+        """
+        Sends everything recorded since the last flush; returns the number of sink calls.
+        """
+        counters, gauges, histograms = self._drain()
+        timestamp = datetime.now(timezone.utc)
+
+        def datum(key, **fields):
+            name, unit, dims = key
+            value = {"MetricName": name, "Timestamp": timestamp, "Unit": unit, **fields}
+            if dims:
+                value["Dimensions"] = [{"Name": k, "Value": str(v)} for k, v in dims]
+            return value
+
+        datums = [datum(key, Value=float(value)) for key, value in counters.items()]
+        datums += [datum(key, Value=float(value)) for key, value in gauges.items()]
+        for key, histogram in histograms.items():
+            buckets = sorted(histogram.items())
+            for i in range(0, len(buckets), MAX_VALUES_PER_DATUM):
+                chunk = buckets[i:i + MAX_VALUES_PER_DATUM]
+                datums.append(datum(key, Values=[v for v, _ in chunk], Counts=[float(c) for _, c in chunk]))
+
+        if not datums:
+            return 0
+        try:
+            return self.sink.send(self.namespace, datums)
+        except Exception as e:
+            # Metrics must never fail the caller
+            print(f"[WARN] Dropped {len(datums)} metric datums: {e}")
+            return 0
+
+
+def sink_from_name(name):
+    if name == "cloudwatch":
+        return CloudWatchSink()
+    if name == "emf":
+        return EmfSink()
+    if name == "local":
+        return LocalSink(
+            int(os.environ.get("METRICS_LOCAL_MAX_BATCHES", "100")),
+            os.environ.get("METRICS_LOCAL_FILE") or None
+        )
+    raise ValueError(f"Unknown metrics sink: {name}")
+
+
+_metrics = None
+
+
+def get_metrics(namespace=None):
+    """
+    Returns the process-wide buffer, configured from METRICS_NAMESPACE,
+    METRICS_SINK (emf|cloudwatch|local) and METRICS_FLUSH_INTERVAL_SECONDS;
+    the local sink also reads METRICS_LOCAL_MAX_BATCHES and METRICS_LOCAL_FILE.
+    """
+    global _metrics
+    if _metrics is None:
+        _metrics = MetricsBuffer(
+            namespace or os.environ.get("METRICS_NAMESPACE", "RecipeRecommender"),
+            sink_from_name(os.environ.get("METRICS_SINK", "emf")),
+            flush_interval_s=float(os.environ.get("METRICS_FLUSH_INTERVAL_SECONDS", "60"))
+        )
+    return _metrics
@@ -2,13 +2,17 @@ import pandas as pd
 import json
 from sentence_transformers import SentenceTransformer, util
 import time
+import threading
 import boto3
 import shutil
 import torch
+from botocore.config import Config
+from concurrent.futures import ThreadPoolExecutor
 
 from transformers import AutoModel, AutoTokenizer
 import tarfile
 import os
+import sys
 from urllib.parse import urlparse
 
 import sagemaker
@@ -18,6 +22,10 @@ import shutil
 
 from pinecone import Pinecone
 
+# The endpoint pointer is shared with the deploy step in pipeline_steps/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "pipeline_steps"))
+from endpoint_pointer import PublishEndpointName, ReadEndpointPointer
+
 def SelectModel(num_test=None):
     uri = "s3://cs401r-mlops-final/preprocessed-data/preprocessed_data.csv"
     full_data = pd.read_csv(uri)
@@ -181,60 +189,136 @@ def RegisterModel(best_model, group_name):
 
     print("Model Deployed")
 
-    shutil.rmtree(model_dir)
-    os.remove("all-MiniLM-L6-v2.tar.gz")
+    PublishEndpointName(group_name, endpoint_name, model_package_arn)
+    _resolver.invalidate(group_name)
+
+    shutil.rmtree(model_dir, ignore_errors=True)
+    if os.path.exists(tar_path):
+        os.remove(tar_path)
     print('Temp Model Artifacts Deleted')
 
-def GetEndpointName(group_name):
-    sm = boto3.client('sagemaker')
-    runtime = boto3.client('sagemaker-runtime')
+# Describe calls are throttled per account; adaptive retries back off instead of failing
+CONTROL_PLANE_CONFIG = Config(retries={"max_attempts": 10, "mode": "adaptive"})
+
+
+class EndpointResolver:
+    """
+    Maps a model package group to the endpoint serving its newest deployed package.
+
+    Builds package -> model -> endpoint by walking endpoints rather than every
+    model in the account, with paginated listing and concurrent describe calls.
+    Endpoint configs and models are immutable, so their descriptions are kept
+    for the life of the resolver. The resolved name is cached for ttl_seconds,
+    until invalidate() is called, or until the published pointer's ETag
+    differs from the one it was resolved under. invalidate() only reaches
+    this process; the ETag is what makes a new publish visible to every
+    other process (and Lambda container) on its next resolve.
+    """
+
+    def __init__(self, ttl_seconds=300, max_workers=8):
+        self.ttl_seconds = ttl_seconds
+        self.max_workers = max_workers
+        self._sm = None
+        self._resolved = {}
+        self._config_models = {}
+        self._model_packages = {}
+        self._lock = threading.Lock()
+
+    @property
+    def sm(self):
+        if self._sm is None:
+            self._sm = boto3.client('sagemaker', config=CONTROL_PLANE_CONFIG)
+        return self._sm
+
+    def invalidate(self, group_name=None):
+        with self._lock:
+            if group_name is None:
+                self._resolved.clear()
+            else:
+                self._resolved.pop(group_name, None)
+
+    def resolve(self, group_name, pointer_etag=None):
+        with self._lock:
+            cached = self._resolved.get(group_name)
+        if cached and cached[1] > time.time() and cached[2] == pointer_etag:
+            return cached[0]
+
+        endpoint_name = self._build(group_name)
+        with self._lock:
+            self._resolved[group_name] = (endpoint_name, time.time() + self.ttl_seconds, pointer_etag)
+        return endpoint_name
+
+    def _paginate(self, operation, result_key, **kwargs):
+        for page in self.sm.get_paginator(operation).paginate(**kwargs):
+            yield from page[result_key]
+
+    def _config_model_names(self, endpoint_name):
+        config_name = self.sm.describe_endpoint(EndpointName=endpoint_name)['EndpointConfigName']
+        if config_name not in self._config_models:
+            config = self.sm.describe_endpoint_config(EndpointConfigName=config_name)
+            self._config_models[config_name] = [v['ModelName'] for v in config['ProductionVariants']]
+        return self._config_models[config_name]
+
+    def _model_package_names(self, model_name):
+        if model_name not in self._model_packages:
+            model_desc = self.sm.describe_model(ModelName=model_name)
+            containers = model_desc.get('Containers', [])
+            if not containers:  # single-container
+                containers = [model_desc.get('PrimaryContainer', {})]
+            self._model_packages[model_name] = [c['ModelPackageName'] for c in containers if c.get('ModelPackageName')]
+        return self._model_packages[model_name]
+
+    def _build(self, group_name):
+        # Newest first, so the first package with an endpoint wins
+        package_arns = [
+            pkg['ModelPackageArn'] for pkg in self._paginate(
+                'list_model_packages', 'ModelPackageSummaryList',
+                ModelPackageGroupName=group_name,
+                SortBy='CreationTime',
+                SortOrder='Descending'
+            )
+        ]
+        if not package_arns:
+            raise Exception(f"No model packages found in {group_name}.")
+
+        endpoint_names = [
+            ep['EndpointName'] for ep in self._paginate('list_endpoints', 'Endpoints', StatusEquals='InService')
+        ]
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            endpoint_models = dict(zip(endpoint_names, pool.map(self._config_model_names, endpoint_names)))
+            model_names = sorted({m for models in endpoint_models.values() for m in models})
+            model_packages = dict(zip(model_names, pool.map(self._model_package_names, model_names)))
+
+        package_endpoints = {}
+        for endpoint_name, models in endpoint_models.items():
+            for model_name in models:
+                for package_arn in model_packages[model_name]:
+                    package_endpoints.setdefault(package_arn, endpoint_name)
+
+        print(f"Resolved {len(package_endpoints)} package endpoints from "
+              f"{len(endpoint_names)} endpoints and {len(model_names)} models")
+
+        for package_arn in package_arns:
+            if package_arn in package_endpoints:
+                return package_endpoints[package_arn]
 
-    # Step 1: Get all model package ARNs in the model group (approved or not)
-    packages = sm.list_model_packages(
-        ModelPackageGroupName=group_name,
-        SortBy='CreationTime',
-        SortOrder='Descending',
-        MaxResults=10
-    )['ModelPackageSummaryList']
-
-    model_package_arns = {pkg['ModelPackageArn'] for pkg in packages}
-
-    # Step 2: List all models and find ones that use any of these packages
-    models = sm.list_models()['Models']
-    model_names = []
-
-    for model in models:
-        model_desc = sm.describe_model(ModelName=model['ModelName'])
-        containers = model_desc.get('Containers', [])
-        if not containers:  # single-container
-            containers = [model_desc.get('PrimaryContainer', {})]
-
-        for container in containers:
-            if container.get('ModelPackageName') in model_package_arns:
-                model_names.append(model['ModelName'])
-                break
-
-    if not model_names:
-        raise Exception("No SageMaker model found using packages from the model group.")
-
-    # Step 3: Look for endpoint using any of those models
-    endpoints = sm.list_endpoints()['Endpoints']
-    endpoint_name = None
-
-    for ep in endpoints:
-        ep_desc = sm.describe_endpoint(EndpointName=ep['EndpointName'])
-        ep_config_name = ep_desc['EndpointConfigName']
-        ep_config = sm.describe_endpoint_config(EndpointConfigName=ep_config_name)
-        for variant in ep_config['ProductionVariants']:
-            if variant['ModelName'] in model_names:
-                endpoint_name = ep['EndpointName']
-                break
-        if endpoint_name:
-            break
-
-    if not endpoint_name:
         raise Exception("No endpoint found using models from the model group.")
 
-    return endpoint_name
+
+_resolver = EndpointResolver()
 
 
+def GetEndpointName(group_name):
+    # O(1) when the deploy step has published the endpoint
+    endpoint_name, pointer_etag = ReadEndpointPointer(group_name)
+    if endpoint_name:
+        sm = boto3.client('sagemaker', config=CONTROL_PLANE_CONFIG)
+        try:
+            if sm.describe_endpoint(EndpointName=endpoint_name)['EndpointStatus'] == 'InService':
+                return endpoint_name
+        except sm.exceptions.ClientError:
+            pass
+        print(f"Published endpoint {endpoint_name} is not in service, resolving from the registry")
+
+    return _resolver.resolve(group_name, pointer_etag)
@@ -1,52 +1,474 @@
-import os, json, boto3
+import os, io, sys, json, argparse, boto3
 import numpy as np
-from datetime import datetime
-from sklearn.metrics.pairwise import cosine_similarity
-
-def load_recent_data(data_dir):
-    pairs = []
-    for fname in os.listdir(data_dir):
-        if fname.endswith(".jsonl"):
-            with open(os.path.join(data_dir, fname)) as f:
+from datetime import datetime, timezone
+from urllib.parse import urlparse
+
+# metrics.py is shipped next to this script by processor.py
+sys.path.insert(0, "/opt/ml/processing/input/lib")
+from metrics import CloudWatchSink, MetricsBuffer
+
+# Pairs are stacked and scored this many at a time, so memory stays bounded
+CHUNK_SIZE = 4096
+
+# Catalog vectors published by embed.py, the reference the query distribution is compared to
+REFERENCE_S3_URI = "s3://cs401r-mlops-final/monitoring/reference/catalog_embeddings.npy"
+RESELECTION_PIPELINE = "RecipeModelManagerPipeline"
+DRIFT_THRESHOLD = 0.2
+DRIFT_MIN_SAMPLES = 500
+DRIFT_WINDOW_DAYS = 7
+DRIFT_COOLDOWN_HOURS = 24
+
+
+class LocalCaptureSource:
+    """
+    Capture files in a local directory; files may still be appended to.
+    """
+
+    def __init__(self, data_dir):
+        self.data_dir = data_dir
+
+    def new_lines(self, state):
+        offsets = state.setdefault("files", {})
+        for fname in sorted(os.listdir(self.data_dir)):
+            if not fname.endswith(".jsonl"):
+                continue
+            path = os.path.join(self.data_dir, fname)
+            offset = offsets.get(fname, 0)
+            if os.path.getsize(path) <= offset:
+                continue
+            with open(path, "rb") as f:
+                f.seek(offset)
                 for line in f:
-                    try:
-                        record = json.loads(line)
-                        response = json.loads(record['captureData']['endpointOutput']['data'])
-                        if isinstance(response, list) and len(response) == 2:
-                            pairs.append(np.array([response[0], response[1]]))
-                    except:
-                        continue
-    return np.array(pairs)
-
-def compute_cosine_metrics(pairs):
-    sims = [cosine_similarity([pair[0]], [pair[1]])[0][0] for pair in pairs if pair.shape[0] == 2]
-    sims = np.array(sims)
+                    # A partial last line is left for the next run
+                    if not line.endswith(b"\n"):
+                        break
+                    offset += len(line)
+                    yield line
+            offsets[fname] = offset
+
+
+class S3CaptureSource:
+    """
+    SageMaker data-capture objects under an S3 prefix.
+
+    Capture objects are immutable and their keys are time-ordered
+    (.../yyyy/mm/dd/hh/...), so the last processed key is the watermark.
+    """
+
+    def __init__(self, s3_uri):
+        parsed = urlparse(s3_uri)
+        self.bucket = parsed.netloc
+        self.prefix = parsed.path.lstrip("/")
+        self.s3 = boto3.client("s3")
+
+    def new_lines(self, state):
+        kwargs = {"Bucket": self.bucket, "Prefix": self.prefix}
+        if state.get("watermark"):
+            kwargs["StartAfter"] = state["watermark"]
+
+        for page in self.s3.get_paginator("list_objects_v2").paginate(**kwargs):
+            for obj in page.get("Contents", []):
+                if not obj["Key"].endswith(".jsonl"):
+                    continue
+                body = self.s3.get_object(Bucket=self.bucket, Key=obj["Key"])["Body"]
+                for line in body.iter_lines():
+                    yield line
+                state["watermark"] = obj["Key"]
+
+
+def parse_response(line):
+    """
+    Decodes the endpoint output of one capture record.
+
+    Raises ValueError, KeyError or TypeError for malformed records.
+    """
+    record = json.loads(line)
+    return json.loads(record['captureData']['endpointOutput']['data'])
+
+
+def pair_of(response):
+    # The (2, dim) embedding pair in a response, or None if it has none
+    if not isinstance(response, list) or len(response) != 2:
+        return None
+    try:
+        pair = np.asarray(response, dtype=np.float32)
+    except ValueError:
+        # Ragged: two micro-batched queries, not a pair
+        return None
+    if pair.ndim != 2:
+        return None
+    return pair
+
+
+def _normalize(x):
+    return x / np.maximum(np.linalg.norm(x, axis=-1, keepdims=True), 1e-12)
+
+
+def query_embeddings(response):
+    # L2-normalised (n, dim) embeddings in a response, one per item; per-token outputs are
+    # mean-pooled like the Lambda does, item by item since micro-batched items differ in length
+    if not isinstance(response, list) or not response:
+        return None
+    pooled = []
+    for item in response:
+        embedding = np.asarray(item, dtype=np.float32)
+        while embedding.ndim > 1:
+            embedding = embedding.mean(axis=-2)
+        if embedding.ndim != 1 or (pooled and embedding.shape != pooled[0].shape):
+            return None
+        pooled.append(embedding)
+    return _normalize(np.stack(pooled))
+
+
+def cosine_similarities(pairs):
+    # One pass over the stacked (n, 2, dim) array instead of a call per pair
+    stacked = np.stack(pairs)
+    a, b = stacked[:, 0], stacked[:, 1]
+    norms = np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1)
+    return np.einsum("ij,ij->i", a, b) / np.maximum(norms, 1e-12)
+
+
+def empty_aggregates():
+    return {"count": 0, "mean": 0.0, "m2": 0.0, "min": None, "max": None}
+
+
+def aggregates_of(sims):
     return {
-        "cosine_mean": float(sims.mean()),
-        "cosine_std": float(sims.std()),
-        "cosine_min": float(sims.min()),
-        "cosine_max": float(sims.max())
+        "count": int(sims.size),
+        "mean": float(sims.mean()),
+        "m2": float(((sims - sims.mean()) ** 2).sum()),
+        "min": float(sims.min()),
+        "max": float(sims.max())
     }
 
-def push_to_cloudwatch(metrics, namespace="EmbeddingMonitor"):
-    cw = boto3.client("cloudwatch")
-    for k, v in metrics.items():
-        cw.put_metric_data(
-            Namespace=namespace,
-            MetricData=[{
-                "MetricName": k,
-                "Timestamp": datetime.utcnow(),
-                "Value": v,
-                "Unit": "None"
-            }]
+
+def merge_aggregates(a, b):
+    # Chan et al. parallel update, so aggregates combine across chunks and runs
+    if a["count"] == 0:
+        return dict(b)
+    if b["count"] == 0:
+        return dict(a)
+    count = a["count"] + b["count"]
+    delta = b["mean"] - a["mean"]
+    return {
+        "count": count,
+        "mean": a["mean"] + delta * b["count"] / count,
+        "m2": a["m2"] + b["m2"] + delta ** 2 * a["count"] * b["count"] / count,
+        "min": min(a["min"], b["min"]),
+        "max": max(a["max"], b["max"])
+    }
+
+
+def cosine_metrics(aggregates):
+    return {
+        "cosine_mean": aggregates["mean"],
+        "cosine_std": (aggregates["m2"] / aggregates["count"]) ** 0.5,
+        "cosine_min": aggregates["min"],
+        "cosine_max": aggregates["max"]
+    }
+
+
+def process_new_data(source, state, chunk_size=CHUNK_SIZE, sketch=None):
+    """
+    Scores only the capture data added since the state's watermark.
+
+    Returns the aggregates of the new data and the number of malformed
+    records; the run's aggregates are merged into state["aggregates"].
+    Query embeddings are also fed to sketch, if given.
+    """
+    window = empty_aggregates()
+    malformed = 0
+    # Keyed on dimension so a model change mid-window doesn't break stacking
+    pending = {}
+    pending_embeddings = []
+
+    for line in source.new_lines(state):
+        try:
+            response = parse_response(line)
+            pair = pair_of(response)
+            embeddings = query_embeddings(response) if sketch is not None else None
+        except (ValueError, KeyError, TypeError) as e:
+            malformed += 1
+            if malformed <= 5:
+                print(f"Skipping malformed capture record: {e}")
+            continue
+
+        if embeddings is not None and embeddings.shape[1] == sketch.dim:
+            pending_embeddings.append(embeddings)
+            if len(pending_embeddings) >= chunk_size:
+                sketch.update(np.concatenate(pending_embeddings))
+                pending_embeddings.clear()
+
+        if pair is None:
+            continue
+        pairs = pending.setdefault(pair.shape[1], [])
+        pairs.append(pair)
+        if len(pairs) >= chunk_size:
+            window = merge_aggregates(window, aggregates_of(cosine_similarities(pairs)))
+            pairs.clear()
+
+    for pairs in pending.values():
+        if pairs:
+            window = merge_aggregates(window, aggregates_of(cosine_similarities(pairs)))
+    if pending_embeddings:
+        sketch.update(np.concatenate(pending_embeddings))
+
+    state["aggregates"] = merge_aggregates(state.get("aggregates", empty_aggregates()), window)
+    state["updated_at"] = datetime.now(timezone.utc).isoformat()
+    return window, malformed
+
+
+class EmbeddingSketch:
+    """
+    Constant-size summary of a stream of query embeddings.
+
+    Running mean and covariance (Welford, merged a chunk at a time) plus a
+    uniform reservoir sample; each update costs O(dim^2 + reservoir) no
+    matter how much traffic came before.
+    """
+
+    def __init__(self, dim, reservoir_size=2000, seed=0):
+        self.dim = dim
+        self.reservoir_size = reservoir_size
+        self.seed = seed
+        self.count = 0
+        self.mean = np.zeros(dim)
+        self.m2 = np.zeros((dim, dim))
+        self.reservoir = np.zeros((0, dim), dtype=np.float32)
+        self.started_at = datetime.now(timezone.utc).isoformat()
+
+    def update(self, embeddings):
+        embeddings = np.asarray(embeddings, dtype=np.float64)
+        n = len(embeddings)
+        if n == 0:
+            return
+
+        batch_mean = embeddings.mean(axis=0)
+        centered = embeddings - batch_mean
+        delta = batch_mean - self.mean
+        total = self.count + n
+        self.m2 += centered.T @ centered + np.outer(delta, delta) * self.count * n / total
+        self.mean += delta * n / total
+
+        # Algorithm R, vectorized over the chunk; seeded on position so reruns are reproducible
+        rng = np.random.default_rng([self.seed, self.count])
+        fill = max(0, min(n, self.reservoir_size - len(self.reservoir)))
+        if fill:
+            self.reservoir = np.concatenate([self.reservoir, embeddings[:fill].astype(np.float32)])
+        if fill < n:
+            positions = np.arange(self.count + fill, total)
+            slots = rng.integers(0, positions + 1)
+            keep = slots < self.reservoir_size
+            self.reservoir[slots[keep]] = embeddings[fill:][keep]
+        self.count = total
+
+    @property
+    def covariance(self):
+        return self.m2 / max(self.count - 1, 1)
+
+    def to_state(self):
+        return {
+            "dim": self.dim,
+            "reservoir_size": self.reservoir_size,
+            "seed": self.seed,
+            "count": self.count,
+            "mean": self.mean.tolist(),
+            "m2": self.m2.tolist(),
+            "reservoir": self.reservoir.tolist(),
+            "started_at": self.started_at
+        }
+
+    @classmethod
+    def from_state(cls, value):
+        sketch = cls(value["dim"], value["reservoir_size"], value["seed"])
+        sketch.count = value["count"]
+        sketch.mean = np.asarray(value["mean"])
+        sketch.m2 = np.asarray(value["m2"])
+        sketch.reservoir = np.asarray(value["reservoir"], dtype=np.float32).reshape(-1, value["dim"])
+        sketch.started_at = value["started_at"]
+        return sketch
+
+
+def ks_statistics(a, b):
+    """
+    Two-sample Kolmogorov-Smirnov statistic for each column of a against the same column of b.
+    """
+    stats = []
+    for col_a, col_b in zip(np.sort(a, axis=0).T, np.sort(b, axis=0).T):
+        grid = np.concatenate([col_a, col_b])
+        cdf_a = np.searchsorted(col_a, grid, side="right") / len(col_a)
+        cdf_b = np.searchsorted(col_b, grid, side="right") / len(col_b)
+        stats.append(np.abs(cdf_a - cdf_b).max())
+    return np.array(stats)
+
+
+def drift_report(sketch, reference, num_projections=32, seed=0):
+    """
+    Compares the sketched query distribution against a reference window of catalog vectors.
+
+    drift_score is the mean KS statistic over random 1-D projections of the
+    reservoir vs the reference (a sliced KS test); the distance of each vector
+    to the catalog centroid is compared the same way.
+    """
+    sample = sketch.reservoir.astype(np.float64)
+    reference = _normalize(np.asarray(reference, dtype=np.float64))
+
+    rng = np.random.default_rng(seed)
+    directions = _normalize(rng.normal(size=(num_projections, sketch.dim))).T
+    projection_ks = ks_statistics(sample @ directions, reference @ directions)
+
+    centroid = _normalize(reference.mean(axis=0))
+    distance_ks = ks_statistics((1 - sample @ centroid)[:, None], (1 - reference @ centroid)[:, None])[0]
+
+    reference_cov = np.cov(reference, rowvar=False)
+    return {
+        "drift_score": float(projection_ks.mean()),
+        "drift_projection_ks_max": float(projection_ks.max()),
+        "drift_centroid_distance_ks": float(distance_ks),
+        "drift_mean_cosine_distance": float(1 - _normalize(sketch.mean) @ centroid),
+        "drift_covariance_trace_ratio": float(np.trace(sketch.covariance) / max(np.trace(reference_cov), 1e-12)),
+        "drift_samples": sketch.count
+    }
+
+
+def load_reference(uri):
+    # None until embed.py has published the catalog vectors
+    if uri.startswith("s3://"):
+        parsed = urlparse(uri)
+        s3 = boto3.client("s3")
+        try:
+            body = s3.get_object(Bucket=parsed.netloc, Key=parsed.path.lstrip("/"))["Body"].read()
+        except s3.exceptions.NoSuchKey:
+            return None
+        return np.load(io.BytesIO(body))
+    if not os.path.exists(uri):
+        return None
+    return np.load(uri)
+
+
+def trigger_reselection(pipeline_name, reason):
+    # Re-runs model selection, optimization and deployment
+    sm = boto3.client("sagemaker")
+    response = sm.start_pipeline_execution(
+        PipelineName=pipeline_name,
+        PipelineExecutionDescription=reason[:3072]
+    )
+    print(f"Started {pipeline_name}: {response['PipelineExecutionArn']}")
+
+
+def load_state(uri):
+    if uri.startswith("s3://"):
+        parsed = urlparse(uri)
+        s3 = boto3.client("s3")
+        try:
+            return json.loads(s3.get_object(Bucket=parsed.netloc, Key=parsed.path.lstrip("/"))["Body"].read())
+        except s3.exceptions.NoSuchKey:
+            return {}
+    if not os.path.exists(uri):
+        return {}
+    with open(uri) as f:
+        return json.load(f)
+
+
+def save_state(uri, state):
+    if uri.startswith("s3://"):
+        parsed = urlparse(uri)
+        boto3.client("s3").put_object(
+            Bucket=parsed.netloc,
+            Key=parsed.path.lstrip("/"),
+            Body=json.dumps(state),
+            ContentType="application/json"
         )
+        return
+    with open(uri + ".tmp", "w") as f:
+        json.dump(state, f)
+    os.replace(uri + ".tmp", uri)
+
+
+def push_to_cloudwatch(metrics, namespace="EmbeddingMonitor", sink=None):
+    # Every metric of the run goes out in a single put_metric_data call
+    buffer = MetricsBuffer(namespace, sink or CloudWatchSink())
+    for k, v in metrics.items():
+        buffer.gauge(k, v)
+    buffer.flush()
+
+
+def check_drift(state, sketch, reference, threshold, pipeline_name=None):
+    """
+    Scores drift once the window has enough samples and starts re-selection past the threshold.
+
+    Re-selection is rate limited by DRIFT_COOLDOWN_HOURS; returns the drift metrics, or {}.
+    """
+    if sketch.count < DRIFT_MIN_SAMPLES:
+        print(f"Drift check needs {DRIFT_MIN_SAMPLES} samples, have {sketch.count}")
+        return {}
+
+    report = drift_report(sketch, reference)
+    print("Drift:", report)
+
+    if report["drift_score"] >= threshold and pipeline_name:
+        now = datetime.now(timezone.utc)
+        last = state.get("last_reselection_at")
+        if last and (now - datetime.fromisoformat(last)).total_seconds() < DRIFT_COOLDOWN_HOURS * 3600:
+            print(f"Drift {report['drift_score']:.3f} over threshold, re-selection already started at {last}")
+        else:
+            trigger_reselection(pipeline_name, f"Query embedding drift {report['drift_score']:.3f} >= {threshold}")
+            state["last_reselection_at"] = now.isoformat()
+    return report
+
+
+def load_sketch(state, dim):
+    # A fresh window after DRIFT_WINDOW_DAYS or when the embedding dimension changes
+    value = state.get("sketch")
+    if value and value["dim"] == dim:
+        sketch = EmbeddingSketch.from_state(value)
+        age = datetime.now(timezone.utc) - datetime.fromisoformat(sketch.started_at)
+        if age.total_seconds() < DRIFT_WINDOW_DAYS * 86400:
+            return sketch
+    return EmbeddingSketch(dim)
+
 
 if __name__ == "__main__":
-    data_dir = "/opt/ml/processing/input"
-    pairs = load_recent_data(data_dir)
-    if len(pairs) > 0:
-        metrics = compute_cosine_metrics(pairs)
-        push_to_cloudwatch(metrics)
-        print("Metrics pushed:", metrics)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--data-dir", type=str, default="/opt/ml/processing/input")
+    parser.add_argument("--capture-s3-uri", type=str, default=None, help="Read capture objects from S3 instead of --data-dir")
+    parser.add_argument("--state", type=str, default="monitor_state.json", help="Local path or s3:// URI of the watermark state")
+    parser.add_argument("--reference", type=str, default=REFERENCE_S3_URI, help="Local path or s3:// URI of catalog vectors (.npy)")
+    parser.add_argument("--drift-threshold", type=float, default=DRIFT_THRESHOLD)
+    parser.add_argument("--reselection-pipeline", type=str, default=RESELECTION_PIPELINE, help="Empty to only report drift")
+    parser.add_argument("--no-cloudwatch", action="store_true")
+    args = parser.parse_args()
+
+    source = S3CaptureSource(args.capture_s3_uri) if args.capture_s3_uri else LocalCaptureSource(args.data_dir)
+    state = load_state(args.state)
+
+    # Without a reference only the cosine metrics are reported; the sketch is kept for later runs
+    reference = load_reference(args.reference)
+    sketch = None
+    if reference is None:
+        print(f"No reference vectors at {args.reference} yet, skipping drift checking")
     else:
-        print("No valid data found.")
+        sketch = load_sketch(state, reference.shape[1])
+
+    window, malformed = process_new_data(source, state, sketch=sketch)
+    metrics = {}
+    if window["count"] > 0:
+        metrics.update(cosine_metrics(window))
+        metrics["new_pairs"] = window["count"]
+        metrics["malformed_records"] = malformed
+    else:
+        print(f"No new valid data found ({malformed} malformed records).")
+
+    if sketch is not None:
+        metrics.update(check_drift(state, sketch, reference, args.drift_threshold, args.reselection_pipeline))
+        state["sketch"] = sketch.to_state()
+
+    if metrics:
+        if not args.no_cloudwatch:
+            push_to_cloudwatch(metrics)
+        print("Metrics pushed:", metrics)
+
+    # Saved last: a failed run re-reads the same data next time
+    save_state(args.state, state)
+    print(f"Cumulative: {cosine_metrics(state['aggregates']) if state['aggregates']['count'] else 'no data'} "
+          f"over {state['aggregates']['count']} pairs")
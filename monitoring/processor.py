@@ -22,14 +22,20 @@ script_processor = ScriptProcessor(
     sagemaker_session=session
 )
 
+# The monitor lists capture objects itself, starting after the watermark in its
+# state file, so each run only downloads traffic it hasn't seen yet
 script_processor.run(
     code='monitor.py',
     inputs=[
         ProcessingInput(
-            source=f's3://{bucket}/{capture_data_prefix}',
-            destination='/opt/ml/processing/input'
+            source='metrics.py',
+            destination='/opt/ml/processing/input/lib'
         )
     ],
+    arguments=[
+        '--capture-s3-uri', f's3://{bucket}/{capture_data_prefix}',
+        '--state', f's3://{bucket}/monitoring/{endpoint_name}/monitor_state.json'
+    ],
     wait=True,
     logs=True
 )
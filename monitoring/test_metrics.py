@@ -0,0 +1,93 @@
+import io
+import json
+
+import pytest
+
+from metrics import HISTOGRAM_PRECISION, MAX_DATUMS_PER_CALL, CloudWatchSink, EmfSink, LocalSink, MetricsBuffer
+
+
+def buffer(sink, **kwargs):
+    return MetricsBuffer("Test", sink, flush_interval_s=3600, **kwargs)
+
+
+def test_counters_gauges_and_histograms_flush_as_one_batch():
+    sink = LocalSink()
+    metrics = buffer(sink, dimensions={"Service": "get_recipes"})
+    for _ in range(3):
+        metrics.increment("Requests")
+    metrics.increment("Shed", dimensions={"Priority": "batch"})
+    metrics.gauge("ConcurrencyLimit", 4)
+    metrics.gauge("ConcurrencyLimit", 6)
+    for latency in [10.0, 10.02, 200.0]:
+        metrics.observe("RequestLatency", latency)
+
+    assert not sink.batches
+    assert metrics.flush() == 1
+    assert len(sink.batches) == 1
+
+    assert sink.datums("Requests")[0]["Value"] == 3.0
+    assert sink.datums("Shed")[0]["Dimensions"] == [
+        {"Name": "Priority", "Value": "batch"}, {"Name": "Service", "Value": "get_recipes"}
+    ]
+    assert sink.datums("ConcurrencyLimit")[0]["Value"] == 6.0
+    latency = sink.datums("RequestLatency")[0]
+    # 10 and 10.02 share a bucket
+    assert sum(latency["Counts"]) == 3 and len(latency["Values"]) == 2
+
+    # Nothing new recorded, nothing sent
+    assert metrics.flush() == 0
+    assert len(sink.batches) == 1
+
+
+def test_local_sink_keeps_the_last_batches_and_appends_to_its_file(tmp_path):
+    path = tmp_path / "metrics.jsonl"
+    sink = LocalSink(max_batches=2, path=str(path))
+    metrics = buffer(sink)
+    for i in range(5):
+        metrics.increment("Requests", i + 1)
+        metrics.flush()
+
+    assert [datum["Value"] for datum in sink.datums("Requests")] == [4.0, 5.0]
+    lines = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [line["datums"][0]["Value"] for line in lines] == [1.0, 2.0, 3.0, 4.0, 5.0]
+    assert {line["namespace"] for line in lines} == {"Test"}
+
+
+def test_cloudwatch_sink_batches_to_the_api_limit():
+    class Client:
+        def __init__(self):
+            self.calls = []
+
+        def put_metric_data(self, Namespace, MetricData):
+            self.calls.append(len(MetricData))
+
+    client = Client()
+    metrics = buffer(CloudWatchSink(client))
+    for i in range(MAX_DATUMS_PER_CALL + 5):
+        metrics.increment(f"Metric{i}")
+
+    assert metrics.flush() == 2
+    assert client.calls == [MAX_DATUMS_PER_CALL, 5]
+
+
+def test_emf_sink_writes_log_lines_instead_of_calls():
+    stream = io.StringIO()
+    metrics = buffer(EmfSink(stream))
+    metrics.increment("Requests", 2)
+    metrics.observe("RequestLatency", 12.0)
+
+    metrics.flush()
+    (record,) = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert record["Requests"] == 2.0
+    assert record["RequestLatency"] == pytest.approx(12.0, rel=HISTOGRAM_PRECISION)
+    assert record["_aws"]["CloudWatchMetrics"][0]["Namespace"] == "Test"
+
+
+def test_a_failing_sink_does_not_raise():
+    class Broken:
+        def send(self, namespace, datums):
+            raise RuntimeError("throttled")
+
+    metrics = buffer(Broken())
+    metrics.increment("Requests")
+    assert metrics.flush() == 0
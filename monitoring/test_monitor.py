@@ -0,0 +1,73 @@
+import json
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+pytest.importorskip("boto3")
+
+from monitor import EmbeddingSketch, LocalCaptureSource, process_new_data, query_embeddings
+
+DIM = 8
+
+
+def capture_line(output):
+    record = {"captureData": {"endpointOutput": {"data": json.dumps(output)}}}
+    return json.dumps(record) + "\n"
+
+
+def token_embeddings(tokens, seed):
+    return np.random.default_rng(seed).normal(size=(tokens, DIM)).round(4).tolist()
+
+
+def expected(items):
+    pooled = np.array([np.mean(item, axis=0) for item in items])
+    return pooled / np.linalg.norm(pooled, axis=1, keepdims=True)
+
+
+def test_micro_batched_items_are_pooled_one_by_one():
+    items = [token_embeddings(3, 0), token_embeddings(7, 1), token_embeddings(5, 2)]
+
+    np.testing.assert_allclose(query_embeddings(items), expected(items), rtol=1e-5)
+    # With the batch axis kept on each item
+    np.testing.assert_allclose(query_embeddings([[item] for item in items]), expected(items), rtol=1e-5)
+
+
+def test_responses_without_embeddings_are_ignored():
+    assert query_embeddings([]) is None
+    assert query_embeddings([0.1, 0.2]) is None
+    assert query_embeddings([[0.1, 0.2], [0.1, 0.2, 0.3]]) is None
+
+
+def test_micro_batched_captures_reach_the_sketch(tmp_path):
+    with open(tmp_path / "capture.jsonl", "w") as f:
+        f.write(capture_line([token_embeddings(2, 3), token_embeddings(9, 4)]))
+        f.write(capture_line([[token_embeddings(4, 5)]]))
+
+    sketch = EmbeddingSketch(DIM)
+    _, malformed = process_new_data(LocalCaptureSource(str(tmp_path)), {}, sketch=sketch)
+
+    assert malformed == 0
+    assert sketch.count == 3
+
+
+def test_missing_reference_still_reports_cosine_metrics(tmp_path):
+    data_dir = tmp_path / "capture"
+    data_dir.mkdir()
+    with open(data_dir / "capture.jsonl", "w") as f:
+        for seed in range(4):
+            f.write(capture_line(np.random.default_rng(seed).normal(size=(2, DIM)).tolist()))
+
+    result = subprocess.run(
+        [
+            sys.executable, "monitor.py", "--data-dir", str(data_dir), "--state", str(tmp_path / "state.json"),
+            "--reference", str(tmp_path / "missing.npy"), "--no-cloudwatch"
+        ],
+        cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True
+    )
+
+    assert result.returncode == 0, result.stderr
+    assert "skipping drift checking" in result.stdout
+    assert "cosine_mean" in result.stdout
@@ -0,0 +1,190 @@
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import tarfile
+import tempfile
+from datetime import datetime, timezone
+
+import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.exceptions import ClientError
+
+# Parallel multipart upload for multi-hundred-MB model tarballs
+UPLOAD_CONFIG = TransferConfig(
+    multipart_threshold=64 * 1024 * 1024,
+    multipart_chunksize=64 * 1024 * 1024,
+    max_concurrency=10,
+    use_threads=True
+)
+
+
+class S3ArtifactStore:
+    """
+    Model artifacts under s3://bucket/prefix/.
+    """
+
+    def __init__(self, bucket, prefix):
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+        self.s3 = boto3.client("s3")
+
+    def _key(self, key):
+        return f"{self.prefix}/{key}"
+
+    def uri(self, key):
+        return f"s3://{self.bucket}/{self._key(key)}"
+
+    def exists(self, key):
+        try:
+            self.s3.head_object(Bucket=self.bucket, Key=self._key(key))
+            return True
+        except ClientError as e:
+            if e.response["Error"]["Code"] in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+
+    def upload(self, local_path, key):
+        self.s3.upload_file(local_path, self.bucket, self._key(key), Config=UPLOAD_CONFIG)
+
+    def write_json(self, key, value):
+        self.s3.put_object(Bucket=self.bucket, Key=self._key(key), Body=json.dumps(value), ContentType="application/json")
+
+
+class LocalArtifactStore:
+    """
+    A local directory standing in for the bucket, for running the cache without AWS.
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def _path(self, key):
+        return os.path.join(self.root, key)
+
+    def uri(self, key):
+        return f"file://{os.path.abspath(self._path(key))}"
+
+    def exists(self, key):
+        return os.path.exists(self._path(key))
+
+    def upload(self, local_path, key):
+        os.makedirs(os.path.dirname(self._path(key)), exist_ok=True)
+        # Copy then rename so a concurrent exists() never sees a partial artifact
+        shutil.copyfile(local_path, self._path(key) + ".partial")
+        os.replace(self._path(key) + ".partial", self._path(key))
+
+    def write_json(self, key, value):
+        os.makedirs(os.path.dirname(self._path(key)), exist_ok=True)
+        with open(self._path(key), "w") as f:
+            json.dump(value, f)
+
+
+def HashDirectory(directory):
+    """
+    sha256 over every file's relative path and contents, in a stable order.
+    """
+    digest = hashlib.sha256()
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for fname in sorted(files):
+            path = os.path.join(root, fname)
+            digest.update(os.path.relpath(path, directory).encode("utf-8"))
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                    digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+def HubRevision(model_id):
+    """
+    Commit sha of the model on the HF hub, or None if the hub can't be reached.
+
+    Knowing the revision before downloading is what lets a cache hit skip the download.
+    """
+    try:
+        from huggingface_hub import model_info
+        return model_info(model_id).sha[:16]
+    except Exception as e:
+        print(f"Could not resolve hub revision for {model_id}: {e}")
+        return None
+
+
+def PackageArtifact(model_dir, tar_path):
+    """
+    Writes model_dir as a .tar.gz, using pigz (parallel gzip) when it's installed.
+
+    Weights barely compress, so the fallback uses the fastest gzip level.
+    """
+    if shutil.which("pigz"):
+        with open(tar_path, "wb") as out:
+            tar = subprocess.Popen(["tar", "-cf", "-", "-C", model_dir, "."], stdout=subprocess.PIPE)
+            pigz = subprocess.Popen(["pigz", "-1"], stdin=tar.stdout, stdout=out)
+            tar.stdout.close()
+            if pigz.wait() != 0 or tar.wait() != 0:
+                raise RuntimeError(f"Packaging {model_dir} failed")
+    else:
+        with tarfile.open(tar_path, "w:gz", compresslevel=1) as tar:
+            tar.add(model_dir, arcname=".")
+    print(f"Packaged {model_dir} ({os.path.getsize(tar_path) / 1e6:.1f} MB)")
+
+
+def DownloadModel(model_id, model_dir):
+    from transformers import AutoModel, AutoTokenizer
+
+    AutoModel.from_pretrained(model_id).save_pretrained(model_dir)
+    AutoTokenizer.from_pretrained(model_id).save_pretrained(model_dir)
+
+
+def CachedModelArtifact(store, model_id, optimized_dir=None, download_fn=DownloadModel):
+    """
+    Returns the URI of a packaged artifact for model_id, building it only on a cache miss.
+
+    Artifacts are keyed on model id and a content hash: the hub revision for
+    fp32 checkpoints, or a hash of the files for a local (optimized) directory.
+    An identical artifact already in the store is reused as-is.
+    """
+    model_name = model_id[model_id.rfind('/') + 1:]
+    work_dir = tempfile.mkdtemp(prefix=f"{model_name}-")
+
+    try:
+        if optimized_dir:
+            variant = "onnx-int8"
+            model_dir = optimized_dir
+            content_hash = HashDirectory(model_dir)
+        else:
+            variant = "fp32"
+            model_dir = None
+            content_hash = HubRevision(model_id)
+            if content_hash is None:
+                # No revision to go on: download and hash what we got
+                model_dir = os.path.join(work_dir, "model")
+                download_fn(model_id, model_dir)
+                content_hash = HashDirectory(model_dir)
+
+        key = f"cache/{model_id.replace('/', '__')}/{variant}-{content_hash}.tar.gz"
+        if store.exists(key):
+            print(f"Artifact cache hit: {store.uri(key)}")
+            return store.uri(key)
+
+        print(f"Artifact cache miss for {model_id} ({variant}-{content_hash})")
+        if model_dir is None:
+            model_dir = os.path.join(work_dir, "model")
+            download_fn(model_id, model_dir)
+
+        tar_path = os.path.join(work_dir, f"{model_name}.tar.gz")
+        PackageArtifact(model_dir, tar_path)
+        store.upload(tar_path, key)
+        store.write_json(key.replace(".tar.gz", ".json"), {
+            "model_id": model_id,
+            "variant": variant,
+            "content_hash": content_hash,
+            "size_bytes": os.path.getsize(tar_path),
+            "created_at": datetime.now(timezone.utc).isoformat()
+        })
+        print(f"Uploaded {store.uri(key)}")
+        return store.uri(key)
+    finally:
+        # Only the scratch directory is ours to delete
+        shutil.rmtree(work_dir, ignore_errors=True)
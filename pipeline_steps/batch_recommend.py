@@ -0,0 +1,251 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import boto3
+import numpy as np
+
+# get_recipes' query building, filtering and store code, shipped with the job or found in the repo
+GET_RECIPES_DIRS = [
+    "/opt/ml/processing/input/get_recipes",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lambda", "get_recipes")
+]
+sys.path.insert(0, next((d for d in GET_RECIPES_DIRS if os.path.isdir(d)), GET_RECIPES_DIRS[0]))
+from constraints import COLUMN_DTYPES, constraint_mask, constraints_for
+from precomputed import precomputed_entry, precomputed_key
+from profile_vectors import compose_query_vector
+from recommendation import build_profile_string, build_query_string, build_request_string, filterAllergiesAndDislikes
+from response_cache import DynamoDBBackend, LocalDirectoryBackend
+
+ACTIVE_INDEX_URI = "s3://cs401r-mlops-final/index-metadata/active_index.json"
+PROFILES_URI = "s3://cs401r-mlops-final/user-profiles"
+CATALOG_URI = "s3://cs401r-mlops-final/catalog"
+
+# One default request per meal type, matching what app.py sends with its default
+# settings and no ingredients; get_recipes looks requests up by their non-empty fields
+MEAL_TYPES = ["Breakfast", "Lunch", "Dinner", "Snack", "Dessert"]
+DEFAULT_REQUESTS = [
+    {
+        "ingredients_available": [],
+        "max_time_minutes": 30,
+        "meal_type": meal_type,
+        "preferences": {"spice_level": "medium", "diet_type": "none"}
+    }
+    for meal_type in MEAL_TYPES
+]
+
+# Outlives one nightly run, so a failed run still leaves yesterday's lists in place
+ENTRY_TTL_SECONDS = 48 * 3600
+
+
+def _split(uri):
+    parsed = urlparse(uri)
+    return parsed.netloc, parsed.path.strip("/")
+
+
+def LoadProfiles(profiles_uri, workers=16):
+    """
+    Every stored user block under profiles_uri, fetched concurrently.
+    """
+    bucket, prefix = _split(profiles_uri)
+    s3 = boto3.client("s3")
+    keys = [
+        obj["Key"]
+        for page in s3.get_paginator("list_objects_v2").paginate(Bucket=bucket, Prefix=f"{prefix}/")
+        for obj in page.get("Contents", [])
+        if obj["Key"].endswith(".json")
+    ]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        profiles = list(pool.map(lambda key: json.loads(s3.get_object(Bucket=bucket, Key=key)["Body"].read()), keys))
+    print(f"Loaded {len(profiles)} profiles")
+    return profiles
+
+
+def LoadCatalog(catalog_uri, version):
+    bucket, prefix = _split(catalog_uri)
+    s3 = boto3.client("s3")
+    recipes = json.loads(s3.get_object(Bucket=bucket, Key=f"{prefix}/{version}/recipes.json")["Body"].read())
+    embeddings = np.load(io.BytesIO(s3.get_object(Bucket=bucket, Key=f"{prefix}/{version}/embeddings.npy")["Body"].read()))
+    embeddings = embeddings / np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+    return recipes, embeddings.astype(np.float32)
+
+
+def LoadConstraintColumns(catalog_uri, version):
+    """
+    The version's typed constraint columns, or None if it was built without them.
+    """
+    bucket, prefix = _split(catalog_uri)
+    s3 = boto3.client("s3")
+    try:
+        return {
+            name: np.load(io.BytesIO(s3.get_object(Bucket=bucket, Key=f"{prefix}/{version}/constraint_{name}.npy")["Body"].read()))
+            for name in COLUMN_DTYPES
+        }
+    except s3.exceptions.NoSuchKey:
+        print(f"Version {version} has no constraint columns; requests are not constrained")
+        return None
+
+
+def ScoreQueries(queries, catalog, top_k, chunk_size=1024, workers=None, masks=None, mask_ids=None):
+    """
+    Top-k catalog rows for each (normalized) query, best first.
+
+    Queries are scored in chunks of matrix-matrix products, spread over a
+    thread pool (numpy releases the GIL in matmul and argpartition).
+
+    masks is an optional (num_masks, len(catalog)) boolean array of allowed rows
+    and mask_ids picks one per query; disallowed rows score -inf, so a query
+    with fewer than top_k allowed rows gets -inf padding at the end.
+    """
+    top_k = min(top_k, len(catalog))
+    ids = np.empty((len(queries), top_k), dtype=np.int32)
+    scores = np.empty((len(queries), top_k), dtype=np.float32)
+
+    def score_chunk(start):
+        chunk_scores = queries[start:start + chunk_size] @ catalog.T
+        if masks is not None:
+            chunk_scores[~masks[mask_ids[start:start + chunk_size]]] = -np.inf
+        top = np.argpartition(-chunk_scores, top_k - 1, axis=1)[:, :top_k]
+        top_scores = np.take_along_axis(chunk_scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        ids[start:start + chunk_size] = np.take_along_axis(top, order, axis=1)
+        scores[start:start + chunk_size] = np.take_along_axis(top_scores, order, axis=1)
+
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1) as pool:
+        list(pool.map(score_chunk, range(0, len(queries), chunk_size)))
+    return ids, scores
+
+
+def ComposedQueries(encode, profile_strings, request_strings, profile_weight=0.5):
+    """
+    Query vectors built the way get_recipes builds them with COMPOSED_QUERY_VECTORS set.
+
+    Each distinct profile and request string is embedded once and every job's
+    pair is combined with compose_query_vector; an empty string contributes no vector.
+    """
+    distinct = sorted({string for string in profile_strings + request_strings if string})
+    vectors = dict(zip(distinct, encode(distinct)))
+    return np.array([
+        compose_query_vector(vectors.get(profile), vectors.get(request), profile_weight)
+        for profile, request in zip(profile_strings, request_strings)
+    ], dtype=np.float32)
+
+
+def RunBatch(store, profiles_uri=PROFILES_URI, catalog_uri=CATALOG_URI, active_index_uri=ACTIVE_INDEX_URI,
+             top_n=10, candidates=100, requests=None, composed=None, profile_weight=None):
+    """
+    Precomputes top_n safe recipes for every stored profile and default request, and writes them to store.
+
+    requests is a list of request blocks (default: DEFAULT_REQUESTS). composed
+    and profile_weight must match the Lambda's COMPOSED_QUERY_VECTORS and
+    PROFILE_VECTOR_WEIGHT, and default to the same environment variables.
+    """
+    from sentence_transformers import SentenceTransformer
+
+    requests = requests or DEFAULT_REQUESTS
+    if composed is None:
+        composed = os.environ.get("COMPOSED_QUERY_VECTORS", "").lower() in ("1", "true", "yes")
+    if profile_weight is None:
+        profile_weight = float(os.environ.get("PROFILE_VECTOR_WEIGHT", "0.5"))
+    bucket, key = _split(active_index_uri)
+    pointer = json.loads(boto3.client("s3").get_object(Bucket=bucket, Key=key)["Body"].read())
+    version = pointer["version"]
+    print(f"Precomputing against index version {version} ({pointer['model_name']})")
+
+    recipes, catalog = LoadCatalog(catalog_uri, version)
+    columns = LoadConstraintColumns(catalog_uri, version)
+    profiles = LoadProfiles(profiles_uri)
+    jobs = [(profile, request) for profile in profiles for request in requests]
+    if not jobs:
+        print("No profiles to precompute")
+        return 0
+
+    start = time.perf_counter()
+    model = SentenceTransformer(pointer["model_name"], device="cpu")
+
+    def encode(strings):
+        return model.encode(strings, batch_size=128, normalize_embeddings=True, convert_to_numpy=True)
+
+    if composed:
+        queries = ComposedQueries(
+            encode,
+            [build_profile_string(profile) for profile, _ in jobs],
+            [build_request_string(request) for _, request in jobs],
+            profile_weight
+        )
+    else:
+        # build_query_string logs every field; that's noise for thousands of queries
+        with contextlib.redirect_stdout(io.StringIO()):
+            queries = encode([build_query_string(profile, request) for profile, request in jobs])
+    print(f"Embedded {len(queries)} {'composed ' if composed else ''}queries in {time.perf_counter() - start:.1f} s")
+
+    # One mask per distinct set of hard constraints, applied while scoring
+    masks = mask_ids = None
+    if columns is not None:
+        constraint_sets = [json.dumps(constraints_for(profile, request), sort_keys=True) for profile, request in jobs]
+        distinct = sorted(set(constraint_sets))
+        position = {c: i for i, c in enumerate(distinct)}
+        masks = np.stack([constraint_mask(columns, json.loads(c)) for c in distinct])
+        mask_ids = np.array([position[c] for c in constraint_sets], dtype=np.int32)
+        print(f"Built {len(distinct)} constraint masks; {masks.mean(axis=1).round(3).tolist()} of the catalog allowed")
+
+    start = time.perf_counter()
+    ids, scores = ScoreQueries(queries.astype(np.float32), catalog, candidates, masks=masks, mask_ids=mask_ids)
+    print(f"Scored {len(queries)} queries against {len(catalog)} recipes in {time.perf_counter() - start:.1f} s")
+
+    for (profile, request), row_ids, row_scores in zip(jobs, ids, scores):
+        matches = [
+            {"id": recipes[i]["id"], "score": float(score), "metadata": recipes[i]["metadata"]}
+            for i, score in zip(row_ids, row_scores)
+            if np.isfinite(score)
+        ]
+        safe = filterAllergiesAndDislikes(matches, profile.get("allergies"), profile.get("dislikes"))
+        store.set(precomputed_key(profile, request), precomputed_entry(safe[:top_n], version), ENTRY_TTL_SECONDS)
+
+    print(f"Wrote {len(jobs)} precomputed lists")
+    return len(jobs)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--install-dependencies', action='store_true')
+    parser.add_argument('--requirements-file', type=str, default='requirements.txt')
+    parser.add_argument('--backend', type=str, choices=['dynamodb', 'local'], default='dynamodb')
+    parser.add_argument('--table', type=str, default=None, help='DynamoDB table (same as get_recipes PRECOMPUTED_TABLE)')
+    parser.add_argument('--dir', type=str, default='precomputed', help='Directory for the local backend')
+    parser.add_argument('--profiles-uri', type=str, default=PROFILES_URI)
+    parser.add_argument('--catalog-uri', type=str, default=CATALOG_URI)
+    parser.add_argument('--top-n', type=int, default=10)
+    parser.add_argument('--candidates', type=int, default=100, help='Candidates scored before allergy/dislike filtering')
+    parser.add_argument('--requests-file', type=str, default=None, help='JSON list of request blocks to precompute instead of the defaults')
+    parser.add_argument('--composed-query-vectors', action='store_true', default=None,
+                        help='Compose profile and request vectors (default: COMPOSED_QUERY_VECTORS)')
+    parser.add_argument('--profile-vector-weight', type=float, default=None,
+                        help='Share of the profile in composed queries (default: PROFILE_VECTOR_WEIGHT or 0.5)')
+    args = parser.parse_args()
+
+    if args.install_dependencies:
+        print("Installing dependencies...")
+        subprocess.check_call([sys.executable, "-m", "pip", "install", "-r", args.requirements_file])
+        print("Dependencies installed successfully.")
+
+    if args.backend == 'dynamodb':
+        precomputed_store = DynamoDBBackend(args.table)
+    else:
+        precomputed_store = LocalDirectoryBackend(args.dir, max_entries=10**6)
+
+    default_requests = None
+    if args.requests_file:
+        with open(args.requests_file) as f:
+            default_requests = json.load(f)
+
+    RunBatch(precomputed_store, args.profiles_uri, args.catalog_uri, top_n=args.top_n,
+             candidates=args.candidates, requests=default_requests,
+             composed=args.composed_query_vectors, profile_weight=args.profile_vector_weight)
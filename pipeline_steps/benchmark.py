@@ -0,0 +1,139 @@
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+DEFAULT_BATCH_SIZES = [1, 8, 32, 64]
+DEFAULT_THREAD_COUNTS = [1, 2]
+
+# ml.m5.large (the serving instance) has 2 vCPUs
+SERVING_THREADS = 2
+
+
+def _percentiles(timings_ms):
+    timings_ms = np.array(timings_ms)
+    return {
+        "p50_ms": float(np.percentile(timings_ms, 50)),
+        "p95_ms": float(np.percentile(timings_ms, 95)),
+        "p99_ms": float(np.percentile(timings_ms, 99)),
+        "mean_ms": float(timings_ms.mean())
+    }
+
+
+def _peak_rss_mb():
+    # ru_maxrss is in KB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def BenchmarkEncoder(model_name, queries, corpus, batch_sizes=None, thread_counts=None, warmup=5, iterations=50):
+    """
+    Benchmarks one encoder in the current process.
+
+    Single-query latency (what serving sees) is measured separately from bulk
+    throughput (what re-embedding sees), each after warmup calls, at every
+    thread count. Run in a fresh process so load time and peak RSS belong to
+    this model alone.
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    batch_sizes = batch_sizes or DEFAULT_BATCH_SIZES
+    thread_counts = thread_counts or DEFAULT_THREAD_COUNTS
+    rss_before = _peak_rss_mb()
+
+    start = time.perf_counter()
+    model = SentenceTransformer(model_name, device="cpu")
+    load_time_ms = (time.perf_counter() - start) * 1000
+
+    report = {
+        "model": model_name,
+        "load_time_ms": load_time_ms,
+        "dimension": model.get_sentence_embedding_dimension(),
+        "warmup": warmup,
+        "iterations": iterations,
+        "single_query": {},
+        "throughput": {}
+    }
+
+    for threads in thread_counts:
+        torch.set_num_threads(threads)
+
+        for i in range(warmup):
+            model.encode([queries[i % len(queries)]])
+        timings = []
+        for i in range(iterations):
+            query_start = time.perf_counter()
+            model.encode([queries[i % len(queries)]])
+            timings.append((time.perf_counter() - query_start) * 1000)
+        report["single_query"][str(threads)] = _percentiles(timings)
+
+        report["throughput"][str(threads)] = {}
+        for batch_size in batch_sizes:
+            model.encode(corpus[:batch_size], batch_size=batch_size)
+            bulk_start = time.perf_counter()
+            model.encode(corpus, batch_size=batch_size)
+            elapsed = time.perf_counter() - bulk_start
+            report["throughput"][str(threads)][str(batch_size)] = {
+                "sentences_per_second": len(corpus) / elapsed,
+                "total_ms": elapsed * 1000
+            }
+
+        print(f"{model_name} @ {threads} threads: "
+              f"p95 {report['single_query'][str(threads)]['p95_ms']:.1f} ms, "
+              f"bulk {max(r['sentences_per_second'] for r in report['throughput'][str(threads)].values()):.0f} sentences/s")
+
+    report["peak_rss_mb"] = _peak_rss_mb()
+    report["model_rss_mb"] = report["peak_rss_mb"] - rss_before
+    return report
+
+
+def ReportPath(output_dir, model_name):
+    return os.path.join(output_dir, f"{model_name.replace('/', '__')}.json")
+
+
+def RunIsolatedBenchmark(model_name, queries, corpus, output_dir, **kwargs):
+    """
+    Runs BenchmarkEncoder in a fresh interpreter and returns its JSON report.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    report_path = ReportPath(output_dir, model_name)
+
+    with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as f:
+        json.dump({"queries": list(queries), "corpus": list(corpus), "kwargs": kwargs}, f)
+        inputs_path = f.name
+
+    try:
+        subprocess.check_call([
+            sys.executable, os.path.abspath(__file__),
+            "--model", model_name,
+            "--inputs", inputs_path,
+            "--output", report_path
+        ])
+    finally:
+        os.remove(inputs_path)
+
+    with open(report_path) as f:
+        return json.load(f)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model', type=str, required=True)
+    parser.add_argument('--inputs', type=str, required=True, help='JSON with queries, corpus and BenchmarkEncoder kwargs')
+    parser.add_argument('--output', type=str, required=True)
+    args = parser.parse_args()
+
+    with open(args.inputs) as f:
+        inputs = json.load(f)
+
+    result = BenchmarkEncoder(args.model, inputs["queries"], inputs["corpus"], **inputs.get("kwargs", {}))
+
+    with open(args.output, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"Benchmark report written to {args.output}")
@@ -0,0 +1,107 @@
+import argparse
+import io
+import os
+import sys
+from urllib.parse import urlparse
+
+import boto3
+import numpy as np
+import pandas as pd
+
+# get_recipes' constraint codes, shipped with the job or found in the repo
+GET_RECIPES_DIRS = [
+    "/opt/ml/processing/input/get_recipes",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lambda", "get_recipes")
+]
+sys.path.insert(0, next((d for d in GET_RECIPES_DIRS if os.path.isdir(d)), GET_RECIPES_DIRS[0]))
+from constraints import (
+    ALL_MEAL_TYPES,
+    COLUMN_DTYPES,
+    MAX_MINUTES,
+    MEAL_TYPE_BITS,
+    RANK_CODES,
+    UNKNOWN_MINUTES,
+    UNKNOWN_RANK
+)
+
+# Words in RecipeCategory/Keywords that place a recipe in a meal type
+MEAL_TYPE_KEYWORDS = {
+    "Breakfast": ["breakfast", "brunch"],
+    "Lunch": ["lunch", "sandwich", "salad"],
+    "Dinner": ["dinner", "main dish", "one dish meal", "stew", "roast", "casserole"],
+    "Snack": ["snack", "appetizer"],
+    "Dessert": ["dessert", "cookie", "pie", "candy", "cake"]
+}
+
+RANKING_COLUMNS = {
+    "protein_rank": "ProteinRanking",
+    "fat_rank": "FatRanking",
+    "carb_rank": "CarbohydrateRanking"
+}
+
+
+def _Hours(df, column):
+    if column not in df:
+        return pd.Series(np.nan, index=df.index)
+    return pd.to_numeric(df[column], errors="coerce")
+
+
+def _TotalMinutes(df):
+    # Durations are in hours after preprocessing; fall back to prep + cook when TotalTime is missing
+    parts = _Hours(df, "PrepTime").fillna(0) + _Hours(df, "CookTime").fillna(0)
+    hours = _Hours(df, "TotalTime").fillna(parts.where(parts > 0))
+    minutes = (hours * 60).round()
+    return minutes.clip(upper=MAX_MINUTES).fillna(UNKNOWN_MINUTES).to_numpy().astype(np.int16)
+
+
+def _MealTypes(df):
+    text = df.get("RecipeCategory", pd.Series("", index=df.index)).astype(str).str.lower()
+    if "Keywords" in df:
+        text = text + " " + df["Keywords"].astype(str).str.lower()
+
+    bits = np.zeros(len(df), dtype=np.uint8)
+    for meal_type, keywords in MEAL_TYPE_KEYWORDS.items():
+        matches = text.str.contains("|".join(keywords), regex=True).to_numpy()
+        bits[matches] |= MEAL_TYPE_BITS[meal_type]
+    # A recipe nothing places is allowed for every meal type rather than none
+    bits[bits == 0] = ALL_MEAL_TYPES
+    return bits
+
+
+def EncodeConstraintColumns(df):
+    """
+    Typed constraint columns for the rows of a preprocessed recipe frame.
+
+    Returns a dictionary of arrays with the dtypes in constraints.COLUMN_DTYPES.
+    """
+    columns = {"total_minutes": _TotalMinutes(df), "meal_types": _MealTypes(df)}
+    for column, source in RANKING_COLUMNS.items():
+        levels = df[source].astype(str).str.lower() if source in df else pd.Series("", index=df.index)
+        columns[column] = levels.map(RANK_CODES).fillna(UNKNOWN_RANK).to_numpy().astype(np.uint8)
+
+    assert all(columns[name].dtype == dtype for name, dtype in COLUMN_DTYPES.items())
+    return columns
+
+
+def PublishConstraintColumns(catalog_uri, columns):
+    """
+    Writes each column as <catalog_uri>/constraint_<name>.npy, next to recipes.json.
+    """
+    parsed = urlparse(catalog_uri)
+    s3 = boto3.client("s3")
+    for name, values in columns.items():
+        buffer = io.BytesIO()
+        np.save(buffer, values)
+        s3.put_object(Bucket=parsed.netloc, Key=f"{parsed.path.strip('/')}/constraint_{name}.npy", Body=buffer.getvalue())
+    print(f"Published {len(columns)} constraint columns ({sum(v.nbytes for v in columns.values())} bytes) to {catalog_uri}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--preprocessed-csv', type=str, required=True)
+    parser.add_argument('--catalog-uri', type=str, required=True, help='s3://bucket/catalog/<version>')
+    parser.add_argument('--rows', type=int, default=None, help='Only encode the first N rows, as embed.py does')
+    args = parser.parse_args()
+
+    frame = pd.read_csv(args.preprocessed_csv, nrows=args.rows)
+    PublishConstraintColumns(args.catalog_uri, EncodeConstraintColumns(frame))
@@ -0,0 +1,271 @@
+import argparse
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import time
+from urllib.parse import urlparse
+
+import boto3
+import numpy as np
+import pandas as pd
+
+# Written by the preprocessing Lambda next to preprocessed_data.csv
+MANIFEST_URI = "s3://cs401r-mlops-final/preprocessed-data/shards/manifest.json"
+# Per-shard vectors, keyed by model and shard content hash
+EMBEDDINGS_URI = "s3://cs401r-mlops-final/embeddings/shards"
+
+BATCH_SIZE = 32
+STUB_DIM = 384
+
+# SageMaker writes the job's hosts here on every instance of a multi-instance job
+RESOURCE_CONFIG = "/opt/ml/config/resourceconfig.json"
+
+
+def _ReadBytes(uri):
+    parsed = urlparse(uri)
+    if parsed.scheme == "s3":
+        return boto3.client("s3").get_object(Bucket=parsed.netloc, Key=parsed.path.lstrip("/"))["Body"].read()
+    with open(uri, "rb") as f:
+        return f.read()
+
+
+def _WriteBytes(uri, body):
+    parsed = urlparse(uri)
+    if parsed.scheme == "s3":
+        boto3.client("s3").put_object(Bucket=parsed.netloc, Key=parsed.path.lstrip("/"), Body=body)
+        return
+    # Write then rename, like a single S3 put: a reader never sees a partial file
+    os.makedirs(os.path.dirname(uri), exist_ok=True)
+    partial_path = f"{uri}.{os.getpid()}.partial"
+    with open(partial_path, "wb") as f:
+        f.write(body)
+    os.replace(partial_path, uri)
+
+
+def _Exists(uri):
+    parsed = urlparse(uri)
+    if parsed.scheme != "s3":
+        return os.path.exists(uri)
+    try:
+        boto3.client("s3").head_object(Bucket=parsed.netloc, Key=parsed.path.lstrip("/"))
+        return True
+    except Exception as e:
+        if getattr(e, "response", {}).get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+            return False
+        raise
+
+
+def LoadManifest(manifest_uri):
+    return json.loads(_ReadBytes(manifest_uri))
+
+
+def ShardUri(manifest_uri, shard):
+    # Shard files sit next to the manifest
+    return f"{manifest_uri.rsplit('/', 1)[0]}/{shard['file']}"
+
+
+def ShardEmbeddingsUri(output_uri, model_name, shard):
+    return f"{output_uri.rstrip('/')}/{model_name.replace('/', '__')}/{shard['sha256'][:16]}.npy"
+
+
+def ShardsForRows(manifest, max_rows=None):
+    """
+    The shards covering the first max_rows rows (all of them when max_rows is None).
+    """
+    if max_rows is None:
+        return list(manifest["shards"])
+    return [shard for shard in manifest["shards"] if shard["row_start"] < max_rows]
+
+
+def AssignShards(manifest, worker_index, num_workers):
+    """
+    Worker worker_index's share of the shards; every shard goes to exactly one worker.
+    """
+    if not 0 <= worker_index < num_workers:
+        raise ValueError(f"Worker index {worker_index} is not in [0, {num_workers})")
+    return manifest["shards"][worker_index::num_workers]
+
+
+def ClusterAssignment():
+    """
+    (worker_index, num_workers) of this instance in a multi-instance SageMaker
+    job, or (0, 1) anywhere else.
+    """
+    if not os.path.exists(RESOURCE_CONFIG):
+        return 0, 1
+    with open(RESOURCE_CONFIG) as f:
+        config = json.load(f)
+    hosts = sorted(config["hosts"])
+    return hosts.index(config["current_host"]), len(hosts)
+
+
+def _StubEncode(texts):
+    # Deterministic vectors from the text hash, for running the job without a model
+    return np.stack([
+        np.random.default_rng(int(hashlib.sha256(text.encode("utf-8")).hexdigest()[:16], 16)).normal(size=STUB_DIM)
+        for text in texts
+    ]).astype(np.float32)
+
+
+def LoadEncoder(model_name):
+    """
+    Returns a function from a list of texts to a float32 matrix; model_name 'stub' needs no model.
+    """
+    if model_name == "stub":
+        return _StubEncode
+    from sentence_transformers import SentenceTransformer
+    model = SentenceTransformer(model_name)
+    return lambda texts: np.asarray(model.encode(texts, batch_size=BATCH_SIZE, show_progress_bar=False), dtype=np.float32)
+
+
+def EmbedShard(manifest_uri, shard, encode, model_name, output_uri=EMBEDDINGS_URI):
+    """
+    Embeds one shard's EmbeddingSentence column unless its vectors already exist.
+
+    The output is keyed by the shard's content hash, so reruns and duplicate
+    workers skip finished shards, and a changed shard is never mistaken for an
+    old one. Returns True if the shard was embedded, False if it was skipped.
+    """
+    output = ShardEmbeddingsUri(output_uri, model_name, shard)
+    if _Exists(output):
+        print(f"Shard {shard['shard_id']} already embedded: {output}")
+        return False
+
+    body = _ReadBytes(ShardUri(manifest_uri, shard))
+    if hashlib.sha256(body).hexdigest() != shard["sha256"]:
+        raise ValueError(f"Shard {shard['shard_id']} doesn't match the manifest hash; rerun preprocessing")
+    texts = pd.read_csv(io.BytesIO(body))["EmbeddingSentence"].astype(str).tolist()
+
+    start = time.perf_counter()
+    if texts:
+        embeddings = np.concatenate([encode(texts[i:i + BATCH_SIZE]) for i in range(0, len(texts), BATCH_SIZE)])
+    else:
+        # An empty shard still gets a (0, dim) file, so merging needs no special case
+        embeddings = encode([""])[:0]
+    if len(embeddings) != shard["row_count"]:
+        raise ValueError(f"Shard {shard['shard_id']} has {len(embeddings)} rows, the manifest says {shard['row_count']}")
+
+    buffer = io.BytesIO()
+    np.save(buffer, embeddings)
+    _WriteBytes(output, buffer.getvalue())
+    print(f"Embedded shard {shard['shard_id']} ({len(embeddings)} rows) in {time.perf_counter() - start:.1f} s")
+    return True
+
+
+def EmbedShards(manifest_uri, shards, model_name, output_uri=EMBEDDINGS_URI):
+    """
+    Embeds every shard in shards that isn't done yet, loading the model only if one is missing.
+    """
+    pending = [shard for shard in shards if not _Exists(ShardEmbeddingsUri(output_uri, model_name, shard))]
+    print(f"{len(shards) - len(pending)} of {len(shards)} shards already embedded")
+    if pending:
+        encode = LoadEncoder(model_name)
+        for shard in pending:
+            EmbedShard(manifest_uri, shard, encode, model_name, output_uri)
+    return len(pending)
+
+
+def MergeShardEmbeddings(manifest_uri, model_name, output_uri=EMBEDDINGS_URI, max_rows=None):
+    """
+    Concatenates the per-shard vectors in row order into one (rows, dim) matrix.
+
+    Every shard covering the first max_rows rows must have been embedded.
+    """
+    manifest = LoadManifest(manifest_uri)
+    shards = ShardsForRows(manifest, max_rows)
+    missing = [shard["shard_id"] for shard in shards if not _Exists(ShardEmbeddingsUri(output_uri, model_name, shard))]
+    if missing:
+        raise ValueError(f"Shards {missing} have no embeddings for {model_name} yet")
+
+    embeddings = np.concatenate([
+        np.load(io.BytesIO(_ReadBytes(ShardEmbeddingsUri(output_uri, model_name, shard)))) for shard in shards
+    ])
+    return embeddings[:max_rows] if max_rows is not None else embeddings
+
+
+def LoadShardFrame(manifest_uri, max_rows=None):
+    """
+    The preprocessed rows the merged embeddings line up with, read back from the shards.
+    """
+    shards = ShardsForRows(LoadManifest(manifest_uri), max_rows)
+    frame = pd.concat([pd.read_csv(io.BytesIO(_ReadBytes(ShardUri(manifest_uri, shard)))) for shard in shards], ignore_index=True)
+    return frame.iloc[:max_rows] if max_rows is not None else frame
+
+
+def _Worker(manifest_uri, model_name, output_uri, worker_index, num_workers):
+    shards = AssignShards(LoadManifest(manifest_uri), worker_index, num_workers)
+    EmbedShards(manifest_uri, shards, model_name, output_uri)
+
+
+def RunLocal(manifest_uri, model_name, output_uri, processes):
+    """
+    Embeds every shard with processes worker processes on this machine, as
+    separate instances would, and returns the wall-clock seconds taken.
+    """
+    context = multiprocessing.get_context("spawn")
+    start = time.perf_counter()
+    workers = [
+        context.Process(target=_Worker, args=(manifest_uri, model_name, output_uri, i, processes))
+        for i in range(processes)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    failed = [i for i, worker in enumerate(workers) if worker.exitcode != 0]
+    if failed:
+        raise RuntimeError(f"Workers {failed} failed")
+    elapsed = time.perf_counter() - start
+    print(f"Embedded {manifest_uri} with {processes} processes in {elapsed:.1f} s")
+    return elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    subcommands = parser.add_subparsers(dest="command", required=True)
+
+    embed_parser = subcommands.add_parser("embed", help="Embed this worker's shards")
+    embed_parser.add_argument("--worker-index", type=int, default=None, help="Default: from the SageMaker resource config")
+    embed_parser.add_argument("--num-workers", type=int, default=None)
+
+    merge_parser = subcommands.add_parser("merge", help="Concatenate the per-shard vectors")
+    merge_parser.add_argument("--output-file", type=str, required=True, help="s3:// URI or path of the merged .npy")
+    merge_parser.add_argument("--max-rows", type=int, default=None)
+
+    local_parser = subcommands.add_parser("local", help="Embed every shard with several local processes")
+    local_parser.add_argument(
+        "--processes", type=int, nargs="+", default=[os.cpu_count() or 1],
+        help="Several counts time a fresh run each, under <output-uri>/processes-<n>"
+    )
+
+    for subparser in (embed_parser, merge_parser, local_parser):
+        subparser.add_argument("--manifest-uri", type=str, default=MANIFEST_URI)
+        subparser.add_argument("--output-uri", type=str, default=EMBEDDINGS_URI)
+        subparser.add_argument("--model-name", type=str, default="all-MiniLM-L6-v2")
+    args = parser.parse_args()
+
+    if args.command == "embed":
+        worker_index, num_workers = ClusterAssignment()
+        if args.worker_index is not None:
+            worker_index, num_workers = args.worker_index, args.num_workers or 1
+        _Worker(args.manifest_uri, args.model_name, args.output_uri, worker_index, num_workers)
+    elif args.command == "merge":
+        merged = MergeShardEmbeddings(args.manifest_uri, args.model_name, args.output_uri, args.max_rows)
+        buffer = io.BytesIO()
+        np.save(buffer, merged)
+        _WriteBytes(args.output_file, buffer.getvalue())
+        print(f"Merged {merged.shape[0]} vectors of dimension {merged.shape[1]} into {args.output_file}")
+    elif len(args.processes) == 1:
+        RunLocal(args.manifest_uri, args.model_name, args.output_uri, args.processes[0])
+    else:
+        timings = {
+            processes: RunLocal(args.manifest_uri, args.model_name, f"{args.output_uri.rstrip('/')}/processes-{processes}", processes)
+            for processes in args.processes
+        }
+        baseline = timings[args.processes[0]]
+        print(json.dumps([
+            {"processes": processes, "seconds": seconds, "speedup": baseline / seconds}
+            for processes, seconds in timings.items()
+        ], indent=2))
@@ -0,0 +1,40 @@
+import json
+from datetime import datetime, timezone
+
+import boto3
+
+# Written by the deploy step so the endpoint for a model group is a single read
+ENDPOINT_POINTER_BUCKET = "cs401r-mlops-final"
+ENDPOINT_POINTER_KEY = "endpoint-metadata/{group_name}.json"
+
+
+def PublishEndpointName(group_name, endpoint_name, model_package_arn):
+    s3 = boto3.client("s3")
+    s3.put_object(
+        Bucket=ENDPOINT_POINTER_BUCKET,
+        Key=ENDPOINT_POINTER_KEY.format(group_name=group_name),
+        Body=json.dumps({
+            "endpoint_name": endpoint_name,
+            "model_package_arn": model_package_arn,
+            "published_at": datetime.now(timezone.utc).isoformat()
+        }),
+        ContentType="application/json"
+    )
+    print(f"Published endpoint {endpoint_name} for {group_name}")
+
+
+def ReadEndpointPointer(group_name):
+    """
+    (endpoint_name, etag) published for the group, or (None, None) if there isn't one.
+
+    The ETag changes with every publish, so readers can key caches on it.
+    """
+    s3 = boto3.client("s3")
+    try:
+        response = s3.get_object(
+            Bucket=ENDPOINT_POINTER_BUCKET,
+            Key=ENDPOINT_POINTER_KEY.format(group_name=group_name)
+        )
+    except s3.exceptions.NoSuchKey:
+        return None, None
+    return json.loads(response["Body"].read())["endpoint_name"], response["ETag"]
@@ -0,0 +1,199 @@
+import argparse
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import boto3
+import numpy as np
+
+DEFAULT_KS = [5, 10]
+EMBEDDING_CACHE_S3_PREFIX = "model-selection/embedding-cache"
+
+
+def LoadLabeledQueries(bucket, key):
+    """
+    Loads a labeled query set from S3, or None if there isn't one.
+
+    Format: [{"query": "...", "relevant": [RecipeId, ...], "gains": {"RecipeId": gain}}]
+    where "gains" is optional and defaults to 1 for every relevant recipe.
+    """
+    s3 = boto3.client("s3")
+    try:
+        body = s3.get_object(Bucket=bucket, Key=key)['Body'].read().decode('utf-8')
+    except s3.exceptions.NoSuchKey:
+        return None
+    return json.loads(body)
+
+
+def KnownItemQueries(recipe_ids, names, num_queries=200, seed=0):
+    """
+    Builds a labeled set from the corpus itself: each recipe's name should retrieve that recipe.
+    """
+    rng = np.random.default_rng(seed)
+    picks = rng.choice(len(recipe_ids), size=min(num_queries, len(recipe_ids)), replace=False)
+    return [{"query": str(names[i]), "relevant": [str(recipe_ids[i])]} for i in picks]
+
+
+def CorpusHash(recipe_ids, sentences):
+    digest = hashlib.sha256()
+    for recipe_id, sentence in zip(recipe_ids, sentences):
+        digest.update(f"{recipe_id}\t{sentence}\n".encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+def RecallAtK(ranked_ids, relevant, k):
+    if not relevant:
+        return 0.0
+    return len(set(ranked_ids[:k]) & set(relevant)) / len(relevant)
+
+
+def NdcgAtK(ranked_ids, gains, k):
+    dcg = sum(gains.get(recipe_id, 0.0) / np.log2(rank + 2) for rank, recipe_id in enumerate(ranked_ids[:k]))
+    ideal = sorted(gains.values(), reverse=True)[:k]
+    idcg = sum(gain / np.log2(rank + 2) for rank, gain in enumerate(ideal))
+    return dcg / idcg if idcg > 0 else 0.0
+
+
+def CachedCorpusEmbeddings(model, model_name, sentences, corpus_hash, cache_dir, bucket=None):
+    """
+    Returns L2-normalised corpus embeddings, encoding only on a cache miss.
+
+    The cache is keyed on model and corpus hash, kept on local disk and
+    mirrored to S3 so later pipeline runs can reuse it.
+    """
+    file_name = f"{model_name.replace('/', '__')}-{corpus_hash}.npy"
+    local_path = os.path.join(cache_dir, file_name)
+    s3_key = f"{EMBEDDING_CACHE_S3_PREFIX}/{file_name}"
+    s3 = boto3.client("s3") if bucket else None
+
+    if not os.path.exists(local_path) and s3 is not None:
+        try:
+            s3.download_file(bucket, s3_key, local_path)
+            print(f"Embedding cache hit in S3: {s3_key}")
+        except Exception:
+            pass
+
+    if os.path.exists(local_path):
+        return np.load(local_path)
+
+    print(f"Embedding cache miss for {model_name}, encoding {len(sentences)} sentences")
+    embeddings = model.encode(sentences, batch_size=64, normalize_embeddings=True, convert_to_numpy=True)
+    embeddings = embeddings.astype(np.float32)
+    os.makedirs(cache_dir, exist_ok=True)
+    np.save(local_path, embeddings)
+    if s3 is not None:
+        s3.upload_file(local_path, bucket, s3_key)
+    return embeddings
+
+
+def EvaluateModel(model_name, labeled_queries, recipe_ids, sentences, cache_dir, bucket=None, ks=None):
+    """
+    Computes mean recall@k and nDCG@k of one model over the labeled query set.
+    """
+    from sentence_transformers import SentenceTransformer
+
+    ks = ks or DEFAULT_KS
+    model = SentenceTransformer(model_name, device="cpu")
+    recipe_ids = [str(r) for r in recipe_ids]
+
+    start = time.perf_counter()
+    corpus = CachedCorpusEmbeddings(model, model_name, sentences, CorpusHash(recipe_ids, sentences), cache_dir, bucket)
+    corpus_seconds = time.perf_counter() - start
+
+    queries = model.encode([q["query"] for q in labeled_queries], normalize_embeddings=True, convert_to_numpy=True)
+    scores = queries.astype(np.float32) @ corpus.T
+
+    # Partial sort: only the top max(ks) of each row needs ordering
+    top = min(max(ks), len(recipe_ids))
+    candidates = np.argpartition(-scores, top - 1, axis=1)[:, :top]
+    order = np.take_along_axis(scores, candidates, axis=1).argsort(axis=1)[:, ::-1]
+    ranked = np.take_along_axis(candidates, order, axis=1)
+
+    result = {"model": model_name, "num_queries": len(labeled_queries), "corpus_seconds": corpus_seconds}
+    for k in ks:
+        recalls, ndcgs = [], []
+        for q, row in zip(labeled_queries, ranked):
+            ranked_ids = [recipe_ids[i] for i in row]
+            relevant = [str(r) for r in q["relevant"]]
+            gains = {str(r): float(g) for r, g in q.get("gains", {r: 1.0 for r in relevant}).items()}
+            recalls.append(RecallAtK(ranked_ids, relevant, k))
+            ndcgs.append(NdcgAtK(ranked_ids, gains, k))
+        result[f"recall@{k}"] = float(np.mean(recalls))
+        result[f"ndcg@{k}"] = float(np.mean(ndcgs))
+
+    print(f"{model_name}: " + ", ".join(f"{m} {result[m]:.3f}" for m in result if "@" in m))
+    return result
+
+
+def EvaluateModels(model_names, labeled_queries, recipe_ids, sentences, cache_dir, bucket=None, workers=2, ks=None):
+    """
+    Evaluates models in parallel worker processes, at most `workers` at a time.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as f:
+        json.dump({
+            "labeled_queries": labeled_queries,
+            "recipe_ids": [str(r) for r in recipe_ids],
+            "sentences": list(sentences),
+            "cache_dir": cache_dir,
+            "bucket": bucket,
+            "ks": ks or DEFAULT_KS
+        }, f)
+        inputs_path = f.name
+
+    # Split the cores between workers so they don't oversubscribe each other
+    env = dict(os.environ, OMP_NUM_THREADS=str(max(1, (os.cpu_count() or 1) // workers)))
+
+    results = {}
+    running = []
+    queue = list(model_names)
+    try:
+        while queue or running:
+            while queue and len(running) < workers:
+                model_name = queue.pop(0)
+                output_path = os.path.join(cache_dir, f"eval-{model_name.replace('/', '__')}.json")
+                process = subprocess.Popen([
+                    sys.executable, os.path.abspath(__file__),
+                    "--model", model_name,
+                    "--inputs", inputs_path,
+                    "--output", output_path
+                ], env=env)
+                running.append((model_name, process, output_path))
+
+            model_name, process, output_path = running.pop(0)
+            if process.wait() != 0:
+                raise RuntimeError(f"Evaluation of {model_name} failed with exit code {process.returncode}")
+            with open(output_path) as f:
+                results[model_name] = json.load(f)
+    finally:
+        os.remove(inputs_path)
+
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model', type=str, required=True)
+    parser.add_argument('--inputs', type=str, required=True)
+    parser.add_argument('--output', type=str, required=True)
+    args = parser.parse_args()
+
+    with open(args.inputs) as f:
+        inputs = json.load(f)
+
+    evaluation = EvaluateModel(
+        args.model,
+        inputs["labeled_queries"],
+        inputs["recipe_ids"],
+        inputs["sentences"],
+        inputs["cache_dir"],
+        bucket=inputs.get("bucket"),
+        ks=inputs.get("ks")
+    )
+
+    with open(args.output, "w") as f:
+        json.dump(evaluation, f, indent=2)
@@ -0,0 +1,272 @@
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+from urllib.parse import urlparse
+
+import boto3
+import numpy as np
+
+# Sibling modules are shipped to this directory by the pipeline
+sys.path.insert(0, "/opt/ml/processing/input/lib")
+from benchmark import SERVING_THREADS
+
+# HF-container handlers for ONNX artifacts, shipped with the lib dir or next to this file
+SERVING_CODE_DIRS = [
+    "/opt/ml/processing/input/lib/onnx_serving",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "onnx_serving")
+]
+
+
+def ExportOnnx(model_id, output_dir, opset=14):
+    """
+    Exports a HF encoder to ONNX (last_hidden_state output) alongside its fast tokenizer.
+    """
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    os.makedirs(output_dir, exist_ok=True)
+
+    tokenizer = AutoTokenizer.from_pretrained(model_id, use_fast=True)
+    model = AutoModel.from_pretrained(model_id)
+    model.eval()
+
+    # tokenizer.json is all the Lambda needs to tokenize with the `tokenizers` package
+    tokenizer.save_pretrained(output_dir)
+
+    sample = tokenizer(["high protein chicken rice broccoli"], return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+
+    onnx_path = os.path.join(output_dir, "model_fp32.onnx")
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            tuple(sample[name] for name in input_names),
+            onnx_path,
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=opset
+        )
+
+    print(f"Exported {model_id} to {onnx_path}")
+    return onnx_path
+
+
+def QuantizeOnnx(onnx_path, output_path):
+    """
+    Applies dynamic int8 quantization to the weights of an ONNX model.
+    """
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    quantize_dynamic(onnx_path, output_path, weight_type=QuantType.QInt8)
+
+    print(f"Quantized model written to {output_path} "
+          f"({os.path.getsize(onnx_path) / 1e6:.1f} MB -> {os.path.getsize(output_path) / 1e6:.1f} MB)")
+    return output_path
+
+
+# Query-shaped strings used when no validation sentences are supplied
+DEFAULT_VALIDATION_SENTENCES = [
+    "high protein low carbs medium fats Rice Cheese Beans Chicken no Mushrooms allergy peanuts max_time 30 Dinner spice medium",
+    "low protein high carbs Pasta Tomato Basil vegetarian Lunch spice mild",
+    "medium protein low fats Eggs Spinach Breakfast max_time 15",
+    "Chocolate Strawberries Dessert no nuts allergy tree nuts",
+    "high fats keto Salmon Avocado Dinner spice hot",
+    "Tofu Broccoli Soy Sauce vegan max_time 20 Lunch",
+    "Oats Banana Peanut Butter Breakfast spice mild",
+    "Beef Peppers Onions Tortillas Dinner spice very hot max_time 45",
+    "Chickpeas Cucumber Lemon Snack dairy-free",
+    "Shrimp Garlic Butter Lemon Dinner allergy dairy",
+]
+
+
+def _mean_pool(last_hidden_state, attention_mask):
+    # Same representation as the endpoint path: mean over every real token
+    mask = attention_mask[..., None].astype(np.float32)
+    return (last_hidden_state * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1.0, None)
+
+
+def TorchEncoder(model_id):
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(model_id)
+    model = AutoModel.from_pretrained(model_id)
+    model.eval()
+
+    def encode(texts):
+        inputs = tokenizer(list(texts), return_tensors="pt", padding=True, truncation=True, max_length=512)
+        with torch.no_grad():
+            hidden = model(**inputs).last_hidden_state.numpy()
+        return _mean_pool(hidden, inputs["attention_mask"].numpy())
+
+    return encode
+
+
+def OnnxEncoder(model_dir, model_file="model.onnx", num_threads=None):
+    import onnxruntime as ort
+    from tokenizers import Tokenizer
+
+    tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+    tokenizer.enable_truncation(max_length=512)
+    tokenizer.enable_padding()
+    options = ort.SessionOptions()
+    if num_threads:
+        options.intra_op_num_threads = int(num_threads)
+    session = ort.InferenceSession(
+        os.path.join(model_dir, model_file), sess_options=options, providers=["CPUExecutionProvider"]
+    )
+    input_names = {i.name for i in session.get_inputs()}
+
+    def encode(texts):
+        encodings = tokenizer.encode_batch(list(texts))
+        feeds = {
+            "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+            "attention_mask": np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        }
+        if "token_type_ids" in input_names:
+            feeds["token_type_ids"] = np.array([e.type_ids for e in encodings], dtype=np.int64)
+        return _mean_pool(session.run(None, feeds)[0], feeds["attention_mask"])
+
+    return encode
+
+
+def _single_query_latency(encode, sentences, warmup, iterations):
+    for i in range(warmup):
+        encode([sentences[i % len(sentences)]])
+    timings = []
+    for i in range(iterations):
+        start = time.perf_counter()
+        encode([sentences[i % len(sentences)]])
+        timings.append((time.perf_counter() - start) * 1000)
+    return {
+        "p50_ms": float(np.percentile(timings, 50)),
+        "p95_ms": float(np.percentile(timings, 95)),
+        "p99_ms": float(np.percentile(timings, 99))
+    }
+
+
+def CompareEncoders(reference, candidate, sentences, warmup=5, iterations=100):
+    """
+    Embedding fidelity (cosine agreement) and single-query latency of candidate vs reference.
+    """
+    ref = reference(sentences)
+    cand = candidate(sentences)
+    ref /= np.linalg.norm(ref, axis=1, keepdims=True)
+    cand /= np.linalg.norm(cand, axis=1, keepdims=True)
+    cosines = (ref * cand).sum(axis=1)
+
+    return {
+        "cosine_mean": float(cosines.mean()),
+        "cosine_min": float(cosines.min()),
+        "reference_latency": _single_query_latency(reference, sentences, warmup, iterations),
+        "optimized_latency": _single_query_latency(candidate, sentences, warmup, iterations)
+    }
+
+
+def OptimizeModel(model_id, output_dir, sentences=None, max_p95_ms=15.0, min_cosine=0.99):
+    """
+    Exports, quantizes and validates model_id; promotes the artifact only if it passes both gates.
+
+    Writes output_dir/optimized_model.json and, when promoted, the servable
+    artifact (ONNX model, tokenizer and HF-container handlers) to output_dir/artifact.
+    """
+    sentences = sentences or DEFAULT_VALIDATION_SENTENCES
+    artifact_dir = os.path.join(output_dir, "artifact")
+
+    fp32_path = ExportOnnx(model_id, artifact_dir)
+    QuantizeOnnx(fp32_path, os.path.join(artifact_dir, "model.onnx"))
+
+    # Serving runs on ml.m5.large, so compare both runtimes at its thread count
+    import torch
+    torch.set_num_threads(SERVING_THREADS)
+    report = CompareEncoders(
+        TorchEncoder(model_id), OnnxEncoder(artifact_dir, num_threads=SERVING_THREADS), sentences
+    )
+    os.remove(fp32_path)
+
+    latency_ok = report["optimized_latency"]["p95_ms"] <= max_p95_ms
+    fidelity_ok = report["cosine_min"] >= min_cosine
+    promoted = latency_ok and fidelity_ok
+
+    print(f"Optimized p95 {report['optimized_latency']['p95_ms']:.1f} ms "
+          f"(fp32 {report['reference_latency']['p95_ms']:.1f} ms, gate {max_p95_ms} ms), "
+          f"min cosine {report['cosine_min']:.4f} (gate {min_cosine})")
+
+    if promoted:
+        # Custom handlers so the HF inference container serves the ONNX model
+        serving_code = next(d for d in SERVING_CODE_DIRS if os.path.isdir(d))
+        shutil.copytree(serving_code, os.path.join(artifact_dir, "code"), dirs_exist_ok=True)
+        print("Optimized model promoted")
+    else:
+        shutil.rmtree(artifact_dir)
+        print("Optimized model did not pass the gates; the fp32 checkpoint will be registered")
+
+    result = {
+        "best_model": model_id,
+        "promoted": promoted,
+        "quantization": "dynamic-int8",
+        "thresholds": {"max_p95_ms": max_p95_ms, "min_cosine": min_cosine},
+        **report
+    }
+    with open(os.path.join(output_dir, "optimized_model.json"), "w") as f:
+        json.dump(result, f, indent=2)
+    return result
+
+
+def UploadEncoder(model_dir, s3_uri):
+    """
+    Uploads model.onnx and tokenizer.json to the S3 prefix the get_recipes Lambda reads from.
+    """
+    parsed = urlparse(s3_uri)
+    bucket = parsed.netloc
+    prefix = parsed.path.strip("/")
+
+    s3 = boto3.client("s3")
+    for fname in ("model.onnx", "tokenizer.json"):
+        key = f"{prefix}/{fname}" if prefix else fname
+        s3.upload_file(os.path.join(model_dir, fname), bucket, key)
+        print(f"Uploaded s3://{bucket}/{key}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--install-dependencies', action='store_true')
+    parser.add_argument('--requirements-file', type=str, default='requirements.txt')
+    parser.add_argument('--model-id', type=str, default='sentence-transformers/all-MiniLM-L6-v2')
+    parser.add_argument('--best-model-file', type=str, default=None, help='best_model.json from ModelSelection; overrides --model-id')
+    parser.add_argument('--output-dir', type=str, default='onnx-encoder')
+    parser.add_argument('--sentences-file', type=str, default=None)
+    parser.add_argument('--max-p95-ms', type=float, default=15.0)
+    parser.add_argument('--min-cosine', type=float, default=0.99)
+    parser.add_argument('--s3-uri', type=str, default=None, help='Also publish the promoted encoder for the get_recipes Lambda')
+    args = parser.parse_args()
+
+    if args.install_dependencies:
+        print("Installing dependencies...")
+        subprocess.check_call([sys.executable, "-m", "pip", "install", "-r", args.requirements_file])
+        print("Dependencies installed successfully.")
+
+    model_id = args.model_id
+    if args.best_model_file:
+        with open(args.best_model_file) as f:
+            model_id = json.load(f)['best_model']
+    print(f"Optimizing model: {model_id}")
+
+    validation_sentences = None
+    if args.sentences_file:
+        with open(args.sentences_file) as f:
+            validation_sentences = [line.strip() for line in f if line.strip()]
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    result = OptimizeModel(model_id, args.output_dir, validation_sentences, args.max_p95_ms, args.min_cosine)
+
+    if args.s3_uri and result["promoted"]:
+        UploadEncoder(os.path.join(args.output_dir, "artifact"), args.s3_uri)
+    sys.stdout.flush()
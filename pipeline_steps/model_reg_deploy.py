@@ -1,15 +1,17 @@
 import json
-import boto3
-import shutil
-import tarfile
 import os
-from urllib.parse import urlparse
 import subprocess
 import sys
+import argparse
+
+# Sibling modules are shipped to this directory by the pipeline
+sys.path.insert(0, "/opt/ml/processing/input/lib")
+from artifact_cache import CachedModelArtifact, S3ArtifactStore
+from endpoint_pointer import PublishEndpointName
+
 
 # create model
-def RegisterModel(best_model, group_name):
-    from transformers import AutoModel, AutoTokenizer
+def RegisterModel(best_model, group_name, optimized_dir=None):
     import sagemaker
     from sagemaker.model import Model, ModelPackage
     from sagemaker import image_uris
@@ -19,29 +21,12 @@ def RegisterModel(best_model, group_name):
     except:
         model_name = best_model
 
-    ### Download Model
-    model_uri = f"s3://cs401r-mlops-final/model_artifacts/models/{model_name}.tar.gz"
-    parsed = urlparse(model_uri)
-    bucket = parsed.netloc
-    key = parsed.path.lstrip("/")
-
-    model_id = best_model
-    model_dir = f"{model_name}"
-    tar_path = f"{model_name}.tar.gz"
-
-    # Download model and tokenizer
-    AutoModel.from_pretrained(model_id).save_pretrained(model_dir)
-    AutoTokenizer.from_pretrained(model_id).save_pretrained(model_dir)
+    ### Package Model
+    # Content-addressed: an unchanged checkpoint reuses the artifact already in S3
+    store = S3ArtifactStore("cs401r-mlops-final", "model_artifacts")
+    model_uri = CachedModelArtifact(store, best_model, optimized_dir)
 
-    if not os.path.exists(tar_path):
-        with tarfile.open(tar_path, "w:gz") as tar:
-            tar.add(model_dir, arcname=".")
-
-    # Upload to S3
-    s3 = boto3.client("s3")
-    s3.upload_file(tar_path, bucket, key)
-
-    print("Model Downloaded")
+    print(f"Model artifact: {model_uri}")
 
     session = sagemaker.Session()
     region = session.boto_region_name
@@ -101,9 +86,8 @@ def RegisterModel(best_model, group_name):
 
     print("Model Deployed")
 
-    shutil.rmtree(model_dir)
-    os.remove("all-MiniLM-L6-v2.tar.gz")
-    print('Temp Model Artifacts Deleted')
+    PublishEndpointName(group_name, endpoint_name, model_package_arn)
+
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
@@ -125,5 +109,15 @@ if __name__ == "__main__":
     
     print(f"Best model selected: {best_model}")
 
+    # Use the ONNX/int8 artifact only if it passed ModelOptimization's latency and fidelity gates
+    optimized_dir = None
+    optimized_path = "/opt/ml/processing/input/optimized/optimized_model.json"
+    if os.path.exists(optimized_path):
+        with open(optimized_path, 'r') as f:
+            optimization = json.load(f)
+        if optimization.get('promoted') and optimization.get('best_model') == best_model:
+            optimized_dir = "/opt/ml/processing/input/optimized/artifact"
+        print(f"Optimized artifact promoted: {optimized_dir is not None}")
+
     # Call your function
-    RegisterModel(best_model, args.model_group_name)
\ No newline at end of file
+    RegisterModel(best_model, args.model_group_name, optimized_dir)
\ No newline at end of file
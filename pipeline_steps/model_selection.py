@@ -1,15 +1,21 @@
+import argparse
 import json
 import sys
 import pandas as pd
-from sentence_transformers import SentenceTransformer, util
-import time
 import boto3
 import os
 import subprocess
 
+# Sibling modules are shipped to this directory by the pipeline
+sys.path.insert(0, "/opt/ml/processing/input/lib")
+from benchmark import SERVING_THREADS, RunIsolatedBenchmark
+from evaluation import EvaluateModels, KnownItemQueries, LoadLabeledQueries
+
+QUALITY_METRIC = "ndcg@10"
+
 subprocess.check_call([sys.executable, "-m", "pip", "install", "sentence-transformers"])
 
-def SelectModel(num_test=None):
+def SelectModel(num_test=None, output_dir="/opt/ml/processing/output", workers=2):
 
     # get recipe data
     uri = "s3://cs401r-mlops-final/preprocessed-data/preprocessed_data.csv"
@@ -18,6 +24,7 @@ def SelectModel(num_test=None):
     # get test json
     bucket = "cs401r-mlops-final"
     json_key = "raw-data/test_request.txt"
+    eval_key = "raw-data/eval_queries.json"
 
     s3 = boto3.client("s3")
 
@@ -37,37 +44,42 @@ def SelectModel(num_test=None):
     query = str(dict_request.get('request'))
 
     if num_test is not None:
-        candidate_sentences = full_data['EmbeddingSentence'].loc[:num_test]
+        candidates = full_data.loc[:num_test]
     else:
-        candidate_sentences = full_data['EmbeddingSentence']
+        candidates = full_data
+    recipe_ids = candidates['RecipeId'].astype(str).tolist()
+    candidate_sentences = candidates['EmbeddingSentence'].astype(str).tolist()
+
+    # Labeled queries if we have them, otherwise known-item queries built from recipe names
+    labeled_queries = LoadLabeledQueries(bucket, eval_key)
+    if labeled_queries is None:
+        print(f"No labeled query set at s3://{bucket}/{eval_key}, using known-item queries")
+        labeled_queries = KnownItemQueries(recipe_ids, candidates['Name'].tolist())
+
+    # Retrieval quality, with corpus embeddings cached per model and corpus hash
+    evaluations = EvaluateModels(
+        models_to_test, labeled_queries, recipe_ids, candidate_sentences,
+        cache_dir="/opt/ml/processing/embedding-cache", bucket=bucket, workers=workers
+    )
 
-    matches = []
-    scores = []
-    times = []
+    latencies = []
+    qualities = []
 
     # getting best model
     for model_name in models_to_test:
         print(f"Testing model: {model_name}")
-        model = SentenceTransformer(model_name)
-        start = time.time()
 
-        query_embedding = model.encode(query, convert_to_tensor=True)
-        candidate_embeddings = model.encode(candidate_sentences, convert_to_tensor=True)
-        cosine_scores = util.cos_sim(query_embedding, candidate_embeddings)[0]
+        # Serving latency comes from a warmed-up benchmark in a fresh process
+        report = RunIsolatedBenchmark(model_name, [query], candidate_sentences, os.path.join(output_dir, "benchmarks"))
+        latencies.append(report["single_query"][str(SERVING_THREADS)]["p95_ms"])
+        qualities.append(evaluations[model_name][QUALITY_METRIC])
 
-        best_idx = cosine_scores.argmax().item()
-        best_score = cosine_scores[best_idx].item()
-        best_match = full_data[['RecipeId', 'Name']].loc[best_idx].to_dict()
-
-        end = time.time()
-
-        matches.append(best_match)
-        scores.append(best_score)
-        times.append((end - start) * 1000)
-        # print(f"Best Match: {best_match.get("Name")}, Score: {best_score}")
+    os.makedirs(output_dir, exist_ok=True)
+    with open(os.path.join(output_dir, "evaluation.json"), "w") as f:
+        json.dump(evaluations, f, indent=2)
 
-    times_proportional = [1 - t / max(times) for t in times]
-    scores_proportional = [1 - t / max(scores) for t in scores]
+    times_proportional = [1 - t / max(latencies) for t in latencies]
+    scores_proportional = [q / max(qualities) if max(qualities) > 0 else 0.0 for q in qualities]
     total_score = [x + y for x, y in zip(times_proportional, scores_proportional)]
 
     model_idx = total_score.index(max(total_score))
@@ -82,6 +94,7 @@ if __name__ == "__main__":
     parser.add_argument('--install-dependencies', action='store_true')
     parser.add_argument('--requirements-file', type=str, default='requirements.txt')
     parser.add_argument('--num-test', type=int, default=1000)
+    parser.add_argument('--eval-workers', type=int, default=2)
     args = parser.parse_args()
 
     if args.install_dependencies:
@@ -89,7 +102,7 @@ if __name__ == "__main__":
         subprocess.check_call([sys.executable, "-m", "pip", "install", "-r", args.requirements_file])
         print("Dependencies installed successfully.")
 
-    best_model = SelectModel(num_test=args.num_test)
+    best_model = SelectModel(num_test=args.num_test, workers=args.eval_workers)
 
     # Save best model name to file
     output_dir = "/opt/ml/processing/output"
@@ -0,0 +1,117 @@
+import argparse
+import io
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import boto3
+import numpy as np
+
+DEFAULT_K = 50
+ROW_BLOCK = 1024
+COLUMN_BLOCK = 8192
+
+
+def _normalize(embeddings):
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    return embeddings / np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+
+
+def _TopKBlock(embeddings, start, stop, k, column_block):
+    """
+    Top-k cosine neighbours of rows [start, stop), excluding each row itself.
+
+    Columns are scored a block at a time and merged into a running top-k, so
+    memory is O(rows * (k + column_block)) regardless of catalog size.
+    """
+    rows = embeddings[start:stop]
+    num_rows = len(rows)
+    row_ids = np.arange(start, stop)
+    best_scores = np.full((num_rows, k), -np.inf, dtype=np.float32)
+    best_ids = np.full((num_rows, k), -1, dtype=np.int32)
+
+    for column_start in range(0, len(embeddings), column_block):
+        column_stop = min(column_start + column_block, len(embeddings))
+        scores = rows @ embeddings[column_start:column_stop].T
+
+        # A recipe is not its own neighbour
+        own = (row_ids >= column_start) & (row_ids < column_stop)
+        scores[own.nonzero()[0], row_ids[own] - column_start] = -np.inf
+
+        candidate_scores = np.concatenate([best_scores, scores], axis=1)
+        candidate_ids = np.concatenate([
+            best_ids,
+            np.broadcast_to(np.arange(column_start, column_stop, dtype=np.int32), scores.shape)
+        ], axis=1)
+        top = np.argpartition(-candidate_scores, k - 1, axis=1)[:, :k]
+        best_scores = np.take_along_axis(candidate_scores, top, axis=1)
+        best_ids = np.take_along_axis(candidate_ids, top, axis=1)
+
+    order = np.argsort(-best_scores, axis=1)
+    return np.take_along_axis(best_ids, order, axis=1), np.take_along_axis(best_scores, order, axis=1)
+
+
+def BuildNeighbourTable(embeddings, k=DEFAULT_K, row_block=ROW_BLOCK, column_block=COLUMN_BLOCK, workers=None):
+    """
+    Top-k cosine neighbours of every catalog row with blocked matrix multiplication.
+
+    Row blocks run concurrently (numpy releases the GIL in matmul and
+    argpartition). Returns (neighbours, scores): int32 row indices and
+    float32 cosine scores, both (num_recipes, k), best first.
+    """
+    embeddings = _normalize(embeddings)
+    k = min(k, len(embeddings) - 1)
+    workers = workers or os.cpu_count() or 1
+
+    neighbours = np.empty((len(embeddings), k), dtype=np.int32)
+    scores = np.empty((len(embeddings), k), dtype=np.float32)
+    blocks = [(start, min(start + row_block, len(embeddings))) for start in range(0, len(embeddings), row_block)]
+
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = pool.map(lambda block: _TopKBlock(embeddings, block[0], block[1], k, column_block), blocks)
+        for (start, stop), (block_ids, block_scores) in zip(blocks, results):
+            neighbours[start:stop] = block_ids
+            scores[start:stop] = block_scores
+
+    print(f"Neighbour table for {len(embeddings)} recipes (k={k}) in {time.perf_counter() - start_time:.1f} s")
+    return neighbours, scores
+
+
+def _put_array(s3, bucket, key, array):
+    buffer = io.BytesIO()
+    np.save(buffer, array)
+    s3.put_object(Bucket=bucket, Key=key, Body=buffer.getvalue())
+
+
+def _get_array(s3, bucket, key):
+    return np.load(io.BytesIO(s3.get_object(Bucket=bucket, Key=key)['Body'].read()))
+
+
+def PublishNeighbourTable(catalog_uri, neighbours, scores):
+    """
+    Writes neighbours.npy and neighbour_scores.npy next to a catalog version's recipes.json.
+    """
+    parsed = urlparse(catalog_uri)
+    bucket, prefix = parsed.netloc, parsed.path.strip("/")
+    s3 = boto3.client("s3")
+    _put_array(s3, bucket, f"{prefix}/neighbours.npy", neighbours)
+    _put_array(s3, bucket, f"{prefix}/neighbour_scores.npy", scores)
+    print(f"Published neighbour table to {catalog_uri}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--catalog-uri', type=str, required=True, help='s3:// prefix of a catalog version (embeddings.npy)')
+    parser.add_argument('--k', type=int, default=DEFAULT_K)
+    parser.add_argument('--row-block', type=int, default=ROW_BLOCK)
+    parser.add_argument('--column-block', type=int, default=COLUMN_BLOCK)
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    parsed = urlparse(args.catalog_uri)
+    catalog_embeddings = _get_array(boto3.client("s3"), parsed.netloc, f"{parsed.path.strip('/')}/embeddings.npy")
+
+    table, table_scores = BuildNeighbourTable(catalog_embeddings, args.k, args.row_block, args.column_block, args.workers)
+    PublishNeighbourTable(args.catalog_uri, table, table_scores)
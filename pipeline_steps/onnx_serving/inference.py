@@ -0,0 +1,37 @@
+import os
+
+import numpy as np
+import onnxruntime as ort
+from tokenizers import Tokenizer
+
+# Custom handlers for the HF inference container, so an ONNX artifact answers
+# exactly like the feature-extraction pipeline: per-token embeddings of the
+# last hidden state, with a leading batch axis for a single input string.
+
+
+def model_fn(model_dir):
+    tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+    tokenizer.enable_truncation(max_length=512)
+    session = ort.InferenceSession(os.path.join(model_dir, "model.onnx"), providers=["CPUExecutionProvider"])
+    return tokenizer, session
+
+
+def predict_fn(data, model):
+    tokenizer, session = model
+    input_names = {i.name for i in session.get_inputs()}
+
+    inputs = data.pop("inputs", data)
+    texts = [inputs] if isinstance(inputs, str) else list(inputs)
+
+    outputs = []
+    for text in texts:
+        encoding = tokenizer.encode(text)
+        feeds = {
+            "input_ids": np.array([encoding.ids], dtype=np.int64),
+            "attention_mask": np.array([encoding.attention_mask], dtype=np.int64)
+        }
+        if "token_type_ids" in input_names:
+            feeds["token_type_ids"] = np.array([encoding.type_ids], dtype=np.int64)
+        outputs.append(session.run(None, feeds)[0].tolist())
+
+    return outputs[0] if isinstance(inputs, str) else outputs
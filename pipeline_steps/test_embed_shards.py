@@ -0,0 +1,154 @@
+import importlib.util
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("boto3")
+pytest.importorskip("isodate")
+
+from embed_shards import (
+    EmbedShards,
+    LoadManifest,
+    LoadShardFrame,
+    MergeShardEmbeddings,
+    STUB_DIM,
+    RunLocal,
+    ShardEmbeddingsUri,
+    _StubEncode
+)
+
+ROWS = 103
+
+
+def preprocessing_lambda():
+    # Loaded under its own name: get_recipes has a lambda_function module too
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lambda", "data_preprocessing", "lambda_function.py")
+    spec = importlib.util.spec_from_file_location("data_preprocessing_lambda", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def write_local_shards(directory, df, num_shards):
+    """
+    What write_shards puts in S3, in a local directory; returns the manifest path
+    """
+    shards = preprocessing_lambda().build_shards(df, num_shards)
+    for entry, body in shards:
+        (directory / entry["file"]).write_bytes(body)
+    manifest_path = directory / "manifest.json"
+    manifest_path.write_text(json.dumps({
+        "rows": sum(entry["row_count"] for entry, _ in shards),
+        "shards": [entry for entry, _ in shards]
+    }))
+    return str(manifest_path)
+
+
+def recipes(rows=ROWS):
+    return pd.DataFrame({
+        "RecipeId": np.arange(rows),
+        "EmbeddingSentence": [f"recipe {i} with rice and beans" for i in range(rows)]
+    })
+
+
+@pytest.fixture
+def sharded(tmp_path):
+    shard_dir = tmp_path / "shards"
+    shard_dir.mkdir()
+    return write_local_shards(shard_dir, recipes(), num_shards=4), str(tmp_path / "embeddings")
+
+
+def output_mtimes(manifest_uri, output_uri):
+    return {
+        shard["shard_id"]: os.path.getmtime(ShardEmbeddingsUri(output_uri, "stub", shard))
+        for shard in LoadManifest(manifest_uri)["shards"]
+    }
+
+
+def test_split_then_merge_keeps_row_order(sharded):
+    manifest_uri, output_uri = sharded
+    manifest = LoadManifest(manifest_uri)
+    assert manifest["rows"] == ROWS
+    assert [shard["row_start"] for shard in manifest["shards"]] == [0, 25, 51, 77]
+
+    RunLocal(manifest_uri, "stub", output_uri, processes=2)
+    merged = MergeShardEmbeddings(manifest_uri, "stub", output_uri)
+
+    frame = LoadShardFrame(manifest_uri)
+    assert frame["RecipeId"].tolist() == list(range(ROWS))
+    np.testing.assert_array_equal(merged, _StubEncode(recipes()["EmbeddingSentence"].tolist()))
+
+    # A prefix of the rows lines up the same way
+    np.testing.assert_array_equal(MergeShardEmbeddings(manifest_uri, "stub", output_uri, max_rows=60), merged[:60])
+    assert len(LoadShardFrame(manifest_uri, max_rows=60)) == 60
+
+
+def test_rerun_skips_finished_shards(sharded):
+    manifest_uri, output_uri = sharded
+    shards = LoadManifest(manifest_uri)["shards"]
+    assert EmbedShards(manifest_uri, shards[:2], "stub", output_uri) == 2
+    first = MergeShardEmbeddings(manifest_uri, "stub", output_uri, max_rows=shards[2]["row_start"])
+
+    # The second worker only embeds what the first one left
+    assert EmbedShards(manifest_uri, shards, "stub", output_uri) == 2
+    mtimes = output_mtimes(manifest_uri, output_uri)
+    assert EmbedShards(manifest_uri, shards, "stub", output_uri) == 0
+    assert output_mtimes(manifest_uri, output_uri) == mtimes
+
+    np.testing.assert_array_equal(MergeShardEmbeddings(manifest_uri, "stub", output_uri)[:len(first)], first)
+
+
+def test_merge_refuses_missing_shards(sharded):
+    manifest_uri, output_uri = sharded
+    EmbedShards(manifest_uri, LoadManifest(manifest_uri)["shards"][1:], "stub", output_uri)
+
+    with pytest.raises(ValueError, match=r"Shards \[0\]"):
+        MergeShardEmbeddings(manifest_uri, "stub", output_uri)
+
+
+def test_changed_rows_are_embedded_again(tmp_path):
+    output_uri = str(tmp_path / "embeddings")
+    old_dir, new_dir = tmp_path / "old", tmp_path / "new"
+    old_dir.mkdir()
+    new_dir.mkdir()
+    old_manifest = write_local_shards(old_dir, recipes(), num_shards=4)
+    EmbedShards(old_manifest, LoadManifest(old_manifest)["shards"], "stub", output_uri)
+
+    changed = recipes()
+    changed.loc[90, "EmbeddingSentence"] = "recipe 90 with tofu"
+    new_manifest = write_local_shards(new_dir, changed, num_shards=4)
+
+    # Only the last shard's content, and so its hash, changed
+    assert EmbedShards(new_manifest, LoadManifest(new_manifest)["shards"], "stub", output_uri) == 1
+    np.testing.assert_array_equal(
+        MergeShardEmbeddings(new_manifest, "stub", output_uri), _StubEncode(changed["EmbeddingSentence"].tolist())
+    )
+
+
+def test_more_shards_than_rows(tmp_path):
+    shard_dir = tmp_path / "shards"
+    shard_dir.mkdir()
+    manifest_uri = write_local_shards(shard_dir, recipes(rows=3), num_shards=8)
+    output_uri = str(tmp_path / "embeddings")
+
+    shards = LoadManifest(manifest_uri)["shards"]
+    assert [shard["row_count"] for shard in shards] == [1, 1, 1]
+    assert EmbedShards(manifest_uri, shards, "stub", output_uri) == 3
+    np.testing.assert_array_equal(
+        MergeShardEmbeddings(manifest_uri, "stub", output_uri), _StubEncode(recipes(rows=3)["EmbeddingSentence"].tolist())
+    )
+
+
+def test_empty_shard_embeds_to_no_rows(tmp_path):
+    shard_dir = tmp_path / "shards"
+    shard_dir.mkdir()
+    manifest_uri = write_local_shards(shard_dir, recipes(rows=0), num_shards=4)
+    output_uri = str(tmp_path / "embeddings")
+
+    shards = LoadManifest(manifest_uri)["shards"]
+    assert [shard["row_count"] for shard in shards] == [0]
+    assert EmbedShards(manifest_uri, shards, "stub", output_uri) == 1
+    assert MergeShardEmbeddings(manifest_uri, "stub", output_uri).shape == (0, STUB_DIM)